@@ -0,0 +1,210 @@
+# app/activity_log_buffer.py
+"""
+Write-behind buffer for ActivityLog rows.
+
+log_activity() used to add and commit one row on the request path, which
+cost a commit (and fsync) on nearly every page view. Rows are now queued
+in-process and a background thread writes them in batches with one
+multi-row INSERT, whenever ACTIVITY_LOG_BATCH_SIZE rows are waiting or
+ACTIVITY_LOG_FLUSH_INTERVAL seconds have passed.
+
+The queue is bounded (ACTIVITY_LOG_QUEUE_SIZE). When it is full, callers
+wait up to ACTIVITY_LOG_ENQUEUE_TIMEOUT seconds for room (backpressure);
+after that the event is dropped and counted. Whatever is still queued is
+flushed on application shutdown.
+
+Rows show up in activity_logs within one flush interval. Set
+ACTIVITY_LOG_BUFFERED=false to go back to synchronous writes.
+"""
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+
+_STOP = object()
+
+
+class ActivityLogBuffer:
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float, enqueue_timeout: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {
+            "enqueued": 0,
+            "flushed": 0,
+            "dropped": 0,
+            "failed": 0,
+            "batches": 0,
+            "backpressure_waits": 0
+        }
+        self._last_flush_at: Optional[str] = None
+        self._last_flush_ms = 0.0
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="activity-log-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """Queue one activity row; returns False if it had to be dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count("backpressure_waits")
+            try:
+                self._queue.put(row, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self._count("dropped")
+                return False
+        self._count("enqueued")
+        return True
+
+    def _run(self):
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        from app.database import SessionLocal
+        from app.auth_models import ActivityLog
+
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            # executemany of a Core insert is sent as multi-row INSERT ... VALUES batches
+            db.execute(insert(ActivityLog), batch)
+            db.commit()
+            self._count("flushed", len(batch))
+            self._count("batches")
+        except IntegrityError as e:
+            # One bad row (e.g. a contract_id deleted meanwhile) must not drop the others
+            db.rollback()
+            print(f"⚠️ Activity log batch of {len(batch)} rejected ({e.orig}), retrying row by row")
+            self._write_rows(db, ActivityLog, batch)
+            self._count("batches")
+        except Exception as e:
+            db.rollback()
+            self._count("failed", len(batch))
+            print(f"⚠️ Failed to write {len(batch)} activity log rows: {e}")
+        finally:
+            db.close()
+        with self._lock:
+            self._last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            self._last_flush_at = datetime.utcnow().isoformat()
+
+    def _write_rows(self, db, model, batch: List[Dict[str, Any]]):
+        """Insert rows one savepoint each, so only the rows that violate a constraint are lost"""
+        written = 0
+        for row in batch:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(model), [row])
+                written += 1
+            except Exception as e:
+                self._count("failed")
+                print(f"⚠️ Dropped activity log row ({row.get('activity_type')}, user {row.get('user_id')}): {e}")
+        db.commit()
+        self._count("flushed", written)
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything queued and stop the writer (application shutdown)"""
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        print(f"✓ Activity log buffer flushed ({self.stats()['flushed']} rows written)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "buffered": settings.ACTIVITY_LOG_BUFFERED,
+                "queued": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "batch_size": self.batch_size,
+                "flush_interval_seconds": self.flush_interval,
+                "writer_running": self._thread is not None and self._thread.is_alive(),
+                "last_flush_at": self._last_flush_at,
+                "last_flush_ms": self._last_flush_ms,
+                **self._counters
+            }
+
+
+activity_log_buffer = ActivityLogBuffer(
+    max_size=settings.ACTIVITY_LOG_QUEUE_SIZE,
+    batch_size=settings.ACTIVITY_LOG_BATCH_SIZE,
+    flush_interval=settings.ACTIVITY_LOG_FLUSH_INTERVAL,
+    enqueue_timeout=settings.ACTIVITY_LOG_ENQUEUE_TIMEOUT
+)
+
+
+def record_activity(
+    db,
+    user_id: int,
+    activity_type: str,
+    contract_id: Optional[int] = None,
+    details: Optional[dict] = None,
+    request=None
+):
+    """Shared implementation behind both log_activity helpers"""
+    from app.auth_models import ActivityLog
+
+    row = {
+        "user_id": user_id,
+        "activity_type": activity_type,
+        "contract_id": contract_id,
+        "details": details or {},
+        "ip_address": request.client.host if request and request.client else None,
+        "user_agent": request.headers.get("user-agent") if request else None,
+        # Stamp at event time, not at flush time, so ordering is preserved
+        "created_at": datetime.now(timezone.utc)
+    }
+
+    if not settings.ACTIVITY_LOG_BUFFERED:
+        activity = ActivityLog(**row)
+        db.add(activity)
+        db.commit()
+        return activity
+
+    activity_log_buffer.enqueue(row)
+
+    # log_activity used to commit the caller's session; keep that for callers
+    # that still have pending changes, but skip the commit on read-only paths
+    if db.new or db.dirty or db.deleted:
+        db.commit()
+    return ActivityLog(**row)
@@ -10,6 +10,7 @@ from app.database import get_db
 from app.auth_models import User
 from app.auth_utils import get_current_user, log_activity
 from app.models import Contract
+from app.assignments import get_assignment_resolver
 from app.schemas import (
     UpdateDraftRequest, 
     PublishAgreementRequest,
@@ -96,24 +97,25 @@ async def get_draft_details(
     assigned_pm_users = []
     assigned_pgm_users = []
     assigned_director_users = []
+    assignments = get_assignment_resolver(db).resolve(contract)
     
-    if contract.assigned_pm_users:
+    if assignments.pm:
         pm_users = db.query(AuthUser).filter(
-            AuthUser.id.in_(contract.assigned_pm_users),
+            AuthUser.id.in_(assignments.pm),
             AuthUser.role == "project_manager"
         ).all()
         assigned_pm_users = [{"id": u.id, "name": u.full_name or u.username} for u in pm_users]
     
-    if contract.assigned_pgm_users:
+    if assignments.pgm:
         pgm_users = db.query(AuthUser).filter(
-            AuthUser.id.in_(contract.assigned_pgm_users),
+            AuthUser.id.in_(assignments.pgm),
             AuthUser.role == "program_manager"
         ).all()
         assigned_pgm_users = [{"id": u.id, "name": u.full_name or u.username} for u in pgm_users]
     
-    if contract.assigned_director_users:
+    if assignments.director:
         director_users = db.query(AuthUser).filter(
-            AuthUser.id.in_(contract.assigned_director_users),
+            AuthUser.id.in_(assignments.director),
             AuthUser.role == "director"
         ).all()
         assigned_director_users = [{"id": u.id, "name": u.full_name or u.username} for u in director_users]
@@ -270,9 +272,10 @@ async def update_draft_agreement(
             notification_messages = []
             
             # Get current assignments for comparison
-            current_pm_users = set(contract.assigned_pm_users or [])
-            current_pgm_users = set(contract.assigned_pgm_users or [])
-            current_director_users = set(contract.assigned_director_users or [])
+            current_assignments = get_assignment_resolver(db).resolve(contract)
+            current_pm_users = set(current_assignments.pm)
+            current_pgm_users = set(current_assignments.pgm)
+            current_director_users = set(current_assignments.director)
             
             # PM Users
             if update_data.assigned_users.pm_users:
@@ -766,25 +769,7 @@ async def publish_agreement(
             from app.auth_models import User as AuthUser
             
             # Notify all assigned users (PMs, PGMs, Directors) about direct publishing
-            all_assigned_users = []
-            
-            # Get assigned PM users
-            if contract.assigned_pm_users:
-                if isinstance(contract.assigned_pm_users, list):
-                    all_assigned_users.extend(contract.assigned_pm_users)
-            
-            # Get assigned PGM users
-            if contract.assigned_pgm_users:
-                if isinstance(contract.assigned_pgm_users, list):
-                    all_assigned_users.extend(contract.assigned_pgm_users)
-            
-            # Get assigned Director users
-            if contract.assigned_director_users:
-                if isinstance(contract.assigned_director_users, list):
-                    all_assigned_users.extend(contract.assigned_director_users)
-            
-            # Remove duplicates
-            all_assigned_users = list(set(all_assigned_users))
+            all_assigned_users = sorted(get_assignment_resolver(db).resolve(contract).all)
             
             # Send notifications to all assigned users
             if all_assigned_users:
@@ -1,4 +1,3 @@
-import openai
 import json
 import re
 import hashlib
@@ -7,8 +6,47 @@ from app.config import settings
 import os
 from datetime import datetime
 import sys
-import pickle
-from pathlib import Path
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.extraction_cache import extraction_cache, make_cache_key
+from app.llm_gateway import llm_gateway
+from app.text_sections import Chunk, chunk_sections
+
+# Values the model uses for "nothing found"; a later chunk may fill these in
+PLACEHOLDER_VALUES = {"", "not specified", "not found", "n/a", "none", "unknown", "string", "number", "array of strings"}
+
+# Identity fields used to de-duplicate list items when merging chunk results
+MERGE_LIST_KEYS = {
+    ("deliverables", "items"): ("deliverable_name",),
+    ("financial_details", "payment_schedule", "installments"): ("amount", "due_date"),
+    ("financial_details", "payment_schedule", "milestones"): ("milestone_name",),
+}
+
+
+def _normalize_merge_key(value: Any) -> Any:
+    if isinstance(value, str):
+        return re.sub(r'\s+', ' ', value.strip().lower())
+    if isinstance(value, (list, dict)):
+        # Unhashable (the model sometimes returns a list or object for a key field)
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+def previous_chunk_layout(previous: Optional[Dict[str, Any]]) -> List[List[str]]:
+    """section_hashes of every chunk of an earlier extraction (metadata.extraction_run.chunks)"""
+    run = ((previous or {}).get("metadata") or {}).get("extraction_run") or {}
+    return [chunk["section_hashes"] for chunk in run.get("chunks") or [] if chunk.get("section_hashes")]
+
+
+def _is_meaningful(value: Any) -> bool:
+    """False for empty values and the model's "Not specified" style placeholders"""
+    if value is None or value is False or value == 0:
+        return False
+    if isinstance(value, str):
+        return value.strip().lower() not in PLACEHOLDER_VALUES
+    if isinstance(value, (dict, list)):
+        return len(value) > 0
+    return True
 
 class AIExtractor:
     def __init__(self):
@@ -19,9 +57,7 @@ class AIExtractor:
         # Initialize client
         self.client = self._create_openai_client()
         
-        # Cache directory for deterministic extraction
-        self.cache_dir = Path("./.extraction_cache")
-        self.cache_dir.mkdir(exist_ok=True)
+        self.model = settings.EXTRACTION_MODEL
         
         # Define the comprehensive but optimized prompt with STRONG EMPHASIS on deliverables
         self.extraction_prompt = """ANALYZE THIS GRANT CONTRACT AND EXTRACT ALL INFORMATION.
@@ -103,8 +139,31 @@ TABLES ARE CRITICAL:
 Return ONLY valid JSON matching this exact structure:
 {json_structure}
 
-Contract text (first 12000 characters):
+Contract text (at most """ + str(settings.EXTRACTION_CHUNK_CHARS) + """ characters):
 {text}"""
+        
+        self.system_prompt = """You are a contract analysis expert with special focus on deliverables and reporting requirements.
+        Your PRIMARY TASK is to extract ALL deliverables from grant contracts.
+        NEVER return empty deliverables array. If deliverables aren't explicitly listed, extract them from scope of work or project description.
+        Create at least 2 logical deliverables based on contract purpose if none are found.
+        Be extremely thorough with deliverables extraction.
+        For other fields: Extract dates, amounts, names, clauses, tables, schedules.
+        If information is missing, use "Not specified".
+        Convert dates to YYYY-MM-DD format.
+        Return ONLY valid JSON."""
+        
+        # Prepended to each piece when a long contract is extracted in chunks
+        self.chunk_prompt = (
+            "NOTE: This is part {part} of {total} of the contract (sections: {headings}). "
+            "Extract only what this part states and use \"Not specified\" for anything it does not cover; "
+            "the parts are merged afterwards. Do not invent deliverables for this part.\n\n"
+        )
+        
+        # Cached extractions are only valid for this exact prompt set
+        prompt_fingerprint = hashlib.sha256(
+            (self.system_prompt + self.extraction_prompt + self.chunk_prompt + self._get_json_structure()).encode("utf-8")
+        ).hexdigest()[:12]
+        self.prompt_version = f"{settings.EXTRACTION_PROMPT_VERSION}:{prompt_fingerprint}"
     
     def _clean_environment(self):
         """Clean proxy environment variables"""
@@ -114,15 +173,8 @@ Contract text (first 12000 characters):
                 del os.environ[var]
     
     def _create_openai_client(self):
-        """Create OpenAI client"""
-        try:
-            return openai.OpenAI(
-                api_key=self.api_key,
-                timeout=90.0  # Increased timeout
-            )
-        except Exception as e:
-            print(f"Client creation failed: {e}")
-            return None
+        """Shared LLM gateway (pooled, rate limited, retried) or None if OpenAI isn't configured"""
+        return llm_gateway if llm_gateway.is_configured else None
 
     def _get_json_structure(self):
         """Return the JSON structure for the prompt"""
@@ -223,73 +275,79 @@ Contract text (first 12000 characters):
             }
         }, indent=2)
     
-    def extract_contract_data(self, text: str) -> Dict[str, Any]:
-        """Extract comprehensive structured data from contract text with deterministic caching"""
+    def extract_contract_data(
+        self, text: str, previous: Optional[Dict[str, Any]] = None, use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Extract comprehensive structured data from contract text with deterministic caching.
+        
+        Each chunk's model output is cached on its own (by chunk text), so when
+        the text changes only partially just the chunks with changed sections
+        go to the model. `previous` (the contract's earlier extraction) keeps
+        its chunk layout for unchanged sections, see chunk_sections.
+        use_cache=False (an explicit re-extraction request) sends every chunk
+        to the model again; the fresh results replace the cached ones.
+        """
         try:
             # Check API key
-            if not self.api_key or self.api_key == "your-openai-api-key-here":
-                print("ERROR: Please set OPENAI_API_KEY in .env file")
-                return self._get_empty_result()
-            
             if not self.client:
-                print("ERROR: OpenAI client not initialized")
+                print("ERROR: Please set OPENAI_API_KEY (or OPENAI_BASE_URL) in .env file")
                 return self._get_empty_result()
             
             # Pre-process text
             processed_text = self._preprocess_text(text)
             
-            # Create a deterministic hash of the text for caching
-            text_hash = self._create_text_hash(processed_text[:12000])
-            cache_file = self.cache_dir / f"{text_hash}.pkl"
+            # Content address: prompt version + model + full normalized text
+            cache_key = make_cache_key(processed_text, self.model, self.prompt_version)
             
             # Check if we have a cached extraction for this exact text
-            if cache_file.exists():
-                print(f"📦 Loading cached extraction for text hash: {text_hash[:8]}...")
-                try:
-                    with open(cache_file, 'rb') as f:
-                        cached_result = pickle.load(f)
-                    # Add fresh timestamp
-                    cached_result["metadata"]["extraction_timestamp"] = datetime.now().isoformat()
-                    return cached_result
-                except Exception as e:
-                    print(f"⚠️ Cache load failed: {e}")
+            cached_result = extraction_cache.get(cache_key) if use_cache else None
+            if cached_result is not None:
+                print(f"📦 Loaded cached extraction for key: {cache_key[:8]}...")
+                # Add fresh timestamp
+                cached_result.setdefault("metadata", {})["extraction_timestamp"] = datetime.now().isoformat()
+                return cached_result
             
-            print(f"🔍 No cache found, extracting from text hash: {text_hash[:8]}...")
+            print(f"🔍 No cache found, extracting for key: {cache_key[:8]}...")
             
-            # Use GPT-4o with enhanced focus on deliverables - WITH DETERMINISTIC SETTINGS
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a contract analysis expert with special focus on deliverables and reporting requirements.
-                        Your PRIMARY TASK is to extract ALL deliverables from grant contracts.
-                        NEVER return empty deliverables array. If deliverables aren't explicitly listed, extract them from scope of work or project description.
-                        Create at least 2 logical deliverables based on contract purpose if none are found.
-                        Be extremely thorough with deliverables extraction.
-                        For other fields: Extract dates, amounts, names, clauses, tables, schedules.
-                        If information is missing, use "Not specified".
-                        Convert dates to YYYY-MM-DD format.
-                        Return ONLY valid JSON."""
-                    },
-                    {
-                        "role": "user", 
-                        "content": self.extraction_prompt.format(
-                            json_structure=self._get_json_structure(),
-                            text=processed_text[:12000]
-                        )
-                    }
-                ],
-                temperature=0.1,  # Very low temperature for consistency
-                response_format={"type": "json_object"},
-                max_tokens=3000  # Increased for better deliverables extraction
+            run_started = time.time()
+            chunks = chunk_sections(
+                processed_text, settings.EXTRACTION_CHUNK_CHARS, previous_layout=previous_chunk_layout(previous)
             )
             
-            # Parse response
-            result = json.loads(response.choices[0].message.content)
+            if settings.EXTRACTION_CHUNKING and len(chunks) > 1:
+                # Long contract: extract every section group, then merge
+                result, chunk_reports = self._extract_chunked(chunks, use_cache)
+                mode = "chunked"
+            else:
+                report = self._extract_chunk(
+                    Chunk(0, 0, min(len(processed_text), settings.EXTRACTION_CHUNK_CHARS),
+                          processed_text[:settings.EXTRACTION_CHUNK_CHARS], []),
+                    total_chunks=1,
+                    use_cache=use_cache
+                )
+                if "data" not in report:
+                    raise report.pop("exception")
+                result = report.pop("data")
+                chunk_reports = [report]
+                mode = "single"
             
-            # Add timestamp
+            # Add timestamp and per-chunk token usage / wall time
+            result.setdefault("metadata", {})
             result["metadata"]["extraction_timestamp"] = datetime.now().isoformat()
+            result["metadata"]["extraction_run"] = {
+                "mode": mode,
+                "model": self.model,
+                "prompt_version": self.prompt_version,
+                "chunk_count": len(chunk_reports),
+                "chunks_reused": len([r for r in chunk_reports if r["status"] == "cached"]),
+                "concurrency": min(settings.EXTRACTION_CHUNK_CONCURRENCY, len(chunk_reports)),
+                "wall_time_seconds": round(time.time() - run_started, 3),
+                "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in chunk_reports),
+                "completion_tokens": sum(r.get("completion_tokens", 0) for r in chunk_reports),
+                "total_tokens": sum(r.get("total_tokens", 0) for r in chunk_reports),
+                "chunks": chunk_reports
+            }
             
             # Add reference IDs
             result["reference_ids"] = self.extract_reference_ids(processed_text, result.get("contract_details", {}))
@@ -312,29 +370,13 @@ Contract text (first 12000 characters):
             result["extended_data"] = self._extract_extended_data(processed_text, result)
             
             # Cache the result for future identical extractions
-            try:
-                with open(cache_file, 'wb') as f:
-                    pickle.dump(result, f)
-                print(f"💾 Cached extraction for future use: {text_hash[:8]}")
-            except Exception as e:
-                print(f"⚠️ Cache save failed: {e}")
+            extraction_cache.set(cache_key, result, model=self.model, prompt_version=self.prompt_version)
+            print(f"💾 Cached extraction for future use: {cache_key[:8]}")
             
             return result
             
         except json.JSONDecodeError as e:
             print(f"JSON Decode Error: {e}")
-            # Try to fix JSON
-            try:
-                json_match = re.search(r'\{.*\}', response.choices[0].message.content, re.DOTALL)
-                if json_match:
-                    fixed_json = json_match.group()
-                    # Clean common JSON issues
-                    fixed_json = re.sub(r',\s*}', '}', fixed_json)
-                    fixed_json = re.sub(r',\s*]', ']', fixed_json)
-                    result = json.loads(fixed_json)
-                    return self._validate_and_enhance_deliverables(result, processed_text)
-            except:
-                pass
             return self._get_empty_result()
         except Exception as e:
             print(f"Extraction error: {e}")
@@ -342,12 +384,170 @@ Contract text (first 12000 characters):
             traceback.print_exc()
             return self._get_empty_result()
     
-    def _create_text_hash(self, text: str) -> str:
-        """Create deterministic hash of text for caching"""
-        # Normalize text for consistent hashing
-        normalized_text = text.strip().lower()
-        normalized_text = re.sub(r'\s+', ' ', normalized_text)  # Normalize whitespace
-        return hashlib.md5(normalized_text.encode('utf-8')).hexdigest()
+    def _call_extraction_model(self, text: str):
+        """Run the extraction prompt on one piece of text; returns (parsed JSON, token usage)"""
+        # Use GPT-4o with enhanced focus on deliverables - WITH DETERMINISTIC SETTINGS
+        response = self.client.chat(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.system_prompt
+                },
+                {
+                    "role": "user", 
+                    "content": self.extraction_prompt.format(
+                        json_structure=self._get_json_structure(),
+                        text=text
+                    )
+                }
+            ],
+            temperature=0.1,  # Very low temperature for consistency
+            response_format={"type": "json_object"},
+            max_tokens=3000  # Increased for better deliverables extraction
+        )
+        
+        usage = getattr(response, "usage", None)
+        token_usage = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0
+        }
+        return self._parse_model_json(response.choices[0].message.content), token_usage
+    
+    def _parse_model_json(self, content: str) -> Dict[str, Any]:
+        """Parse the model's JSON, repairing trailing commas if needed"""
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            json_match = re.search(r'\{.*\}', content or "", re.DOTALL)
+            if not json_match:
+                raise
+            # Clean common JSON issues
+            fixed_json = re.sub(r',\s*}', '}', json_match.group())
+            fixed_json = re.sub(r',\s*]', ']', fixed_json)
+            return json.loads(fixed_json)
+    
+    def _chunk_cache_key(self, chunk: Chunk, total_chunks: int) -> str:
+        # The part numbers in the chunk prompt are only a hint and are left out,
+        # so a chunk keeps its key when sections elsewhere are added or removed
+        variant = "chunk" if total_chunks > 1 else "single"
+        return make_cache_key(chunk.text, self.model, f"{self.prompt_version}:{variant}")
+    
+    def _extract_chunk(self, chunk: Chunk, total_chunks: int, use_cache: bool = True) -> Dict[str, Any]:
+        """Extract one chunk (or reuse its cached output) and report its token usage and wall time"""
+        started = time.time()
+        report = {
+            "index": chunk.index,
+            "start": chunk.start,
+            "end": chunk.end,
+            "characters": len(chunk.text),
+            "headings": chunk.headings[:10],
+            "section_hashes": list(chunk.section_hashes)
+        }
+        
+        cache_key = self._chunk_cache_key(chunk, total_chunks)
+        cached = extraction_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            report["status"] = "cached"
+            report["data"] = cached
+            report["wall_time_seconds"] = round(time.time() - started, 3)
+            return report
+        
+        text = chunk.text
+        if total_chunks > 1:
+            text = self.chunk_prompt.format(
+                part=chunk.index + 1,
+                total=total_chunks,
+                headings=", ".join(chunk.headings[:10]) or "untitled"
+            ) + text
+        
+        try:
+            data, token_usage = self._call_extraction_model(text)
+            report.update(token_usage)
+            report["status"] = "completed"
+            report["data"] = data
+            extraction_cache.set(cache_key, data, model=self.model, prompt_version=self.prompt_version)
+        except Exception as e:
+            print(f"⚠️ Extraction failed for chunk {chunk.index + 1}/{total_chunks}: {e}")
+            report["status"] = "failed"
+            report["error"] = str(e)
+            report["exception"] = e
+        
+        report["wall_time_seconds"] = round(time.time() - started, 3)
+        return report
+    
+    def _extract_chunked(self, chunks: List[Chunk], use_cache: bool = True):
+        """Map: extract chunks concurrently. Reduce: merge them in document order."""
+        workers = max(1, min(settings.EXTRACTION_CHUNK_CONCURRENCY, len(chunks)))
+        print(f"🧩 Chunked extraction: {len(chunks)} chunks, {workers} concurrent")
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract-chunk") as pool:
+            reports = list(pool.map(lambda c: self._extract_chunk(c, len(chunks), use_cache), chunks))
+        
+        partials = [r.pop("data") for r in reports if "data" in r]
+        errors = [r.pop("exception") for r in reports if "exception" in r]
+        if not partials:
+            raise errors[0]
+        
+        return self._merge_chunk_results(partials), reports
+    
+    def _merge_chunk_results(self, partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Deterministically merge per-chunk extractions (chunk order decides ties)"""
+        merged: Dict[str, Any] = {}
+        for partial in partials:
+            merged = self._merge_values(merged, partial, ())
+        
+        # Installments are numbered per chunk; renumber across the document
+        installments = (
+            merged.get("financial_details", {}).get("payment_schedule", {}).get("installments")
+        )
+        if isinstance(installments, list):
+            for number, installment in enumerate(installments, start=1):
+                if isinstance(installment, dict):
+                    installment["installment_number"] = number
+        
+        confidences = [
+            p.get("metadata", {}).get("extraction_confidence") for p in partials
+            if isinstance(p.get("metadata", {}).get("extraction_confidence"), (int, float))
+        ]
+        if confidences:
+            merged.setdefault("metadata", {})["extraction_confidence"] = round(sum(confidences) / len(confidences), 2)
+        
+        return merged
+    
+    def _merge_values(self, base: Any, incoming: Any, path: tuple) -> Any:
+        if isinstance(base, dict) and isinstance(incoming, dict):
+            merged = dict(base)
+            for key, value in incoming.items():
+                merged[key] = self._merge_values(base[key], value, path + (key,)) if key in base else value
+            return merged
+        
+        if isinstance(base, list) and isinstance(incoming, list):
+            key_fields = MERGE_LIST_KEYS.get(path)
+            merged_items: List[Any] = []
+            positions: Dict[Any, int] = {}
+            for item in base + incoming:
+                if not _is_meaningful(item):
+                    continue
+                if isinstance(item, dict):
+                    identity = tuple(_normalize_merge_key(item.get(field)) for field in key_fields or ())
+                    if not any(identity):
+                        identity = json.dumps(item, sort_keys=True, default=str)
+                else:
+                    identity = _normalize_merge_key(item)
+                
+                if identity in positions:
+                    index = positions[identity]
+                    merged_items[index] = self._merge_values(merged_items[index], item, path + ("[]",))
+                else:
+                    positions[identity] = len(merged_items)
+                    merged_items.append(item)
+            return merged_items
+        
+        if base is None or base == {} or base == []:
+            return incoming
+        return base if _is_meaningful(base) or not _is_meaningful(incoming) else incoming
     
     def _validate_and_enhance_deliverables(self, data: Dict[str, Any], original_text: str) -> Dict[str, Any]:
         """Special validation with enhanced deliverables extraction - FIXED DETERMINISTIC VERSION"""
@@ -1294,12 +1494,46 @@ Contract text (first 12000 characters):
     def get_embedding(self, text: str) -> List[float]:
         """Get vector embedding for text"""
         try:
-            if not self.api_key or self.api_key == "your-openai-api-key-here":
-                print("ERROR: Please set OPENAI_API_KEY in .env file")
+            if not self.client:
+                print("ERROR: Please set OPENAI_API_KEY (or OPENAI_BASE_URL) in .env file")
+                return []
+            
+            response = self.client.embed(
+                model=settings.EMBEDDING_MODEL,
+                input=text[:8000]
+            )
+            return response.data[0].embedding
+        except Exception as e:
+            print(f"Embedding error: {e}")
+            return []
+    
+    def get_embeddings(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Embed many texts with one request per batch (EMBEDDING_BATCH_SIZE inputs).
+        Returns one vector per input, in input order.
+        """
+        if not self.client:
+            print("ERROR: Please set OPENAI_API_KEY (or OPENAI_BASE_URL) in .env file")
+            return [[] for _ in texts]
+        
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        embeddings: List[List[float]] = []
+        for offset in range(0, len(texts), batch_size):
+            batch = [(text or " ")[:8000] for text in texts[offset:offset + batch_size]]
+            response = self.client.embed(model=settings.EMBEDDING_MODEL, input=batch)
+            ordered = sorted(response.data, key=lambda item: item.index)
+            embeddings.extend(item.embedding for item in ordered)
+        return embeddings
+    
+    async def aget_embedding(self, text: str) -> List[float]:
+        """get_embedding for async endpoints (doesn't block the event loop)"""
+        try:
+            if not self.client:
+                print("ERROR: Please set OPENAI_API_KEY (or OPENAI_BASE_URL) in .env file")
                 return []
             
-            response = self.client.embeddings.create(
-                model="text-embedding-3-small",
+            response = await self.client.aembed(
+                model=settings.EMBEDDING_MODEL,
                 input=text[:8000]
             )
             return response.data[0].embedding
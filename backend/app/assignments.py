@@ -0,0 +1,161 @@
+# app/assignments.py
+"""
+Contract assignment checks.
+
+Assignments live in the assigned_pm_users / assigned_pgm_users /
+assigned_director_users JSONB arrays (normalized to integer arrays by
+migrate_contract_assignments.py). The clauses below use JSONB containment
+(@>), which the GIN indexes on those columns serve, so list endpoints can
+filter and paginate in the database instead of scanning every contract.
+
+For contracts that are already loaded, AssignmentResolver parses the fields
+(including the legacy JSON-string/CSV forms) once per request.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.models import Contract
+
+ASSIGNMENT_COLUMNS = {
+    "project_manager": Contract.assigned_pm_users,
+    "program_manager": Contract.assigned_pgm_users,
+    "director": Contract.assigned_director_users,
+}
+
+
+def assigned_to_user_clause(user_id: int):
+    """SQL condition: user is in any of the contract's assignment lists"""
+    return or_(*[column.contains([user_id]) for column in ASSIGNMENT_COLUMNS.values()])
+
+
+def visible_to_user_clause(user_id: int):
+    """SQL condition: user created the contract or is assigned to it"""
+    return or_(Contract.created_by == user_id, assigned_to_user_clause(user_id))
+
+
+def pgm_review_assignment_clause(user_id: int):
+    """
+    SQL condition for program manager review queues: the assigned_pgm_users
+    column plus the assignment copies kept inside comprehensive_data.
+    """
+    return or_(
+        Contract.assigned_pgm_users.contains([user_id]),
+        Contract.comprehensive_data.contains({"assigned_users": {"pgm_users": [user_id]}}),
+        Contract.comprehensive_data.contains({"agreement_metadata": {"assigned_pgm_users": [user_id]}}),
+        Contract.comprehensive_data.contains({"assignment_history": [{"assigned_users": [user_id]}]}),
+    )
+
+
+# ─────────────────────────────────────────────────────────────
+# In-Python resolver for contracts that are already loaded
+# ─────────────────────────────────────────────────────────────
+
+class AssignmentSets(NamedTuple):
+    pm: FrozenSet[int]
+    pgm: FrozenSet[int]
+    director: FrozenSet[int]
+
+    @property
+    def all(self) -> FrozenSet[int]:
+        return self.pm | self.pgm | self.director
+
+    def contains(self, user_id: int) -> bool:
+        return user_id in self.pm or user_id in self.pgm or user_id in self.director
+
+    def role_for(self, user_id: int) -> Optional[str]:
+        """Assignment type of the user (first match in PM, PGM, Director order)"""
+        if user_id in self.pm:
+            return "project_manager"
+        if user_id in self.pgm:
+            return "program_manager"
+        if user_id in self.director:
+            return "director"
+        return None
+
+
+EMPTY_ASSIGNMENTS = AssignmentSets(frozenset(), frozenset(), frozenset())
+
+
+def _to_int_set(items) -> FrozenSet[int]:
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(str(item).strip()))
+        except (TypeError, ValueError):
+            continue
+    return frozenset(ids)
+
+
+@lru_cache(maxsize=4096)
+def _parse_string_ids(value: str) -> FrozenSet[int]:
+    """Legacy string formats: JSON list/number or comma-separated ids"""
+    stripped = value.strip()
+    if not stripped:
+        return frozenset()
+    try:
+        parsed = json.loads(stripped)
+    except ValueError:
+        return _to_int_set(stripped.split(','))
+    return _to_int_set(parsed if isinstance(parsed, list) else [parsed])
+
+
+def parse_user_ids(value) -> FrozenSet[int]:
+    """Parse an assignment field (list, JSON string, CSV string or single id)"""
+    if not value:
+        return frozenset()
+    if isinstance(value, str):
+        return _parse_string_ids(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return _to_int_set(value)
+    return _to_int_set([value])
+
+
+class AssignmentResolver:
+    """
+    Parses a contract's three assignment fields into frozensets once and
+    memoizes them by contract id. A cached entry is reused only while the
+    contract still holds the very same field values, so reassignments made
+    later in the request are picked up.
+    """
+
+    def __init__(self):
+        self._cache: Dict[Any, Tuple[tuple, AssignmentSets]] = {}
+
+    def resolve(self, contract) -> AssignmentSets:
+        if contract is None:
+            return EMPTY_ASSIGNMENTS
+
+        raw = (
+            getattr(contract, "assigned_pm_users", None),
+            getattr(contract, "assigned_pgm_users", None),
+            getattr(contract, "assigned_director_users", None),
+        )
+        key = getattr(contract, "id", None)
+
+        cached = self._cache.get(key) if key is not None else None
+        if cached is not None and all(a is b for a, b in zip(cached[0], raw)):
+            return cached[1]
+
+        sets = AssignmentSets(*(parse_user_ids(value) for value in raw))
+        if key is not None:
+            self._cache[key] = (raw, sets)
+        return sets
+
+    def is_assigned(self, user_id: int, contract) -> bool:
+        return self.resolve(contract).contains(user_id)
+
+    def assignment_role(self, user_id: int, contract) -> Optional[str]:
+        return self.resolve(contract).role_for(user_id)
+
+
+def get_assignment_resolver(db: Session) -> AssignmentResolver:
+    """Resolver memoized on the session, i.e. per request via get_db"""
+    resolver = db.info.get("assignment_resolver")
+    if resolver is None:
+        resolver = AssignmentResolver()
+        db.info["assignment_resolver"] = resolver
+    return resolver
@@ -12,6 +12,7 @@ import uuid
 from app.config import settings
 from app.database import get_db
 from app.auth_models import User, UserSession
+from app.principal_cache import principal_cache, last_seen_tracker
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
@@ -54,29 +55,32 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+    token = credentials.credentials
+    user = principal_cache.get_user(db, token)
     if user is None:
-        raise credentials_exception
-    
-    # Check if user is active
-    if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User account is deactivated"
-        )
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
+            raise credentials_exception
+        
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        
+        # Check if user is active
+        if not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User account is deactivated"
+            )
+        
+        principal_cache.put(token, user, payload.get("exp"))
     
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Last seen is written in periodic batches, not per request
+    last_seen_tracker.touch(user.id)
     
     return user
 
@@ -226,21 +230,10 @@ def get_user_permissions(user: User) -> Dict[str, bool]:
 
         
 def log_activity(db: Session, user_id: int, activity_type: str, contract_id: Optional[int] = None, details: Optional[dict] = None, request: Optional[Request] = None):
-    """Log user activity"""
-    from app.auth_models import ActivityLog
+    """Log user activity (queued and written in batches, see app.activity_log_buffer)"""
+    from app.activity_log_buffer import record_activity
     
-    activity = ActivityLog(
-        user_id=user_id,
-        activity_type=activity_type,
-        contract_id=contract_id,
-        details=details or {},
-        ip_address=request.client.host if request else None,
-        user_agent=request.headers.get("user-agent") if request else None
-    )
-    
-    db.add(activity)
-    db.commit()
-    return activity
+    return record_activity(db, user_id, activity_type, contract_id=contract_id, details=details, request=request)
 
 def generate_session_token() -> str:
     """Generate a secure random session token"""
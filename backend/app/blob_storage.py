@@ -0,0 +1,335 @@
+# app/blob_storage.py
+"""
+Binary storage for uploaded files (deliverables, reporting event reports).
+
+Files used to be kept base64-encoded in JSONB (contract_deliverables.file_data)
+or as whole local files, and every download decoded/read the full file into
+memory. Blobs now live in S3 or, for development and tests, a local directory,
+and are served with blob_response():
+
+- the body is streamed in BLOB_STREAM_CHUNK_BYTES chunks
+- single-range "Range: bytes=..." requests get 206 Partial Content
+- ETag (content SHA-256) + If-None-Match revalidation answers 304
+
+BLOB_STORAGE_BACKEND selects "s3" or "local" (default: s3 when AWS
+credentials are configured, otherwise local under BLOB_LOCAL_ROOT).
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, NamedTuple, Optional
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class BlobInfo(NamedTuple):
+    key: str
+    size: int
+    etag: str
+    content_type: str
+
+
+class BlobStorage(ABC):
+    backend_name = "none"
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> BlobInfo:
+        ...
+
+    @abstractmethod
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None, sha256: Optional[str] = None) -> BlobInfo:
+        """Store a file from disk (e.g. a spooled upload) without loading it into memory"""
+
+    @abstractmethod
+    def head(self, key: str) -> Optional[BlobInfo]:
+        ...
+
+    @abstractmethod
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+        """Yield bytes start..end (inclusive)"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+
+class LocalBlobStorage(BlobStorage):
+    """Stand-in for S3: blobs under `root`, with a .meta JSON sidecar for etag/content type"""
+
+    backend_name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid blob key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> BlobInfo:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        info = BlobInfo(
+            key=key,
+            size=len(data),
+            etag=hashlib.sha256(data).hexdigest(),
+            content_type=content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+        )
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with open(f"{path}.meta", "w") as f:
+            json.dump({"etag": info.etag, "content_type": info.content_type}, f)
+        return info
+
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None, sha256: Optional[str] = None) -> BlobInfo:
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        info = BlobInfo(
+            key=key,
+            size=os.path.getsize(path),
+            etag=sha256 or file_sha256(path),
+            content_type=content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+        )
+        tmp_path = f"{target}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+        with open(f"{target}.meta", "w") as f:
+            json.dump({"etag": info.etag, "content_type": info.content_type}, f)
+        return info
+
+    def head(self, key: str) -> Optional[BlobInfo]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        meta = {}
+        if os.path.exists(f"{path}.meta"):
+            with open(f"{path}.meta") as f:
+                meta = json.load(f)
+        stat = os.stat(path)
+        return BlobInfo(
+            key=key,
+            size=stat.st_size,
+            etag=meta.get("etag") or f"{int(stat.st_mtime)}-{stat.st_size}",
+            content_type=meta.get("content_type") or mimetypes.guess_type(key)[0] or "application/octet-stream"
+        )
+
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+        return iter_file_range(self._path(key), start, end, chunk_size)
+
+    def delete(self, key: str):
+        path = self._path(key)
+        for candidate in (path, f"{path}.meta"):
+            if os.path.exists(candidate):
+                os.remove(candidate)
+
+
+class S3BlobStorage(BlobStorage):
+    backend_name = "s3"
+
+    def __init__(self, s3_client, bucket: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> BlobInfo:
+        etag = hashlib.sha256(data).hexdigest()
+        content_type = content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+            Metadata={"sha256": etag}
+        )
+        return BlobInfo(key=key, size=len(data), etag=etag, content_type=content_type)
+
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None, sha256: Optional[str] = None) -> BlobInfo:
+        from app.s3_service import TRANSFER_CONFIG
+
+        etag = sha256 or file_sha256(path)
+        content_type = content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+        self.s3_client.upload_file(
+            path,
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type, "Metadata": {"sha256": etag}},
+            Config=TRANSFER_CONFIG
+        )
+        return BlobInfo(key=key, size=os.path.getsize(path), etag=etag, content_type=content_type)
+
+    def head(self, key: str) -> Optional[BlobInfo]:
+        from botocore.exceptions import ClientError
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return BlobInfo(
+            key=key,
+            size=response["ContentLength"],
+            etag=response.get("Metadata", {}).get("sha256") or response["ETag"].strip('"'),
+            content_type=response.get("ContentType") or "application/octet-stream"
+        )
+
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}")
+        body = response["Body"]
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=key)
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+    """Yield bytes start..end (inclusive) of a local file without reading it whole"""
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_blob_info(path: str) -> BlobInfo:
+    """BlobInfo for a legacy local upload (ETag from mtime and size)"""
+    stat = os.stat(path)
+    return BlobInfo(
+        key=path,
+        size=stat.st_size,
+        etag=f"{int(stat.st_mtime)}-{stat.st_size}",
+        content_type=mimetypes.guess_type(path)[0] or "application/octet-stream"
+    )
+
+
+def _parse_range(header: Optional[str], size: int):
+    """(start, end) for a single byte range, None for no/unsupported range, or 'invalid'"""
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None  # Multi-range or other units: serve the whole file
+    first, last = match.groups()
+    if not first and not last:
+        return "invalid"
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, end
+
+
+def content_disposition(filename: str, disposition_type: str = "attachment") -> str:
+    """
+    Content-Disposition value as Starlette's FileResponse builds it: RFC 5987
+    filename* for non-ASCII names (headers must be latin-1), plain filename
+    otherwise. Quotes and control characters can't end the quoted string.
+    """
+    encoded = quote(filename)
+    if encoded != filename:
+        ascii_name = re.sub(r'[^\x20-\x7e]|["\\]', "_", filename)
+        return f"{disposition_type}; filename=\"{ascii_name}\"; filename*=utf-8''{encoded}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+def blob_response(
+    request: Request,
+    info: BlobInfo,
+    iter_range: Callable[[int, int, int], Iterator[bytes]],
+    filename: str,
+    media_type: Optional[str] = None,
+    content_disposition_type: str = "attachment"
+) -> Response:
+    """
+    Stream a blob with Range and ETag/If-None-Match support.
+    iter_range(start, end, chunk_size) yields the requested bytes.
+    """
+    etag = f'"{info.etag}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Authenticated content: browsers may keep it but must revalidate with the ETag
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": content_disposition(filename, content_disposition_type)
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        byte_range = _parse_range(request.headers.get("range"), info.size)
+
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{info.size}"})
+
+    chunk_size = settings.BLOB_STREAM_CHUNK_BYTES
+    if byte_range is None:
+        if info.size == 0:
+            return Response(content=b"", media_type=media_type or info.content_type, headers=headers)
+        start, end, status_code = 0, info.size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_range(start, end, chunk_size),
+        status_code=status_code,
+        media_type=media_type or info.content_type,
+        headers=headers
+    )
+
+
+def create_blob_storage() -> BlobStorage:
+    backend = (settings.BLOB_STORAGE_BACKEND or "").lower()
+    if not backend:
+        backend = "s3" if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY else "local"
+
+    if backend == "s3":
+        from app.s3_service import s3_service
+        if s3_service.s3_client:
+            return S3BlobStorage(s3_service.s3_client, settings.S3_BUCKET_NAME)
+        print("⚠️ S3 client unavailable, using local blob storage")
+
+    return LocalBlobStorage(settings.BLOB_LOCAL_ROOT)
+
+
+blob_storage = create_blob_storage()
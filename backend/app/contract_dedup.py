@@ -0,0 +1,192 @@
+# app/contract_dedup.py
+"""
+Upload dedupe by content hash.
+
+Every upload is hashed while it is spooled (app/upload_spool.py) and the
+SHA-256 of the raw PDF bytes is stored on the contract (content_sha256,
+indexed). When a new upload matches a contract that finished ingesting, the
+PDF is not parsed, sent to GPT or embedded again: the new contract row is
+created from the stored extraction and text of the matching one and records
+it as source_contract_id.
+
+The reused data is copied rather than shared - pages and passages with
+INSERT ... SELECT, vectors with their stored embeddings, the PDF with an S3
+server-side copy - so each contract can still be edited, reassigned or
+deleted on its own. Review/approval state in comprehensive_data
+(WORKFLOW_KEYS) belongs to the source contract and is not copied. If any
+copy fails, the new contract is removed and the upload is ingested from
+scratch.
+"""
+import copy
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models, page_store, passage_index
+from app.auth_models import UserNotification
+from app.config import settings
+from app.contract_ingestion import (
+    persist_contract, store_contract_pdf, contract_embedding_metadata,
+    embed_contract_text, index_contract_embedding, WORKFLOW_KEYS
+)
+from app.s3_service import s3_service
+from app.upload_spool import SpooledUpload
+from app.vector_store import vector_store
+
+_lock = threading.Lock()
+_counters = {"checks": 0, "hits": 0, "misses": 0, "clone_failures": 0, "bytes_reused": 0}
+
+
+def _count(name: str, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def find_duplicate(db: Session, sha256: Optional[str]) -> Optional[models.Contract]:
+    """Oldest fully ingested contract with the same PDF bytes, if dedupe is enabled"""
+    if not settings.CONTRACT_DEDUP_ENABLED or not sha256:
+        return None
+
+    _count("checks")
+    has_pages = db.query(models.ContractPage.id).filter(
+        models.ContractPage.contract_id == models.Contract.id
+    ).exists()
+    source = db.query(models.Contract).filter(
+        models.Contract.content_sha256 == sha256,
+        models.Contract.comprehensive_data.isnot(None),
+        has_pages
+    ).order_by(models.Contract.id).first()
+
+    _count("hits" if source is not None else "misses")
+    return source
+
+
+def clone_contract(
+    db: Session,
+    source: models.Contract,
+    filename: str,
+    created_by: int,
+    upload: SpooledUpload
+) -> Optional[models.Contract]:
+    """
+    Create a contract for `upload` from `source` (same content). Returns None
+    if the source text can't be loaded, or if copying its pages, PDF or
+    vectors fails - the half-built contract is then removed again and the
+    caller ingests the upload normally.
+    """
+    cleaned_text = page_store.get_contract_text(db, source.id)
+    if not cleaned_text:
+        _count("clone_failures")
+        return None
+
+    comprehensive_data = {
+        key: copy.deepcopy(value)
+        for key, value in (source.comprehensive_data or {}).items()
+        if key not in WORKFLOW_KEYS
+    }
+
+    # The source was never embedded: embed the stored text before any row is written
+    embedded = None if source.chroma_id else embed_contract_text(cleaned_text)
+
+    # Row, notification, reporting schedule and events, as for a fresh upload
+    db_contract = persist_contract(
+        db,
+        filename=filename,
+        cleaned_text=cleaned_text,
+        comprehensive_data=comprehensive_data,
+        created_by=created_by,
+        content_sha256=upload.sha256,
+        source_contract_id=source.id
+    )
+
+    try:
+        pages = page_store.copy_contract_pages(db, source.id, db_contract.id)
+        if not pages:
+            raise RuntimeError(f"contract {source.id} has no stored pages")
+        print(f"✓ Copied {pages} pages from contract {source.id} to {db_contract.id}")
+
+        _store_pdf_copy(db, db_contract, source, filename, upload)
+
+        if embedded is not None:
+            index_contract_embedding(db, db_contract, cleaned_text, embedded)
+        else:
+            passages = passage_index.copy_passage_index(db, source.id, db_contract.id)
+            chroma_id = vector_store.copy_contract_vectors(
+                source.id, db_contract.id, contract_embedding_metadata(db_contract)
+            )
+            if not chroma_id:
+                raise RuntimeError(f"contract {source.id} has no vectors to copy")
+            db_contract.chroma_id = chroma_id
+            db.commit()
+            db.refresh(db_contract)
+            print(f"✓ Reused {passages} passages and vectors of contract {source.id} for {db_contract.id}")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Failed to reuse contract {source.id} for {filename}: {e} - ingesting it normally")
+        _discard_clone(db, db_contract.id)
+        _count("clone_failures")
+        return None
+
+    _count("bytes_reused", upload.size)
+    return db_contract
+
+
+def _discard_clone(db: Session, contract_id: int):
+    """Remove a contract clone_contract could not finish, with its vectors and S3 copy"""
+    try:
+        vector_store.delete_by_contract_id(contract_id)
+        s3_service.delete_contract_files(contract_id)
+        # Pages and passages go with the contract (ON DELETE CASCADE)
+        for model in (UserNotification, models.ReportingEvent, models.ReportingSchedule):
+            db.query(model).filter(model.contract_id == contract_id).delete(synchronize_session=False)
+        db.query(models.Contract).filter(models.Contract.id == contract_id).delete(synchronize_session=False)
+        db.commit()
+        print(f"🗑️ Removed incomplete contract {contract_id}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Failed to remove incomplete contract {contract_id}: {e}")
+
+
+def _store_pdf_copy(db: Session, db_contract: models.Contract, source: models.Contract,
+                    filename: str, upload: SpooledUpload):
+    """S3 server-side copy of the source PDF; uploads the spooled file if there is none"""
+    source_key = ((source.comprehensive_data or {}).get("s3_pdf") or {}).get("key")
+    pdf_key = s3_service.copy_original_pdf(source_key, db_contract.id, filename, upload.sha256) if source_key else None
+    if not pdf_key:
+        store_contract_pdf(db, db_contract, filename, upload.path, upload.sha256)
+        return
+
+    comprehensive_data = dict(db_contract.comprehensive_data or {})
+    comprehensive_data["s3_pdf"] = {
+        "key": pdf_key,
+        "uploaded_at": datetime.utcnow().isoformat(),
+        "original_filename": filename,
+        "sha256": upload.sha256,
+        "copied_from": source_key
+    }
+    db_contract.comprehensive_data = comprehensive_data
+    db.commit()
+
+
+def dedup_stats(db: Session) -> Dict[str, Any]:
+    hashed, deduplicated, unique_contents = db.query(
+        func.count(models.Contract.content_sha256),
+        func.count(models.Contract.source_contract_id),
+        func.count(func.distinct(models.Contract.content_sha256))
+    ).one()
+    with _lock:
+        counters = dict(_counters)
+    checks = counters["checks"]
+    return {
+        "enabled": settings.CONTRACT_DEDUP_ENABLED,
+        "contracts_hashed": hashed,
+        "contracts_deduplicated": deduplicated,
+        "unique_contents": unique_contents,
+        "duplicate_contents": hashed - unique_contents,
+        # This process since startup
+        **counters,
+        "hit_rate": round(counters["hits"] / checks, 4) if checks else 0.0
+    }
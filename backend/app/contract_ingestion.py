@@ -0,0 +1,437 @@
+# app/contract_ingestion.py
+"""
+Contract ingestion stages shared by the inline POST /upload/ endpoint
+and the background ingestion jobs (see app/ingestion_jobs.py).
+"""
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import models
+from app.auth_models import UserNotification
+from app.pdf_processor import PDFProcessor, extract_pdf_file
+from app.ai_extractor import AIExtractor
+from app.s3_service import s3_service
+from app.config import settings
+from app.text_sections import chunk_sections
+from app.assignments import AssignmentSets, parse_user_ids
+from app.vector_store import vector_store
+from app import page_store, passage_index
+
+# Shared processors (also used by app.main)
+pdf_processor = PDFProcessor()
+ai_extractor = AIExtractor()
+
+# comprehensive_data keys written by the review/assignment workflow, not by extraction
+WORKFLOW_KEYS = (
+    "s3_pdf", "review_history", "metadata_history", "review_responses", "status_history",
+    "comments", "comment_resolutions", "review_flags", "change_requests",
+    "program_manager_review", "has_program_manager_review", "director_approval_tracking",
+    "director_final_approval", "approval_history", "locked_by", "locked_by_name", "locked_at",
+    "assigned_users", "agreement_metadata", "assignment_history", "assignment_tracking",
+)
+
+
+def clean_extraction_result(extraction_result: Dict[str, Any]) -> str:
+    """Turn a PDFProcessor.extract_text result into the cleaned contract text"""
+    return pdf_processor.clean_text(extraction_result.get("text", ""))
+
+
+def parse_pdf(file_path: str) -> Dict[str, Any]:
+    """Stage 1: extract and clean the PDF text (read memory-mapped from the spooled upload)"""
+    return extract_pdf_file(file_path)
+
+
+def extract_basic_data(comprehensive_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the flat contract columns out of the AI extraction"""
+    contract_details = comprehensive_data.get("contract_details", {})
+    parties = comprehensive_data.get("parties", {})
+    financial_details = comprehensive_data.get("financial_details", {})
+    terms_conditions_data = comprehensive_data.get("terms_conditions", {})
+
+    return {
+        "contract_number": contract_details.get("contract_number"),
+        "grant_name": contract_details.get("grant_name"),
+        "grantor": parties.get("grantor", {}).get("organization_name"),
+        "grantee": parties.get("grantee", {}).get("organization_name"),
+        "total_amount": financial_details.get("total_grant_amount"),
+        "start_date": contract_details.get("start_date"),
+        "end_date": contract_details.get("end_date"),
+        "purpose": contract_details.get("purpose"),
+        "payment_schedule": financial_details.get("payment_schedule", {}),
+        "terms_conditions": terms_conditions_data
+    }
+
+
+def persist_contract(
+    db: Session,
+    filename: str,
+    cleaned_text: str,
+    comprehensive_data: Dict[str, Any],
+    created_by: int,
+    pages: Optional[List[Dict[str, Any]]] = None,
+    content_sha256: Optional[str] = None,
+    source_contract_id: Optional[int] = None
+) -> models.Contract:
+    """
+    Create the contract row together with its upload notification,
+    reporting schedule and reporting events. `pages` (from
+    PDFProcessor.extract_text) go to the contract_pages store.
+    content_sha256 / source_contract_id record the upload for dedupe
+    (app/contract_dedup.py).
+    """
+    reference_ids = comprehensive_data.get("reference_ids", {})
+    basic_data = extract_basic_data(comprehensive_data)
+
+    db_contract = models.Contract(
+        filename=filename,
+        full_text=cleaned_text[:5000] if cleaned_text else "",
+        comprehensive_data=comprehensive_data,
+        investment_id=reference_ids.get("investment_id"),
+        project_id=reference_ids.get("project_id"),
+        grant_id=reference_ids.get("grant_id"),
+        extracted_reference_ids=reference_ids.get("extracted_reference_ids", []),
+        contract_number=basic_data["contract_number"],
+        grant_name=basic_data["grant_name"],
+        grantor=basic_data["grantor"],
+        grantee=basic_data["grantee"],
+        total_amount=basic_data["total_amount"],
+        start_date=basic_data["start_date"],
+        end_date=basic_data["end_date"],
+        purpose=basic_data["purpose"],
+        payment_schedule=basic_data["payment_schedule"],
+        terms_conditions=basic_data["terms_conditions"],
+        created_by=created_by,
+        status="draft",
+        version=1,
+        content_sha256=content_sha256,
+        source_contract_id=source_contract_id
+    )
+
+    db.add(db_contract)
+    db.commit()
+    db.refresh(db_contract)
+
+    # Full text, page by page (full_text above is only a preview)
+    if pages:
+        try:
+            stored = page_store.store_contract_pages(db, db_contract.id, pages)
+            print(f"✓ Stored {stored['pages']} pages for contract {db_contract.id} "
+                  f"({stored['raw_bytes']} → {stored['stored_bytes']} bytes)")
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Failed to store pages for contract {db_contract.id}: {e}")
+
+    # ── Upload notification for the uploader ─────────────────────────────
+    try:
+        upload_notif = UserNotification(
+            user_id=created_by,
+            notification_type="grant_uploaded",
+            title="Grant Saved as Draft",
+            message=f"'{db_contract.grant_name or db_contract.filename}' has been uploaded and saved as a draft",
+            contract_id=db_contract.id,
+            is_read=False,
+            created_at=datetime.utcnow()
+        )
+        db.add(upload_notif)
+        db.commit()
+    except Exception as _notif_err:
+        print(f"Warning: could not create upload notification: {_notif_err}")
+
+    # -----------------------------
+    # SAVE REPORTING SCHEDULE DATA
+    # -----------------------------
+    reporting_data = {}
+    try:
+        deliverables_data = comprehensive_data.get("deliverables", {})
+        reporting_data = deliverables_data.get("reporting_requirements", {})
+
+        if reporting_data:
+            reporting_entry = models.ReportingSchedule(
+                contract_id=db_contract.id,
+                frequency=reporting_data.get("frequency"),
+                report_types=reporting_data.get("report_types", []),
+                due_dates=reporting_data.get("due_dates", []),
+                format_requirements=reporting_data.get("format_requirements"),
+                submission_method=reporting_data.get("submission_method"),
+                recipients=reporting_data.get("recipients", [])
+            )
+
+            db.add(reporting_entry)
+            db.commit()
+            db.refresh(reporting_entry)
+
+            print(f"✅ Reporting schedule saved for contract {db_contract.id}")
+
+    except Exception as e:
+        print(f"⚠️ Failed to save reporting schedule: {e}")
+
+    # ---------------------------------
+    # CREATE REPORTING EVENTS
+    # ---------------------------------
+    try:
+        report_types = reporting_data.get("report_types", [])
+        due_dates = reporting_data.get("due_dates", [])
+
+        for i, due_date_str in enumerate(due_dates):
+            due_date_obj = datetime.strptime(due_date_str, "%Y-%m-%d").date()
+
+            # If multiple progress + one final
+            if "Final Report" in report_types and i == len(due_dates) - 1:
+                report_type = "Final Report"
+            else:
+                report_type = "Progress Report"
+
+            event = models.ReportingEvent(
+                contract_id=db_contract.id,
+                report_type=report_type,
+                due_date=due_date_obj,
+                status="pending"
+            )
+
+            db.add(event)
+
+        db.commit()
+        print(f"✅ Reporting events created for contract {db_contract.id}")
+
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Failed creating reporting events: {e}")
+
+    return db_contract
+
+
+def reextract_contract(
+    db: Session,
+    db_contract: models.Contract,
+    cleaned_text: str,
+    pages: Optional[List[Dict[str, Any]]] = None,
+    commit: bool = True,
+    use_cache: bool = True
+) -> Optional[Dict[str, Any]]:
+    """
+    Run the AI extraction again for an existing contract: a new document
+    version (`pages` replace the stored ones) or a requested re-extraction of
+    the stored text. The previous extraction is passed to AIExtractor, so
+    only chunks whose sections changed go to the model and the rest come
+    from the extraction cache. use_cache=False sends every chunk to the
+    model again (a re-extraction of unchanged text would otherwise be all
+    cache hits).
+
+    The new result replaces the extracted part of comprehensive_data and the
+    flat columns; review and assignment state (WORKFLOW_KEYS) is kept.
+    Returns the run summary (metadata.extraction_run without the per-chunk
+    reports), or None if extraction failed and nothing was changed.
+
+    With commit=False nothing is committed and errors storing the pages are
+    raised: the caller commits the contract, its pages and its own changes
+    (e.g. the ContractVersion row) together.
+    """
+    previous = db_contract.comprehensive_data or {}
+    result = ai_extractor.extract_contract_data(cleaned_text, previous=previous, use_cache=use_cache)
+    run = (result.get("metadata") or {}).get("extraction_run")
+    if not run:
+        # extract_contract_data returns an empty template when extraction fails
+        print(f"⚠️ Re-extraction failed for contract {db_contract.id}, keeping the previous extraction")
+        return None
+
+    comprehensive_data = dict(result)
+    comprehensive_data.update({key: value for key, value in previous.items() if key in WORKFLOW_KEYS})
+    reference_ids = result.get("reference_ids", {})
+
+    db_contract.comprehensive_data = comprehensive_data
+    db_contract.full_text = cleaned_text[:5000] if cleaned_text else ""
+    db_contract.investment_id = reference_ids.get("investment_id")
+    db_contract.project_id = reference_ids.get("project_id")
+    db_contract.grant_id = reference_ids.get("grant_id")
+    db_contract.extracted_reference_ids = reference_ids.get("extracted_reference_ids", [])
+    for field, value in extract_basic_data(result).items():
+        setattr(db_contract, field, value)
+
+    if not commit:
+        if pages:
+            page_store.store_contract_pages(db, db_contract.id, pages, commit=False)
+    else:
+        db.commit()
+        db.refresh(db_contract)
+        if pages:
+            try:
+                stored = page_store.store_contract_pages(db, db_contract.id, pages)
+                print(f"✓ Stored {stored['pages']} pages for contract {db_contract.id} "
+                      f"({stored['raw_bytes']} → {stored['stored_bytes']} bytes)")
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Failed to store pages for contract {db_contract.id}: {e}")
+
+    summary = {key: value for key, value in run.items() if key != "chunks"}
+    print(f"✅ Re-extracted contract {db_contract.id}: {summary.get('chunks_reused', 0)}/{summary.get('chunk_count', 0)} "
+          f"chunks reused, {summary.get('total_tokens', 0)} tokens")
+    return summary
+
+
+def store_contract_pdf(
+    db: Session,
+    db_contract: models.Contract,
+    filename: str,
+    file_path: str,
+    sha256: Optional[str] = None
+) -> Optional[str]:
+    """Upload the original PDF from disk to S3 and record its key on the contract"""
+    try:
+        pdf_key = s3_service.store_original_pdf_file(
+            contract_id=db_contract.id,
+            filename=filename,
+            file_path=file_path,
+            sha256=sha256
+        )
+
+        if pdf_key:
+            comprehensive_data = dict(db_contract.comprehensive_data or {})
+            comprehensive_data["s3_pdf"] = {
+                "key": pdf_key,
+                "uploaded_at": datetime.utcnow().isoformat(),
+                "original_filename": filename,
+                "sha256": sha256
+            }
+            db_contract.comprehensive_data = comprehensive_data
+            db.commit()
+            print(f"✅ Contract {db_contract.id} PDF stored in S3: {pdf_key}")
+        else:
+            print(f"⚠️ Warning: Failed to store PDF in S3 for contract {db_contract.id}")
+
+        return pdf_key
+
+    except Exception as s3_error:
+        # Don't fail the upload if S3 fails
+        print(f"⚠️ Warning: S3 storage failed: {s3_error}")
+        return None
+
+
+def contract_access_metadata(contract) -> Dict[str, Any]:
+    """
+    Vector metadata used for permission filtering: the creator plus a
+    viewer_<id> flag for the creator and every assigned user (Chroma metadata
+    can't hold lists, so membership is one boolean key per user).
+    """
+    assignments = AssignmentSets(
+        parse_user_ids(contract.assigned_pm_users),
+        parse_user_ids(contract.assigned_pgm_users),
+        parse_user_ids(contract.assigned_director_users)
+    )
+    viewers = set(assignments.all)
+    if contract.created_by:
+        viewers.add(contract.created_by)
+
+    access = {"created_by": contract.created_by or 0}
+    access.update({f"viewer_{user_id}": True for user_id in sorted(viewers)})
+    return access
+
+
+def contract_embedding_metadata(contract) -> Dict[str, Any]:
+    """Chroma metadata stored alongside a contract's vector"""
+    return {
+        "filename": contract.filename,
+        "contract_number": contract.contract_number or "",
+        "grant_name": contract.grant_name or "",
+        "total_amount": str(contract.total_amount) if contract.total_amount else "0",
+        "contract_id": str(contract.id),
+        **contract_access_metadata(contract)
+    }
+
+
+def embed_contract_text(cleaned_text: str) -> Dict[str, Any]:
+    """
+    Embed the contract for the vector index. In chunk mode (VECTOR_INDEX_MODE)
+    the text is split on section boundaries and every chunk is embedded in
+    one batched request; in document mode a single vector is produced.
+    """
+    if settings.VECTOR_INDEX_MODE == "chunks":
+        chunks = [
+            {"text": c.text, "start": c.start, "end": c.end, "headings": c.headings}
+            for c in chunk_sections(cleaned_text or "", settings.VECTOR_CHUNK_CHARS)
+        ]
+        try:
+            embeddings = ai_extractor.get_embeddings([c["text"] for c in chunks]) if chunks else []
+        except Exception as e:
+            print(f"Embedding error: {e}")
+            embeddings = []
+        return {"mode": "chunks", "chunks": chunks, "embeddings": embeddings}
+
+    return {"mode": "document", "chunks": [], "embeddings": [ai_extractor.get_embedding(cleaned_text)]}
+
+
+def index_contract_embedding(
+    db: Session,
+    db_contract: models.Contract,
+    cleaned_text: str,
+    embedded: Dict[str, Any]
+) -> Optional[str]:
+    """
+    Store the contract vectors (from embed_contract_text) in ChromaDB and
+    record the chroma_id. The copilot passage index is built here too.
+    """
+    try:
+        count = passage_index.build_passage_index(db, db_contract.id, cleaned_text)
+        print(f"✓ Indexed {count} passages for contract {db_contract.id}")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Failed to build passage index for contract {db_contract.id}: {e}")
+
+    embeddings = [e for e in embedded.get("embeddings") or [] if e]
+    if not embeddings:
+        return None
+
+    metadata = contract_embedding_metadata(db_contract)
+
+    if embedded.get("mode") == "chunks":
+        chroma_id = vector_store.upsert_chunk_embeddings(
+            contract_id=db_contract.id,
+            chunks=embedded["chunks"],
+            embeddings=embedded["embeddings"],
+            metadata=metadata
+        )
+    else:
+        chroma_id = vector_store.store_embedding(
+            contract_id=db_contract.id,
+            text=cleaned_text[:1000] if cleaned_text else "",
+            embedding=embeddings[0],
+            metadata=metadata
+        )
+
+    db_contract.chroma_id = chroma_id
+    db.commit()
+    db.refresh(db_contract)
+    return chroma_id
+
+
+# ─────────────────────────────────────────────────────────────
+# Keep vector access metadata in step with assignment changes
+# ─────────────────────────────────────────────────────────────
+
+ACCESS_FIELDS = ("assigned_pm_users", "assigned_pgm_users", "assigned_director_users", "created_by")
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_access_changes(session, flush_context):
+    for obj in session.dirty:
+        if not isinstance(obj, models.Contract) or not obj.chroma_id:
+            continue
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field in ACCESS_FIELDS):
+            session.info.setdefault("vector_access_changes", {})[obj.id] = contract_access_metadata(obj)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_access_changes(session):
+    changes = session.info.pop("vector_access_changes", None)
+    for contract_id, access in (changes or {}).items():
+        try:
+            vector_store.set_contract_access(contract_id, access)
+        except Exception as e:
+            print(f"⚠️ Failed to update vector access for contract {contract_id}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_access_changes(session):
+    session.info.pop("vector_access_changes", None)
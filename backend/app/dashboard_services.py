@@ -1,209 +1,226 @@
+"""
+Role dashboard metrics.
+
+Each role's metrics are one SQL statement: FILTER aggregates over the
+per-contract rows of mv_contract_reporting (app/portfolio_views.py), with
+the rows' refresh time read in the same statement. Results are cached per
+(user, role) for DASHBOARD_CACHE_TTL_SECONDS. This worker's cache is cleared
+when a commit writes contracts or reporting_events and again when the views
+finish refreshing; writes served by other workers show up within the TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
 from sqlalchemy.orm import Session
-from sqlalchemy import distinct, func
-from datetime import date, timedelta
+from sqlalchemy import event, func, null, select
 from app import models
-
-
-def get_dashboard_metrics(db: Session, current_user):
-
-    today = date.today()
-    role = current_user.role
-
-    # ----------------------------------
-    # ROLE-BASED BASE CONTRACT QUERY
-    # ----------------------------------
-
-    contract_query = db.query(models.Contract)
-
-    if role == "project_manager":
-        contract_query = contract_query.filter(
-            models.Contract.created_by == current_user.id
-        )
-
-    elif role == "program_manager":
-        contract_query = contract_query.filter(
-            models.Contract.created_by == current_user.id
-        )
-
-    elif role == "director":
-        # Director sees everything
-        pass
-
+from app.config import settings
+from app.portfolio_views import CONTRACT_REPORTING_VIEW, portfolio_views
+
+
+# ─────────────────────────────────────────────────────────────
+# Result cache
+# ─────────────────────────────────────────────────────────────
+
+class DashboardCache:
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # (user_id, role) -> (expires_at, metrics)
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        if not self.ttl_seconds:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return dict(entry[1])
+
+    def put(self, key: tuple, metrics: Dict[str, Any]):
+        if not self.ttl_seconds:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, dict(metrics))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self._entries.clear()
+                self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+            }
+
+
+dashboard_cache = DashboardCache(
+    ttl_seconds=settings.DASHBOARD_CACHE_TTL_SECONDS,
+    max_entries=settings.DASHBOARD_CACHE_MAX_ENTRIES
+)
+
+# Until the views have been refreshed, a recomputed result would still be the old one
+portfolio_views.add_refresh_listener(dashboard_cache.clear)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_dashboard_writes(session, flush_context):
+    if any(
+        isinstance(obj, (models.Contract, models.ReportingEvent))
+        for obj in (*session.new, *session.dirty, *session.deleted)
+    ):
+        session.info["dashboard_stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_dashboards(session):
+    if session.info.pop("dashboard_stale", False):
+        dashboard_cache.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dashboard_writes(session):
+    session.info.pop("dashboard_stale", None)
+
+
+# ─────────────────────────────────────────────────────────────
+# Metrics
+# ─────────────────────────────────────────────────────────────
+
+def _role_columns(role: str, c) -> Optional[list]:
+    is_overdue = c.overdue_pending_events > 0
 
     # ============================================================
     # 👤 PROJECT MANAGER DASHBOARD (Operational View)
     # ============================================================
 
     if role == "project_manager":
-
-        # 1️⃣ Drafts
-        drafts = contract_query.filter(
-            models.Contract.status == "draft"
-        ).count()
-
-
-        # 2️⃣ Overdue Reports (count events)
-        overdue_reports = db.query(func.count(models.ReportingEvent.id)) \
-            .join(models.Contract,
-                models.ReportingEvent.contract_id == models.Contract.id) \
-            .filter(
-                models.ReportingEvent.due_date < today,
-                models.ReportingEvent.status == "pending",
-                models.Contract.created_by == current_user.id
-            ).scalar()
-
-
-        # 3️⃣ Grants Requiring Action (count distinct contracts)
-        grants_requiring_action = db.query(
-                func.count(distinct(models.ReportingEvent.contract_id))
-            ) \
-            .join(models.Contract,
-                models.ReportingEvent.contract_id == models.Contract.id) \
-            .filter(
-                models.ReportingEvent.due_date < today,
-                models.ReportingEvent.status == "pending",
-                models.Contract.created_by == current_user.id
-            ).scalar()
-        
-        # 3️⃣ Funds At Risk
-        # Subquery: contracts that have overdue pending reports
-        overdue_contracts = db.query(
-                distinct(models.ReportingEvent.contract_id)
-            ) \
-            .join(models.Contract,
-                models.ReportingEvent.contract_id == models.Contract.id) \
-            .filter(
-                models.ReportingEvent.due_date < today,
-                models.ReportingEvent.status == "pending",
-                models.Contract.created_by == current_user.id
-            ).subquery()
-
-
-        # Now sum only those contracts once
-        funds_at_risk = db.query(
-                func.coalesce(func.sum(models.Contract.total_amount), 0)
-            ) \
-            .filter(models.Contract.id.in_(overdue_contracts)) \
-            .scalar()
-
-
-        # 4️⃣ Upcoming Submissions
-        upcoming_submissions = db.query(
-            func.count(distinct(models.ReportingEvent.contract_id))
-        ).join(
-            models.Contract,
-            models.ReportingEvent.contract_id == models.Contract.id
-        ).filter(
-            models.ReportingEvent.due_date >= today,
-            models.ReportingEvent.due_date <= today + timedelta(days=30),
-            models.ReportingEvent.status == "pending",
-            models.Contract.created_by == current_user.id
-        ).scalar()
-
-        # 5️⃣ Pending Approvals
-        pending_approvals = db.query(
-            func.count(models.ReportingEvent.id)
-        ).join(
-            models.Contract,
-            models.ReportingEvent.contract_id == models.Contract.id
-        ).filter(
-            models.ReportingEvent.status == "submitted",
-            models.Contract.created_by == current_user.id
-        ).scalar()
-
-        # 6️⃣ Portfolio On Track
-        portfolio_on_track = contract_query.filter(
-            models.Contract.status == "active"
-        ).count()
-
-        return {
-            "grants_requiring_action": grants_requiring_action,
-            "funds_at_risk": float(funds_at_risk or 0),
-            "upcoming_submissions": upcoming_submissions,
-            "pending_approvals": pending_approvals,
-            "portfolio_on_track": portfolio_on_track
-        }
-
+        return [
+            # Grants Requiring Action: contracts with overdue pending reports
+            func.count().filter(is_overdue).label("grants_requiring_action"),
+            # Funds At Risk: total value of those contracts (each counted once)
+            func.coalesce(func.sum(c.total_amount).filter(is_overdue), 0).label("funds_at_risk"),
+            # Upcoming Submissions: contracts with pending reports due in the next 30 days
+            func.count().filter(c.upcoming_pending_events > 0).label("upcoming_submissions"),
+            # Pending Approvals: submitted reporting events
+            func.coalesce(func.sum(c.submitted_events), 0).label("pending_approvals"),
+            # Portfolio On Track
+            func.count().filter(c.status == "active").label("portfolio_on_track"),
+        ]
 
     # ============================================================
     # 👨‍💼 PROGRAM MANAGER DASHBOARD (Oversight View)
     # ============================================================
 
-    elif role == "program_manager":
-
-        total_active_grants = contract_query.filter(
-            models.Contract.status == "active"
-        ).count()
-
-        pending_pm_submissions = contract_query.filter(
-            models.Contract.status == "under_review"
-        ).count()
-
-        submitted_to_director = contract_query.filter(
-            models.Contract.status == "reviewed"
-        ).count()
-
-        total_portfolio_value = contract_query.with_entities(
-            func.coalesce(func.sum(models.Contract.total_amount), 0)
-        ).scalar()
-
-        at_risk_grants = db.query(func.count(models.Contract.id)) \
-            .join(models.ReportingEvent,
-                  models.ReportingEvent.contract_id == models.Contract.id) \
-            .filter(
-                models.ReportingEvent.due_date < today,
-                models.ReportingEvent.status == "pending",
-                models.Contract.created_by == current_user.id
-            ).scalar()
-
-        return {
-            "total_active_grants": total_active_grants,
-            "pending_pm_submissions": pending_pm_submissions,
-            "submitted_to_director": submitted_to_director,
-            "total_portfolio_value": float(total_portfolio_value or 0),
-            "at_risk_grants": at_risk_grants
-        }
-
+    if role == "program_manager":
+        return [
+            func.count().filter(c.status == "active").label("total_active_grants"),
+            func.count().filter(c.status == "under_review").label("pending_pm_submissions"),
+            func.count().filter(c.status == "reviewed").label("submitted_to_director"),
+            func.coalesce(func.sum(c.total_amount), 0).label("total_portfolio_value"),
+            # Overdue pending reporting events
+            func.coalesce(func.sum(c.overdue_pending_events), 0).label("at_risk_grants"),
+        ]
 
     # ============================================================
     # 🏛 DIRECTOR DASHBOARD (Executive View)
     # ============================================================
 
-    elif role == "director":
+    if role == "director":
+        return [
+            func.count().label("total_portfolio"),
+            func.coalesce(func.sum(c.total_amount), 0).label("total_portfolio_value"),
+            func.count().filter(c.status == "reviewed").label("awaiting_director_approval"),
+            func.count().filter(c.status == "active").label("active_contracts"),
+            # Overdue pending reporting events
+            func.coalesce(func.sum(c.overdue_pending_events), 0).label("high_risk_grants"),
+        ]
 
-        total_portfolio = contract_query.count()
+    return None
 
-        total_portfolio_value = contract_query.with_entities(
-            func.coalesce(func.sum(models.Contract.total_amount), 0)
-        ).scalar()
 
-        awaiting_director_approval = contract_query.filter(
-            models.Contract.status == "reviewed"
-        ).count()
+def _format_metrics(role: str, row) -> Dict[str, Any]:
+    if role == "project_manager":
+        return {
+            "grants_requiring_action": row.grants_requiring_action,
+            "funds_at_risk": float(row.funds_at_risk or 0),
+            "upcoming_submissions": row.upcoming_submissions,
+            "pending_approvals": int(row.pending_approvals or 0),
+            "portfolio_on_track": row.portfolio_on_track
+        }
 
-        active_contracts = contract_query.filter(
-            models.Contract.status == "active"
-        ).count()
+    if role == "program_manager":
+        return {
+            "total_active_grants": row.total_active_grants,
+            "pending_pm_submissions": row.pending_pm_submissions,
+            "submitted_to_director": row.submitted_to_director,
+            "total_portfolio_value": float(row.total_portfolio_value or 0),
+            "at_risk_grants": int(row.at_risk_grants or 0)
+        }
 
-        portfolio_on_track_percent = 0
-        if total_portfolio > 0:
-            portfolio_on_track_percent = round(
-                (active_contracts / total_portfolio) * 100
-            )
+    portfolio_on_track_percent = 0
+    if row.total_portfolio > 0:
+        portfolio_on_track_percent = round(
+            (row.active_contracts / row.total_portfolio) * 100
+        )
+    return {
+        "total_portfolio": row.total_portfolio,
+        "total_portfolio_value": float(row.total_portfolio_value or 0),
+        "awaiting_director_approval": row.awaiting_director_approval,
+        "portfolio_on_track_percent": portfolio_on_track_percent,
+        "high_risk_grants": int(row.high_risk_grants or 0)
+    }
+
+
+def compute_dashboard_metrics(db: Session, role: str, user_id: int) -> Dict[str, Any]:
+    """One statement per role, uncached; data_refreshed_at is None when computed live"""
+    source = portfolio_views.contract_reporting_source()
+    columns = _role_columns(role, source.c)
+    if columns is None:
+        return {}
+
+    if portfolio_views.contract_reporting_available:
+        refreshed_at = select(models.PortfolioViewRefresh.refreshed_at).where(
+            models.PortfolioViewRefresh.view_name == CONTRACT_REPORTING_VIEW
+        ).scalar_subquery()
+    else:
+        refreshed_at = null()
+
+    query = select(*columns, refreshed_at.label("data_refreshed_at")).select_from(source)
+    # Project and program managers see the contracts they created; directors see everything
+    if role in ("project_manager", "program_manager"):
+        query = query.where(source.c.created_by == user_id)
+
+    row = db.execute(query).one()
+    metrics = _format_metrics(role, row)
+    metrics["data_refreshed_at"] = row.data_refreshed_at.isoformat() if row.data_refreshed_at else None
+    return metrics
 
-        high_risk_grants = db.query(func.count(models.Contract.id)) \
-            .join(models.ReportingEvent,
-                  models.ReportingEvent.contract_id == models.Contract.id) \
-            .filter(
-                models.ReportingEvent.due_date < today,
-                models.ReportingEvent.status == "pending"
-            ).scalar()
 
-        return {
-            "total_portfolio": total_portfolio,
-            "total_portfolio_value": float(total_portfolio_value or 0),
-            "awaiting_director_approval": awaiting_director_approval,
-            "portfolio_on_track_percent": portfolio_on_track_percent,
-            "high_risk_grants": high_risk_grants
-        }
-    return {}
\ No newline at end of file
+def get_dashboard_metrics(db: Session, current_user):
+    key = (current_user.id, current_user.role)
+    metrics = dashboard_cache.get(key)
+    if metrics is None:
+        metrics = compute_dashboard_metrics(db, current_user.role, current_user.id)
+        dashboard_cache.put(key, metrics)
+    return metrics
@@ -1,12 +1,158 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, configure_mappers
+from sqlalchemy.pool import QueuePool
 from app.config import settings
 
+
+class PoolMetrics:
+    """Counters for connection waits (time to get a connection) and holds (checkout -> checkin)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.timeouts = 0
+            self.checkout_errors = 0
+            self.holds = 0
+            self.hold_total = 0.0
+            self.hold_max = 0.0
+            self.slow_holds = 0
+            self.connects = 0
+            self.invalidations = 0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_checkout_error(self):
+        """Checkout failed for another reason than pool exhaustion (e.g. the database refused the connection)"""
+        with self._lock:
+            self.checkout_errors += 1
+
+    def record_hold(self, seconds: float):
+        with self._lock:
+            self.holds += 1
+            self.hold_total += seconds
+            self.hold_max = max(self.hold_max, seconds)
+            if seconds >= settings.DB_SLOW_CHECKOUT_SECONDS:
+                self.slow_holds += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 2),
+                "checkout_timeouts": self.timeouts,
+                "checkout_errors": self.checkout_errors,
+                "hold_avg_ms": round(self.hold_total / self.holds * 1000, 2) if self.holds else 0.0,
+                "hold_max_ms": round(self.hold_max * 1000, 2),
+                "slow_holds": self.slow_holds,
+                "connections_opened": self.connects,
+                "connections_invalidated": self.invalidations
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long callers wait for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        except Exception:
+            pool_metrics.record_checkout_error()
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+def _engine_options():
+    options = dict(
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING
+    )
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
 # Create engine
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(settings.DATABASE_URL, **_engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_metrics.record_connect()
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        pool_metrics.record_hold(time.perf_counter() - checked_out_at)
+
+
+@event.listens_for(engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_metrics.record_invalidation()
+
+
+def get_pool_status():
+    """Current pool occupancy plus wait/hold metrics for this worker process"""
+    pool = engine.pool
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "capacity": pool.size() + settings.DB_MAX_OVERFLOW,
+        "pool_timeout_seconds": settings.DB_POOL_TIMEOUT,
+        "recycle_seconds": settings.DB_POOL_RECYCLE,
+        "pre_ping": settings.DB_POOL_PRE_PING,
+        "statement_timeout_ms": settings.DB_STATEMENT_TIMEOUT_MS,
+        **pool_metrics.snapshot()
+    }
+
 # Create a single Base for all models
 Base = declarative_base()
 
@@ -45,11 +191,52 @@ def setup_database():
         # Create all tables
         Base.metadata.create_all(bind=engine)
         print("✓ Database tables created successfully!")
+
+        # create_all doesn't alter tables that already exist
+        add_missing_columns()
         
     except Exception as e:
         print(f"✗ Database setup failed: {e}")
         raise
 
+# Columns added to existing tables after they were first created: (table, column, DDL type)
+ADDED_COLUMNS = [
+    ("ingestion_jobs", "content_sha256", "VARCHAR(64)"),
+    # Blob storage keys (app/blob_storage.py); migrate_blob_storage.py moves the old files
+    ("contract_deliverables", "blob_key", "VARCHAR(500)"),
+    ("reporting_events", "blob_key", "VARCHAR"),
+    # Upload dedupe (app/contract_dedup.py); migrate_content_hash.py backfills older contracts
+    ("contracts", "content_sha256", "VARCHAR(64)"),
+    ("contracts", "source_contract_id", "INTEGER REFERENCES contracts(id) ON DELETE SET NULL"),
+]
+
+# Indexes on ADDED_COLUMNS (create_all only creates indexes together with their table)
+ADDED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_contracts_content_sha256 ON contracts (content_sha256)",
+]
+
+
+def add_missing_columns():
+    """
+    ALTER TABLE ... ADD COLUMN IF NOT EXISTS for ADDED_COLUMNS, then
+    ADDED_INDEXES (idempotent, run on every startup). Startup stops with the missing columns named if
+    they can't be added (e.g. the API's database user doesn't own the tables).
+    """
+    try:
+        with engine.begin() as conn:
+            for table, column, ddl_type in ADDED_COLUMNS:
+                conn.execute(text(f"ALTER TABLE IF EXISTS {table} ADD COLUMN IF NOT EXISTS {column} {ddl_type}"))
+            for sql in ADDED_INDEXES:
+                conn.execute(text(sql))
+    except Exception as e:
+        columns = ", ".join(f"{table}.{column}" for table, column, _ in ADDED_COLUMNS)
+        raise RuntimeError(
+            f"Could not add columns {columns} ({str(e).splitlines()[0]}). "
+            f"Add them as the table owner, e.g. with the backend migrate_*.py scripts"
+        ) from e
+    print(f"✓ Checked {len(ADDED_COLUMNS)} added columns")
+
+
 def create_deliverables_table_manually():
     """Create deliverables table if model doesn't exist yet"""
     from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date
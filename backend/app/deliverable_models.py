@@ -22,6 +22,9 @@ class ContractDeliverable(Base):
     uploaded_by = Column(Integer, ForeignKey("users.id"))
     upload_notes = Column(Text)
     
+    # Key in blob storage (app/blob_storage.py); file_data then holds metadata only
+    blob_key = Column(String(500), nullable=True)
+    
     # Store file data directly in database (as fallback)
     file_data = Column(JSONB, nullable=True)  # For base64 encoded files when S3 fails
     
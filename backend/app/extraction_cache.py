@@ -0,0 +1,350 @@
+# app/extraction_cache.py
+"""
+Content-addressed cache for AI contract extractions.
+
+Entries are keyed on sha256(prompt version + model + full normalized text), so
+changing the prompt or the model never serves a stale extraction, and results
+are stored as JSON rather than pickles. Two backends are available:
+
+- sqlite:   a single WAL-mode database file, shared by every worker on the host
+- postgres: the extraction_cache table, shared by every container
+
+Both bound the cache by entry count and total payload size (least recently
+used entries go first) and expire entries older than the TTL.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import hashlib
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+
+
+def normalize_text(text_value: str) -> str:
+    """Whitespace/case normalization applied before hashing"""
+    return re.sub(r'\s+', ' ', (text_value or "").strip().lower())
+
+
+def make_cache_key(text_value: str, model: str, prompt_version: str) -> str:
+    """Content address of an extraction: prompt version + model + full normalized text"""
+    digest = hashlib.sha256()
+    digest.update(prompt_version.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(normalize_text(text_value).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Base class: JSON (de)serialization and hit/miss counters"""
+
+    backend_name = "none"
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            payload = self._load(key)
+        except Exception as e:
+            print(f"⚠️ Extraction cache read failed: {e}")
+            self._count("errors")
+            payload = None
+
+        if payload is None:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return json.loads(payload)
+
+    def set(self, key: str, value: Dict[str, Any], model: str, prompt_version: str):
+        try:
+            payload = json.dumps(value, default=str)
+            self._store(key, payload, model, prompt_version)
+            self._count("stores")
+            evicted = self._evict()
+            if evicted:
+                self._count("evictions", evicted)
+        except Exception as e:
+            print(f"⚠️ Extraction cache write failed: {e}")
+            self._count("errors")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+
+        result = {
+            "backend": self.backend_name,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            # Counters for this worker process since startup
+            "process": {
+                **counters,
+                "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0
+            }
+        }
+        try:
+            result["storage"] = self._storage_stats()
+        except Exception as e:
+            result["storage"] = {"error": str(e)}
+        return result
+
+    # Backend hooks
+    def _load(self, key: str) -> Optional[str]:
+        return None
+
+    def _store(self, key: str, payload: str, model: str, prompt_version: str):
+        pass
+
+    def _evict(self) -> int:
+        return 0
+
+    def _storage_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class SQLiteExtractionCache(ExtractionCache):
+    backend_name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int, ttl_seconds: int):
+        super().__init__(max_entries, max_bytes, ttl_seconds)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_extraction_cache_last_accessed "
+            "ON extraction_cache (last_accessed_at)"
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets several worker processes share the file
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, key: str) -> Optional[str]:
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            "SELECT payload, created_at FROM extraction_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        payload, created_at = row
+        if self.ttl_seconds and created_at < now - self.ttl_seconds:
+            conn.execute("DELETE FROM extraction_cache WHERE cache_key = ?", (key,))
+            conn.commit()
+            return None
+
+        conn.execute(
+            "UPDATE extraction_cache SET last_accessed_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+            (now, key)
+        )
+        conn.commit()
+        return payload
+
+    def _store(self, key: str, payload: str, model: str, prompt_version: str):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO extraction_cache
+                (cache_key, model, prompt_version, payload, size_bytes, hit_count, created_at, last_accessed_at)
+            VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+            """,
+            (key, model, prompt_version, payload, len(payload.encode("utf-8")), now, now)
+        )
+        conn.commit()
+
+    def _evict(self) -> int:
+        conn = self._connection()
+        evicted = 0
+
+        if self.ttl_seconds:
+            evicted += conn.execute(
+                "DELETE FROM extraction_cache WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            ).rowcount
+
+        # Keep the most recently used entries that fit both the count and size budgets
+        evicted += conn.execute(
+            """
+            DELETE FROM extraction_cache WHERE cache_key IN (
+                SELECT cache_key FROM (
+                    SELECT cache_key,
+                           ROW_NUMBER() OVER (ORDER BY last_accessed_at DESC) AS position,
+                           SUM(size_bytes) OVER (ORDER BY last_accessed_at DESC
+                                                 ROWS UNBOUNDED PRECEDING) AS running_bytes
+                    FROM extraction_cache
+                ) WHERE position > ? OR running_bytes > ?
+            )
+            """,
+            (self.max_entries, self.max_bytes)
+        ).rowcount
+        conn.commit()
+        return evicted
+
+    def _storage_stats(self) -> Dict[str, Any]:
+        entries, total_bytes, total_hits = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(hit_count), 0) FROM extraction_cache"
+        ).fetchone()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "total_bytes": total_bytes,
+            # Hits recorded by every worker sharing this cache = GPT calls avoided
+            "total_hits": total_hits
+        }
+
+
+class PostgresExtractionCache(ExtractionCache):
+    backend_name = "postgres"
+
+    def _session(self):
+        from app.database import SessionLocal
+        return SessionLocal()
+
+    def _load(self, key: str) -> Optional[str]:
+        db = self._session()
+        try:
+            row = db.execute(text("""
+                UPDATE extraction_cache
+                SET last_accessed_at = now(), hit_count = hit_count + 1
+                WHERE cache_key = :key
+                  AND (:ttl = 0 OR created_at >= now() - make_interval(secs => :ttl))
+                RETURNING payload
+            """), {"key": key, "ttl": self.ttl_seconds}).fetchone()
+            db.commit()
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    def _store(self, key: str, payload: str, model: str, prompt_version: str):
+        db = self._session()
+        try:
+            db.execute(text("""
+                INSERT INTO extraction_cache
+                    (cache_key, model, prompt_version, payload, size_bytes, hit_count, created_at, last_accessed_at)
+                VALUES (:key, :model, :prompt_version, :payload, :size_bytes, 0, now(), now())
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    model = EXCLUDED.model,
+                    prompt_version = EXCLUDED.prompt_version,
+                    payload = EXCLUDED.payload,
+                    size_bytes = EXCLUDED.size_bytes,
+                    created_at = now(),
+                    last_accessed_at = now()
+            """), {
+                "key": key,
+                "model": model,
+                "prompt_version": prompt_version,
+                "payload": payload,
+                "size_bytes": len(payload.encode("utf-8"))
+            })
+            db.commit()
+        finally:
+            db.close()
+
+    def _evict(self) -> int:
+        db = self._session()
+        try:
+            evicted = 0
+            if self.ttl_seconds:
+                evicted += db.execute(text("""
+                    DELETE FROM extraction_cache
+                    WHERE created_at < now() - make_interval(secs => :ttl)
+                """), {"ttl": self.ttl_seconds}).rowcount
+
+            evicted += db.execute(text("""
+                DELETE FROM extraction_cache WHERE cache_key IN (
+                    SELECT cache_key FROM (
+                        SELECT cache_key,
+                               ROW_NUMBER() OVER (ORDER BY last_accessed_at DESC) AS position,
+                               SUM(size_bytes) OVER (ORDER BY last_accessed_at DESC
+                                                     ROWS UNBOUNDED PRECEDING) AS running_bytes
+                        FROM extraction_cache
+                    ) ranked
+                    WHERE position > :max_entries OR running_bytes > :max_bytes
+                )
+            """), {"max_entries": self.max_entries, "max_bytes": self.max_bytes}).rowcount
+            db.commit()
+            return evicted
+        finally:
+            db.close()
+
+    def _storage_stats(self) -> Dict[str, Any]:
+        db = self._session()
+        try:
+            entries, total_bytes, total_hits = db.execute(text(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(hit_count), 0) FROM extraction_cache"
+            )).fetchone()
+            return {
+                "table": "extraction_cache",
+                "entries": entries,
+                "total_bytes": int(total_bytes),
+                "total_hits": int(total_hits)
+            }
+        finally:
+            db.close()
+
+
+def create_extraction_cache() -> ExtractionCache:
+    """Build the cache backend selected by EXTRACTION_CACHE_BACKEND"""
+    backend = settings.EXTRACTION_CACHE_BACKEND.lower()
+    limits = dict(
+        max_entries=settings.EXTRACTION_CACHE_MAX_ENTRIES,
+        max_bytes=settings.EXTRACTION_CACHE_MAX_BYTES,
+        ttl_seconds=settings.EXTRACTION_CACHE_TTL_SECONDS
+    )
+
+    try:
+        if backend == "sqlite":
+            return SQLiteExtractionCache(settings.EXTRACTION_CACHE_PATH, **limits)
+        if backend == "postgres":
+            return PostgresExtractionCache(**limits)
+    except Exception as e:
+        print(f"⚠️ Extraction cache backend '{backend}' unavailable, caching disabled: {e}")
+
+    return ExtractionCache(**limits)
+
+
+extraction_cache = create_extraction_cache()
@@ -0,0 +1,342 @@
+# app/ingestion_jobs.py
+"""
+Job-based contract ingestion.
+
+The upload request only spools the PDF to disk and records an IngestionJob;
+the stages (parse → extract → embed → persist → store_pdf → index) then run on
+a background thread pool; PDFProcessor spreads the pages of large PDFs over a
+process pool so parsing doesn't compete with the API workers for the GIL. Progress for every stage is
+written to ingestion_jobs.stages so any API worker can report it. An upload
+whose bytes match an ingested contract skips every stage and is cloned from
+it (app/contract_dedup.py). Jobs left behind by a restart are picked up on
+startup (recover_ingestion_jobs).
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+from uuid import uuid4
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import IngestionJob
+from app.pdf_processor import extract_pdf_file, shutdown_page_pool
+from app import contract_ingestion, contract_dedup
+from app.upload_spool import SpooledUpload, remove_spool
+
+INGESTION_STAGES = ["parse", "extract", "embed", "persist", "store_pdf", "index"]
+
+_job_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_job_pool() -> ThreadPoolExecutor:
+    global _job_pool
+    if _job_pool is None:
+        _job_pool = ThreadPoolExecutor(
+            max_workers=settings.INGESTION_WORKERS,
+            thread_name_prefix="ingestion"
+        )
+    return _job_pool
+
+
+def shutdown_ingestion_pools(wait: bool = False):
+    """Stop the worker pools (called on application shutdown)"""
+    global _job_pool
+    if _job_pool is not None:
+        _job_pool.shutdown(wait=wait, cancel_futures=True)
+        _job_pool = None
+    shutdown_page_pool(wait=wait)
+
+
+def _empty_stages() -> Dict[str, Any]:
+    return {stage: {"status": "pending"} for stage in INGESTION_STAGES}
+
+
+def submit_ingestion_job(db: Session, upload: SpooledUpload, user_id: int) -> IngestionJob:
+    """Record the job for an upload spooled under INGESTION_SPOOL_DIR and queue it for the workers"""
+    job_id = uuid4().hex
+    job = IngestionJob(
+        id=job_id,
+        filename=upload.filename,
+        file_path=upload.path,
+        file_size=upload.size,
+        content_sha256=upload.sha256,
+        status="queued",
+        stages=_empty_stages(),
+        created_by=user_id
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    _get_job_pool().submit(run_ingestion_job, job_id)
+    print(f"📥 Ingestion job {job_id} queued for {upload.filename}")
+    return job
+
+
+def recover_ingestion_jobs():
+    """
+    Called on startup: jobs of the previous API process never finish on their
+    own. Queued jobs whose spooled PDF is still on disk are queued again
+    (run_ingestion_job claims each one atomically, so with several API
+    processes only one runs it); running jobs older than
+    INGESTION_STALE_JOB_SECONDS and queued jobs without their file are marked
+    failed and their spool files removed.
+    """
+    db = SessionLocal()
+    try:
+        stale_before = func.now() - timedelta(seconds=settings.INGESTION_STALE_JOB_SECONDS)
+        jobs = db.query(IngestionJob).filter(or_(
+            IngestionJob.status == "queued",
+            (IngestionJob.status == "running") & (
+                IngestionJob.started_at.is_(None) | (IngestionJob.started_at <= stale_before)
+            )
+        )).all()
+
+        requeued = []
+        failed = 0
+        for job in jobs:
+            if job.status == "queued" and job.file_path and os.path.exists(job.file_path):
+                requeued.append(job.id)
+                continue
+            # Only if no other worker claimed or finished it since it was read
+            updated = db.query(IngestionJob).filter(
+                IngestionJob.id == job.id,
+                IngestionJob.status == job.status,
+                IngestionJob.started_at.is_(None) if job.started_at is None
+                else IngestionJob.started_at == job.started_at
+            ).update({
+                "status": "failed",
+                "error": ("Interrupted by an API restart" if job.status == "running"
+                          else "Spooled upload missing after an API restart"),
+                "finished_at": datetime.now(timezone.utc)
+            }, synchronize_session=False)
+            db.commit()
+            if updated:
+                remove_spool(job.file_path)
+                failed += 1
+
+        for job_id in requeued:
+            # Every API process queues these; run_ingestion_job's claim lets only one run each
+            _get_job_pool().submit(run_ingestion_job, job_id)
+
+        if requeued or failed:
+            print(f"📥 Ingestion recovery: {len(requeued)} jobs queued again, {failed} marked failed")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Ingestion job recovery failed: {e}")
+    finally:
+        db.close()
+
+
+def _set_stage(db: Session, job: IngestionJob, stage: str, **fields):
+    """Update a single stage entry and persist it immediately"""
+    stages = dict(job.stages or _empty_stages())
+    entry = dict(stages.get(stage, {}))
+    entry.update(fields)
+    stages[stage] = entry
+    job.stages = stages
+    if fields.get("status") == "running":
+        job.current_stage = stage
+    db.commit()
+
+
+def _reuse_duplicate(db: Session, job: IngestionJob, sha256: Optional[str]) -> Optional[int]:
+    """Clone the contract for a byte-identical upload; returns the source contract id, or None"""
+    source = contract_dedup.find_duplicate(db, sha256)
+    if source is None:
+        return None
+
+    upload = SpooledUpload(
+        path=job.file_path, size=job.file_size, sha256=sha256,
+        filename=job.filename, content_type="application/pdf"
+    )
+    contract = contract_dedup.clone_contract(db, source, job.filename, job.created_by, upload)
+    if contract is None:
+        return None
+
+    job.contract_id = contract.id
+    db.commit()
+    print(f"✓ Ingestion job {job.id} reused contract {source.id} (identical PDF)")
+    return source.id
+
+
+def _claim_job(db: Session, job_id: str) -> bool:
+    """queued -> running in one UPDATE; False if the job is gone or another worker claimed it"""
+    claimed = db.query(IngestionJob).filter(
+        IngestionJob.id == job_id,
+        IngestionJob.status == "queued"
+    ).update({"status": "running", "started_at": datetime.now(timezone.utc)}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def run_ingestion_job(job_id: str):
+    """Run every ingestion stage for a job (executes on the job thread pool)"""
+    db = SessionLocal()
+    try:
+        if not _claim_job(db, job_id):
+            print(f"⚠️ Ingestion job {job_id} not found or already claimed")
+            return
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        sha256 = job.content_sha256
+
+        state: Dict[str, Any] = {}
+        reused_from = _reuse_duplicate(db, job, sha256)
+
+        def parse():
+            # Runs on this job thread; pages of large PDFs go to the page process pool
+            parsed = extract_pdf_file(job.file_path)
+            state["cleaned_text"] = parsed["cleaned_text"]
+            extraction_result = parsed["extraction_result"]
+            state["pages"] = extraction_result.get("pages")
+            return {
+                "page_count": extraction_result.get("page_count", 0),
+                "characters": len(parsed["cleaned_text"]),
+                "parse_seconds": extraction_result.get("parse_seconds"),
+                "slow_pages": extraction_result.get("slow_pages", []),
+                "page_timings": extraction_result.get("page_timings", [])
+            }
+
+        def extract():
+            state["comprehensive_data"] = contract_ingestion.ai_extractor.extract_contract_data(state["cleaned_text"])
+            return {}
+
+        def embed():
+            state["embedded"] = contract_ingestion.embed_contract_text(state["cleaned_text"])
+            vectors = [e for e in state["embedded"]["embeddings"] if e]
+            return {
+                "mode": state["embedded"]["mode"],
+                "vectors": len(vectors),
+                "dimensions": len(vectors[0]) if vectors else 0
+            }
+
+        def persist():
+            contract = contract_ingestion.persist_contract(
+                db,
+                filename=job.filename,
+                cleaned_text=state["cleaned_text"],
+                comprehensive_data=state["comprehensive_data"],
+                created_by=job.created_by,
+                pages=state["pages"],
+                content_sha256=sha256
+            )
+            state["contract"] = contract
+            job.contract_id = contract.id
+            db.commit()
+            return {"contract_id": contract.id}
+
+        def store_pdf():
+            pdf_key = contract_ingestion.store_contract_pdf(
+                db, state["contract"], job.filename, job.file_path, sha256=sha256
+            )
+            return {"s3_key": pdf_key}
+
+        def index():
+            chroma_id = contract_ingestion.index_contract_embedding(
+                db, state["contract"], state["cleaned_text"], state["embedded"]
+            )
+            return {"chroma_id": chroma_id}
+
+        stage_runners = {
+            "parse": parse,
+            "extract": extract,
+            "embed": embed,
+            "persist": persist,
+            "store_pdf": store_pdf,
+            "index": index,
+        }
+
+        for stage in INGESTION_STAGES:
+            if reused_from is not None:
+                _set_stage(db, job, stage, status="skipped", detail={"reused_from_contract": reused_from})
+                continue
+            started = time.time()
+            _set_stage(db, job, stage, status="running", started_at=datetime.now(timezone.utc).isoformat())
+            try:
+                detail = stage_runners[stage]()
+            except Exception as e:
+                db.rollback()
+                _set_stage(
+                    db, job, stage,
+                    status="failed",
+                    finished_at=datetime.now(timezone.utc).isoformat(),
+                    duration_seconds=round(time.time() - started, 3),
+                    error=str(e)
+                )
+                raise
+            _set_stage(
+                db, job, stage,
+                status="completed",
+                finished_at=datetime.now(timezone.utc).isoformat(),
+                duration_seconds=round(time.time() - started, 3),
+                detail=detail
+            )
+
+        job.status = "completed"
+        job.current_stage = None
+        job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+        from app.auth_utils import log_activity
+        log_activity(
+            db,
+            job.created_by,
+            "upload",
+            contract_id=job.contract_id,
+            details={
+                "filename": job.filename,
+                "contract_id": job.contract_id,
+                "ingestion_job_id": job.id,
+                "reused_from_contract": reused_from
+            }
+        )
+        print(f"✅ Ingestion job {job_id} completed (contract {job.contract_id})")
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        db.rollback()
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        if job:
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+        print(f"❌ Ingestion job {job_id} failed: {e}")
+    finally:
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        if job and job.status in ("completed", "failed") and job.file_path:
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                pass
+        db.close()
+
+
+def serialize_job(job: IngestionJob) -> Dict[str, Any]:
+    """Job status payload with per-stage progress"""
+    stages = job.stages or _empty_stages()
+    completed = len([s for s in INGESTION_STAGES if stages.get(s, {}).get("status") in ("completed", "skipped")])
+
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "file_size": job.file_size,
+        "status": job.status,
+        "current_stage": job.current_stage,
+        "progress_percent": round(completed / len(INGESTION_STAGES) * 100),
+        "stages": [
+            {"stage": stage, **stages.get(stage, {"status": "pending"})}
+            for stage in INGESTION_STAGES
+        ],
+        "contract_id": job.contract_id,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
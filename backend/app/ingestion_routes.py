@@ -0,0 +1,81 @@
+# app/ingestion_routes.py
+"""
+Job-based contract upload: returns a job id immediately and lets the
+client poll per-stage progress while the contract is processed.
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import get_db
+from app.auth_models import User
+from app.auth_utils import get_current_user
+from app.models import IngestionJob
+from app.ingestion_jobs import submit_ingestion_job, serialize_job
+from app.upload_spool import spool_upload, remove_spool
+
+router = APIRouter(prefix="/api/ingestion", tags=["ingestion"])
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_ingestion_job(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a PDF contract for background ingestion"""
+    if current_user.role not in ["project_manager", "program_manager", "director"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Project Managers, Program Managers and Directors can upload contracts"
+        )
+
+    try:
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="File must be a PDF")
+
+        # Streamed to the spool directory; the job removes the file when it finishes
+        upload = await spool_upload(file, directory=settings.INGESTION_SPOOL_DIR)
+        try:
+            job = submit_ingestion_job(db, upload, current_user.id)
+        except Exception:
+            remove_spool(upload)
+            raise
+        return serialize_job(job)
+    finally:
+        await file.close()
+
+
+@router.get("/jobs")
+async def list_ingestion_jobs(
+    skip: int = 0,
+    limit: int = 50,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List the current user's ingestion jobs, newest first"""
+    jobs = db.query(IngestionJob).filter(
+        IngestionJob.created_by == current_user.id
+    ).order_by(IngestionJob.created_at.desc()).offset(skip).limit(limit).all()
+
+    return {"jobs": [serialize_job(job) for job in jobs]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the status and per-stage progress of an ingestion job"""
+    job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+
+    if job.created_by != current_user.id and current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to view this ingestion job"
+        )
+
+    return serialize_job(job)
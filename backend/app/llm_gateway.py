@@ -0,0 +1,348 @@
+# app/llm_gateway.py
+"""
+Shared gateway for every OpenAI call (extraction, embeddings, copilot).
+
+All requests run on one AsyncOpenAI client that lives on a dedicated
+background event loop, so the limits below are global to the process no
+matter where the call comes from:
+
+- a pooled httpx connection pool (LLM_MAX_CONNECTIONS)
+- a semaphore capping in-flight requests (LLM_MAX_CONCURRENCY)
+- a token bucket capping request rate (LLM_REQUESTS_PER_MINUTE)
+- retry with full-jitter exponential backoff on 429 / 5xx / connection errors
+
+Async endpoints `await llm_gateway.achat(...)` without blocking the server's
+event loop; sync code (ingestion threads, AIExtractor) calls
+`llm_gateway.chat(...)`, which blocks only the calling thread.
+`async for text in llm_gateway.astream_chat(...)` streams completion text;
+closing the iterator (e.g. the client disconnected) cancels the upstream
+request.
+
+Set OPENAI_BASE_URL to point the gateway at llm_stub_server.py for local tests.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from app.config import settings
+
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)
+
+_STREAM_END = object()
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str],
+        max_concurrency: int,
+        requests_per_minute: int,
+        max_retries: int,
+        timeout: float,
+        max_connections: int
+    ):
+        self.api_key = api_key
+        self.base_url = base_url or None
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bucket: Optional[TokenBucket] = None
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retries": 0,
+            "in_flight": 0,
+            "streams": 0,
+            "streams_cancelled": 0,
+            "rate_limit_wait_seconds": 0.0
+        }
+
+    @property
+    def is_configured(self) -> bool:
+        # A stub server (OPENAI_BASE_URL) doesn't need a real key
+        has_key = bool(self.api_key) and self.api_key != "your-openai-api-key-here"
+        return has_key or bool(self.base_url)
+
+    # ── Event loop / client lifecycle ────────────────────────────────────
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._bucket = TokenBucket(
+                    rate=self.requests_per_minute / 60.0,
+                    capacity=max(1, min(self.max_concurrency, self.requests_per_minute))
+                )
+                ready.set()
+                loop.run_forever()
+
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or "stub",
+                base_url=self.base_url,
+                max_retries=0,  # Retries are handled here, with jitter
+                timeout=self.timeout,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    ),
+                    timeout=self.timeout
+                )
+            )
+
+            self._thread = threading.Thread(target=run, name="llm-gateway", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            print(f"✓ LLM gateway started (concurrency={self.max_concurrency}, rpm={self.requests_per_minute})")
+            return loop
+
+    def close(self):
+        """Close the HTTP pool and stop the gateway loop (application shutdown)"""
+        with self._lock:
+            loop, client = self._loop, self._client
+            self._loop = None
+            self._client = None
+        if loop is None:
+            return
+        try:
+            if client is not None:
+                asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"⚠️ LLM gateway close failed: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+    # ── Request execution ────────────────────────────────────────────────
+
+    def _count(self, name: str, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if retry_after is not None:
+            return retry_after
+        # Full jitter: uniform(0, min(cap, base * 2^attempt))
+        return random.uniform(0, min(30.0, 0.5 * (2 ** attempt)))
+
+    async def _execute(self, method: str, kwargs: Dict[str, Any]):
+        """Runs on the gateway loop"""
+        if method == "chat":
+            call = self._client.chat.completions.create
+        else:
+            call = self._client.embeddings.create
+
+        self._count("requests")
+        attempt = 0
+        while True:
+            waited = await self._bucket.acquire()
+            if waited:
+                self._count("rate_limit_wait_seconds", waited)
+
+            async with self._semaphore:
+                self._count("in_flight")
+                try:
+                    response = await call(**kwargs)
+                    self._count("succeeded")
+                    return response
+                except Exception as e:
+                    retryable = isinstance(e, RETRYABLE_ERRORS) or (
+                        isinstance(e, openai.APIStatusError) and e.status_code >= 500
+                    )
+                    if not retryable or attempt >= self.max_retries:
+                        self._count("failed")
+                        raise
+                    delay = self._retry_delay(attempt, e)
+                    error_name = type(e).__name__
+                finally:
+                    self._count("in_flight", -1)
+
+            attempt += 1
+            self._count("retries")
+            print(f"⚠️ LLM {method} call failed ({error_name}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _execute_stream(self, kwargs: Dict[str, Any], emit: Callable[[str], None]):
+        """
+        Runs on the gateway loop: a streamed chat completion, passing each text
+        delta to `emit`. Failures are retried only before the first chunk has
+        arrived, so a retry never repeats text the caller already has.
+        """
+        self._count("requests")
+        self._count("streams")
+        attempt = 0
+        while True:
+            waited = await self._bucket.acquire()
+            if waited:
+                self._count("rate_limit_wait_seconds", waited)
+
+            async with self._semaphore:
+                self._count("in_flight")
+                streaming = False
+                try:
+                    stream = await self._client.chat.completions.create(stream=True, **kwargs)
+                    try:
+                        async for chunk in stream:
+                            streaming = True
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if delta:
+                                emit(delta)
+                    finally:
+                        # Closing the response drops the upstream connection (and the generation)
+                        await stream.response.aclose()
+                    self._count("succeeded")
+                    return
+                except asyncio.CancelledError:
+                    self._count("streams_cancelled")
+                    raise
+                except Exception as e:
+                    retryable = isinstance(e, RETRYABLE_ERRORS) or (
+                        isinstance(e, openai.APIStatusError) and e.status_code >= 500
+                    )
+                    if streaming or not retryable or attempt >= self.max_retries:
+                        self._count("failed")
+                        raise
+                    delay = self._retry_delay(attempt, e)
+                    error_name = type(e).__name__
+                finally:
+                    self._count("in_flight", -1)
+
+            attempt += 1
+            self._count("retries")
+            print(f"⚠️ LLM stream call failed ({error_name}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def _submit(self, method: str, kwargs: Dict[str, Any]):
+        if not self.is_configured:
+            raise RuntimeError("OpenAI is not configured (set OPENAI_API_KEY or OPENAI_BASE_URL)")
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._execute(method, kwargs), loop)
+
+    # Async entry points (for async endpoints)
+    async def achat(self, **kwargs):
+        return await asyncio.wrap_future(self._submit("chat", kwargs))
+
+    async def aembed(self, **kwargs):
+        return await asyncio.wrap_future(self._submit("embed", kwargs))
+
+    async def astream_chat(self, **kwargs) -> AsyncIterator[str]:
+        """
+        Stream the text of a chat completion. Deltas are handed from the
+        gateway loop to the caller's loop through a queue; if the caller stops
+        iterating (or is cancelled) the upstream request is cancelled too.
+        """
+        if not self.is_configured:
+            raise RuntimeError("OpenAI is not configured (set OPENAI_API_KEY or OPENAI_BASE_URL)")
+        caller_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def emit(item):
+            try:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # Caller loop already closed
+
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._execute_stream(kwargs, emit), loop)
+        # Scheduled after every emitted delta, so the end marker arrives last
+        future.add_done_callback(lambda _: emit(_STREAM_END))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                yield item
+            future.result()  # Re-raise a failed request
+        finally:
+            if not future.done():
+                future.cancel()
+
+    # Sync entry points (worker threads; never call from the server's event loop)
+    def chat(self, **kwargs):
+        return self._submit("chat", kwargs).result()
+
+    def embed(self, **kwargs):
+        return self._submit("embed", kwargs).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["rate_limit_wait_seconds"] = round(stats["rate_limit_wait_seconds"], 3)
+        return {
+            "configured": self.is_configured,
+            "started": self._loop is not None,
+            "base_url": self.base_url or "https://api.openai.com/v1",
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self.requests_per_minute,
+            "max_retries": self.max_retries,
+            "max_connections": self.max_connections,
+            **stats
+        }
+
+
+llm_gateway = LLMGateway(
+    api_key=settings.OPENAI_API_KEY,
+    base_url=settings.OPENAI_BASE_URL,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+    max_retries=settings.LLM_MAX_RETRIES,
+    timeout=settings.LLM_TIMEOUT_SECONDS,
+    max_connections=settings.LLM_MAX_CONNECTIONS
+)
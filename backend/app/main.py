@@ -3,18 +3,24 @@ import os
 import sys
 from app.notification_service import NotificationService
 from datetime import datetime, timedelta, date
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import Query, Response, Form
-from fastapi.responses import RedirectResponse, JSONResponse, FileResponse
+from fastapi.responses import RedirectResponse, JSONResponse, FileResponse, StreamingResponse
 from app.auth_models import User, UserSession, ActivityLog, ContractPermission, ReviewComment, UserNotification
 from app.s3_service import s3_service
+from app.blob_storage import blob_storage, blob_response, file_blob_info, iter_file_range
+from app.upload_spool import spool_upload, remove_spool, UploadTooLarge
 from app.deliverable_models import ContractDeliverable
 from app.admin_routes import router as admin_router
 from app.agreement_workflow import router as agreement_router
-from app.dashboard_services import get_dashboard_metrics
+from app.dashboard_services import get_dashboard_metrics, dashboard_cache
 from app.tenant_routes import router as tenant_router
 from app.module_routes import router as module_router
+from app.ingestion_routes import router as ingestion_router
+from app.ingestion_jobs import shutdown_ingestion_pools, recover_ingestion_jobs
 from app.models import Tenant 
+from uuid import uuid4
+from starlette.concurrency import run_in_threadpool
 today = date.today()
 
 # from app.deliverable_routes import router as deliverable_router
@@ -67,10 +73,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import json
+import re
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
-from app.database import get_db, engine, setup_database
+from app.database import get_db, engine, setup_database, get_pool_status, pool_metrics
 from app.pdf_processor import PDFProcessor
 from app.ai_extractor import AIExtractor
 from app.vector_store import vector_store
@@ -79,6 +87,13 @@ from app import models, schemas
 from app.auth_models import User, ActivityLog, ContractPermission
 from app.auth_schemas import UserCreate, UserResponse, LoginRequest, Token, ChangePasswordRequest
 from app.models import ReportingSchedule
+from app.assignments import (
+    assigned_to_user_clause,
+    visible_to_user_clause,
+    pgm_review_assignment_clause,
+    get_assignment_resolver,
+    parse_user_ids,
+)
 
 
 # Create tables and setup relationships
@@ -89,6 +104,25 @@ app.include_router(admin_router)
 app.include_router(agreement_router)
 app.include_router(tenant_router)
 app.include_router(module_router)
+app.include_router(ingestion_router)
+
+
+@app.on_event("startup")
+def start_background_workers():
+    # Materialized copies of the copilot views + per-contract reporting aggregates
+    portfolio_views.setup(_ALLOWED_VIEWS)
+    # Ingestion jobs interrupted by the last shutdown
+    recover_ingestion_jobs()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    shutdown_ingestion_pools()
+    llm_gateway.close()
+    activity_log_buffer.close()
+    last_seen_tracker.close()
+    portfolio_views.close()
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -99,9 +133,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize processors
-pdf_processor = PDFProcessor()
-ai_extractor = AIExtractor()
+# Initialize processors (shared with the background ingestion jobs)
+from app import contract_ingestion
+from app.contract_ingestion import pdf_processor, ai_extractor
+from app.extraction_cache import extraction_cache
+from app.llm_gateway import llm_gateway
+from app.activity_log_buffer import activity_log_buffer, record_activity
+from app.principal_cache import principal_cache, last_seen_tracker
+from app import page_store, passage_index
+from app.sql_plan_cache import sql_plan_cache, SqlPlan
+from app.portfolio_views import portfolio_views
+from app.contract_dedup import find_duplicate, clone_contract, dedup_stats
+from app.sql_guard import is_safe_select
 
 # Authentication dependencies
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -146,38 +189,65 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+    token = credentials.credentials
+    user = principal_cache.get_user(db, token)
     if user is None:
-        raise credentials_exception
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
+            raise credentials_exception
+        
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        
+        principal_cache.put(token, user, payload.get("exp"))
     
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Last seen is written in periodic batches, not per request
+    last_seen_tracker.touch(user.id)
     
     return user
 
+def load_contract_for_user(user: User, contract_id: int, db: Session):
+    """(contract, is_assigned) in one query, or None if the contract doesn't exist"""
+    row = db.query(
+        models.Contract,
+        assigned_to_user_clause(user.id).label("is_assigned")
+    ).filter(models.Contract.id == contract_id).first()
+    if not row:
+        return None
+    contract, is_assigned = row
+    return contract, bool(is_assigned)
+
+
 def check_permission(user: User, contract_id: int, required_permission: str, db: Session) -> bool:
     """Check if user has required permission for a contract - ONLY if assigned or creator"""
-    # Get the contract first
-    contract = db.query(models.Contract).filter(models.Contract.id == contract_id).first()
-    if not contract:
+    # Get the contract and evaluate the assignment check in the same query
+    loaded = load_contract_for_user(user, contract_id, db)
+    if not loaded:
         return False
+    contract, is_assigned = loaded
+    return check_contract_permission(user, contract, required_permission, db, is_assigned=is_assigned)
+
+
+def check_contract_permission(
+    user: User,
+    contract: models.Contract,
+    required_permission: str,
+    db: Session,
+    is_assigned: Optional[bool] = None
+) -> bool:
+    """check_permission for an already loaded contract (avoids a query per contract in lists)"""
+    if is_assigned is None:
+        is_assigned = get_assignment_resolver(db).is_assigned(user.id, contract)
+    contract_id = contract.id
     
     # Check if user is the creator
     is_creator = contract.created_by == user.id
     
-    # Check if user is assigned
-    is_assigned = is_user_assigned_to_contract(user.id, contract, db)
-    
     # User must be either creator OR assigned to have ANY permissions
     if not is_creator and not is_assigned:
         return False
@@ -266,32 +336,7 @@ def check_permission(user: User, contract_id: int, required_permission: str, db:
 
 def get_user_ids_from_field(user_field):
     """Safely extract user IDs from a field that could be list, string, or other format"""
-    if not user_field:
-        return []
-    
-    if isinstance(user_field, list):
-        return user_field
-    
-    if isinstance(user_field, str):
-        try:
-            # Try to parse as JSON
-            import json
-            parsed = json.loads(user_field)
-            if isinstance(parsed, list):
-                return parsed
-        except:
-            # Try comma-separated
-            try:
-                ids = [int(id_str.strip()) for id_str in user_field.split(',') if id_str.strip().isdigit()]
-                return ids
-            except:
-                return []
-    
-    # If it's a single integer
-    try:
-        return [int(user_field)]
-    except:
-        return []
+    return sorted(parse_user_ids(user_field))
 
 def get_user_permissions_dict(user: User) -> Dict[str, bool]:
     """Get all permissions for a user based on their role"""
@@ -396,19 +441,8 @@ def log_activity(
     details: Optional[dict] = None,
     request: Optional[Request] = None
 ):
-    """Log user activity"""
-    activity = ActivityLog(
-        user_id=user_id,
-        activity_type=activity_type,
-        contract_id=contract_id,
-        details=details or {},
-        ip_address=request.client.host if request and request.client else None,
-        user_agent=request.headers.get("user-agent") if request else None
-    )
-    
-    db.add(activity)
-    db.commit()
-    return activity
+    """Log user activity (queued and written in batches, see app.activity_log_buffer)"""
+    return record_activity(db, user_id, activity_type, contract_id=contract_id, details=details, request=request)
 
 
 # Add this endpoint in main.py (anywhere after the app is created)
@@ -553,6 +587,7 @@ async def upload_deliverable_file(
     request: Request = None
 ):
     """Upload a file for a deliverable - saves to database with proper tracking"""
+    upload = None
     try:
         print(f"📤 Uploading file for deliverable ID/index: {deliverable_id_or_index}")
         print(f"Deliverable name from form: {deliverable_name}")
@@ -626,15 +661,15 @@ async def upload_deliverable_file(
         # Check file size (10MB limit)
         MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
         
-        # Read file content
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        if file_size > MAX_FILE_SIZE:
+        # Stream the file to a temp file; stops reading as soon as the limit is passed
+        try:
+            upload = await spool_upload(file, max_bytes=MAX_FILE_SIZE)
+        except UploadTooLarge:
             raise HTTPException(
                 status_code=400,
-                detail=f"File too large. Maximum size is 10MB. Your file is {file_size / 1024 / 1024:.1f}MB"
+                detail=f"File too large. Maximum size is 10MB. Your file is over 10MB"
             )
+        file_size = upload.size
         
         # Parse upload date
         try:
@@ -642,24 +677,28 @@ async def upload_deliverable_file(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
         
-        # ✅ CRITICAL: Store file content in S3, not local filesystem
+        # ✅ CRITICAL: Store file content in blob storage (S3), not in the database
         try:
-            # Upload to S3
             import uuid
-            unique_filename = f"deliverables/contract_{contract_id}/{uuid.uuid4().hex}{file_ext}"
+            blob_key = f"deliverables/contract_{contract_id}/{uuid.uuid4().hex}{file_ext}"
             
-            # Upload to S3
-            s3_service.upload_file_from_bytes(
-                file_content=file_content,
-                file_name=unique_filename,
-                content_type=file.content_type
+            blob = await run_in_threadpool(
+                blob_storage.put_file, blob_key, upload.path, file.content_type, upload.sha256
             )
             
-            # Get S3 URL
-            file_url = s3_service.get_file_url(unique_filename)
-            
-            # ✅ Store S3 reference in database instead of local path
-            deliverable.uploaded_file_path = file_url
+            # ✅ Store the blob reference plus metadata (no file bytes) in the database
+            deliverable.blob_key = blob.key
+            deliverable.file_data = {
+                "filename": file.filename,
+                "content_type": blob.content_type,
+                "size": blob.size,
+                "sha256": blob.etag,
+                "uploaded_by": current_user.id,
+                "uploaded_by_name": current_user.full_name or current_user.username,
+                "uploaded_at": datetime.utcnow().isoformat(),
+                "upload_notes": upload_notes
+            }
+            deliverable.uploaded_file_path = blob.key
             deliverable.uploaded_file_name = file.filename
             deliverable.uploaded_at = datetime.utcnow()
             deliverable.uploaded_by = current_user.id
@@ -674,11 +713,12 @@ async def upload_deliverable_file(
             db.refresh(deliverable)
             
         except Exception as s3_error:
-            print(f"⚠️ S3 upload failed: {s3_error}")
+            print(f"⚠️ Blob storage upload failed: {s3_error}")
             # Fallback: Store file content directly in database (BLOB)
             # Convert to base64 for storage in JSON
             import base64
-            file_content_base64 = base64.b64encode(file_content).decode('utf-8')
+            with open(upload.path, "rb") as spooled:
+                file_content_base64 = base64.b64encode(spooled.read()).decode('utf-8')
             
             # Store file metadata and base64 content in database
             deliverable.uploaded_file_path = f"database_stored:{deliverable.id}"
@@ -723,7 +763,7 @@ async def upload_deliverable_file(
                 "upload_date": upload_date,
                 "file_size": file_size,
                 "file_type": file_ext,
-                "storage_method": "s3" if 's3' in deliverable.uploaded_file_path else "database"
+                "storage_method": blob_storage.backend_name if deliverable.blob_key else "database"
             },
             request=request
         )
@@ -749,6 +789,8 @@ async def upload_deliverable_file(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
+    finally:
+        remove_spool(upload)
 
 # ================================
 # Reporting Event Upload Endpoint
@@ -774,18 +816,20 @@ async def upload_reporting_event_file(
     if not event:
         raise HTTPException(status_code=404, detail="Reporting event not found")
 
-    # Create uploads folder if not exists
-    upload_dir = "uploads/reporting_events"
-    os.makedirs(upload_dir, exist_ok=True)
-
-    file_path = os.path.join(upload_dir, file.filename)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    import uuid
+    upload = await spool_upload(file)
+    try:
+        blob_key = f"reporting_events/event_{event_id}/{uuid.uuid4().hex}_{os.path.basename(file.filename)}"
+        blob = await run_in_threadpool(
+            blob_storage.put_file, blob_key, upload.path, file.content_type, upload.sha256
+        )
+    finally:
+        remove_spool(upload)
 
     # Update event record
     event.uploaded_file_name = file.filename
-    event.uploaded_file_path = file_path
+    event.uploaded_file_path = blob.key
+    event.blob_key = blob.key
     event.uploaded_at = datetime.utcnow()
     event.status = "submitted"
     event.submitted_at = datetime.utcnow()
@@ -839,7 +883,7 @@ async def approve_reporting_event_director(
 
 
 @app.get("/api/reporting-events/{event_id}/file")
-def get_reporting_event_file(event_id: int, db: Session = Depends(get_db)):
+def get_reporting_event_file(event_id: int, request: Request, db: Session = Depends(get_db)):
     event = db.query(models.ReportingEvent).filter(
         models.ReportingEvent.id == event_id
     ).first()
@@ -847,9 +891,24 @@ def get_reporting_event_file(event_id: int, db: Session = Depends(get_db)):
     if not event or not event.uploaded_file_path:
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(
-        path=event.uploaded_file_path,
-        filename=event.uploaded_file_name
+    if event.blob_key:
+        info = blob_storage.head(event.blob_key)
+        if not info:
+            raise HTTPException(status_code=404, detail="File not found")
+        return blob_response(
+            request, info,
+            lambda start, end, chunk_size: blob_storage.iter_range(info.key, start, end, chunk_size),
+            event.uploaded_file_name or os.path.basename(info.key)
+        )
+
+    # Legacy local upload (not yet moved by migrate_blob_storage.py)
+    if not os.path.exists(event.uploaded_file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    info = file_blob_info(event.uploaded_file_path)
+    return blob_response(
+        request, info,
+        lambda start, end, chunk_size: iter_file_range(event.uploaded_file_path, start, end, chunk_size),
+        event.uploaded_file_name or os.path.basename(event.uploaded_file_path)
     )
 
 # ============================================
@@ -1156,205 +1215,64 @@ async def upload_contract(
             detail="Only Project Managers, Program Managers and Directors can upload contracts"
         )
     
+    upload = None
     try:
-        # Read file
-        contents = await file.read()
-        
         # Check if PDF
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="File must be a PDF")
         
-        # Extract text from PDF
-        extraction_result = pdf_processor.extract_text(contents)
-        cleaned_text = pdf_processor.clean_text(extraction_result["text"])
-        
-        # Extract comprehensive data using AI
-        comprehensive_data = ai_extractor.extract_contract_data(cleaned_text)
-        reference_ids = comprehensive_data.get("reference_ids", {})
-        
-        # Get embedding
-        embedding = ai_extractor.get_embedding(cleaned_text)
-        
-        # Safely extract basic fields with None checks
-        contract_details = comprehensive_data.get("contract_details", {})
-        parties = comprehensive_data.get("parties", {})
-        financial_details = comprehensive_data.get("financial_details", {})
-        terms_conditions_data = comprehensive_data.get("terms_conditions", {})
-        
-        # Extract basic data with safe defaults
-        basic_data = {
-            "contract_number": contract_details.get("contract_number"),
-            "grant_name": contract_details.get("grant_name"),
-            "grantor": parties.get("grantor", {}).get("organization_name"),
-            "grantee": parties.get("grantee", {}).get("organization_name"),
-            "total_amount": financial_details.get("total_grant_amount"),
-            "start_date": contract_details.get("start_date"),
-            "end_date": contract_details.get("end_date"),
-            "purpose": contract_details.get("purpose"),
-            "payment_schedule": financial_details.get("payment_schedule", {}),
-            "terms_conditions": terms_conditions_data
-        }
+        # Stream the upload to a temp file (hashed on the way), never holding it in memory
+        upload = await spool_upload(file)
+        
+        # Byte-identical to a contract already ingested: reuse its extraction, text and vectors
+        source_contract = find_duplicate(db, upload.sha256)
+        if source_contract is not None:
+            db_contract = await run_in_threadpool(
+                clone_contract, db, source_contract, file.filename, current_user.id, upload
+            )
+            if db_contract is not None:
+                log_activity(
+                    db,
+                    current_user.id,
+                    "upload",
+                    contract_id=db_contract.id,
+                    details={
+                        "filename": file.filename,
+                        "contract_id": db_contract.id,
+                        "reused_from_contract": source_contract.id
+                    },
+                    request=request
+                )
+                return db_contract
+        
+        # Extract text from PDF (memory-mapped)
+        parsed = await run_in_threadpool(contract_ingestion.parse_pdf, upload.path)
+        cleaned_text = parsed["cleaned_text"]
+        
+        # Extract comprehensive data using AI (off the event loop)
+        comprehensive_data = await run_in_threadpool(ai_extractor.extract_contract_data, cleaned_text)
         
-        # Create contract record in PostgreSQL
-        db_contract = models.Contract(
+        # Get embeddings (one per section chunk in chunk mode)
+        embedded = await run_in_threadpool(contract_ingestion.embed_contract_text, cleaned_text)
+        
+        # Create contract record (plus notification, reporting schedule and events)
+        db_contract = contract_ingestion.persist_contract(
+            db,
             filename=file.filename,
-            full_text=cleaned_text[:5000] if cleaned_text else "",
+            cleaned_text=cleaned_text,
             comprehensive_data=comprehensive_data,
-            investment_id=reference_ids.get("investment_id"),
-            project_id=reference_ids.get("project_id"),
-            grant_id=reference_ids.get("grant_id"),
-            extracted_reference_ids=reference_ids.get("extracted_reference_ids", []),
-            contract_number=basic_data["contract_number"],
-            grant_name=basic_data["grant_name"],
-            grantor=basic_data["grantor"],
-            grantee=basic_data["grantee"],
-            total_amount=basic_data["total_amount"],
-            start_date=basic_data["start_date"],
-            end_date=basic_data["end_date"],
-            purpose=basic_data["purpose"],
-            payment_schedule=basic_data["payment_schedule"],
-            terms_conditions=basic_data["terms_conditions"],
-            # ✅ CRITICAL FIX: Set created_by to current user's ID
             created_by=current_user.id,
-            status="draft",
-            version=1
+            pages=parsed["extraction_result"].get("pages"),
+            content_sha256=upload.sha256
         )
-        
-        db.add(db_contract)
-        db.commit()
-        db.refresh(db_contract)
-
-        # ── Upload notification for the uploader ─────────────────────────────
-        try:
-            upload_notif = UserNotification(
-                user_id=current_user.id,
-                notification_type="grant_uploaded",
-                title="Grant Saved as Draft",
-                message=f"'{db_contract.grant_name or db_contract.filename}' has been uploaded and saved as a draft",
-                contract_id=db_contract.id,
-                is_read=False,
-                created_at=datetime.utcnow()
-            )
-            db.add(upload_notif)
-            db.commit()
-        except Exception as _notif_err:
-            print(f"Warning: could not create upload notification: {_notif_err}")
-        # ────────────────────────────────────────────────────────────────────
-
-        # -----------------------------
-        # SAVE REPORTING SCHEDULE DATA
-        # -----------------------------
-        try:
-            deliverables_data = comprehensive_data.get("deliverables", {})
-            reporting_data = deliverables_data.get("reporting_requirements", {})
-
-            if reporting_data:
-                # Create structured reporting schedule entries
-                reporting_entry = models.ReportingSchedule(
-                    contract_id=db_contract.id,
-                    frequency=reporting_data.get("frequency"),
-                    report_types=reporting_data.get("report_types", []),
-                    due_dates=reporting_data.get("due_dates", []),
-                    format_requirements=reporting_data.get("format_requirements"),
-                    submission_method=reporting_data.get("submission_method"),
-                    recipients=reporting_data.get("recipients", [])
-                )
 
-                db.add(reporting_entry)
-                db.commit()
-                db.refresh(reporting_entry)
-
-                print(f"✅ Reporting schedule saved for contract {db_contract.id}")
-
-        except Exception as e:
-            print(f"⚠️ Failed to save reporting schedule: {e}")
-
-        # ---------------------------------
-        # CREATE REPORTING EVENTS
-        # ---------------------------------
-        try:
-            report_types = reporting_data.get("report_types", [])
-            due_dates = reporting_data.get("due_dates", [])
-
-            # Basic mapping logic (improve later if needed)
-            for i, due_date_str in enumerate(due_dates):
-                due_date_obj = datetime.strptime(due_date_str, "%Y-%m-%d").date()
-
-                # If multiple progress + one final
-                if "Final Report" in report_types and i == len(due_dates) - 1:
-                    report_type = "Final Report"
-                else:
-                    report_type = "Progress Report"
-
-                event = models.ReportingEvent(
-                    contract_id=db_contract.id,
-                    report_type=report_type,
-                    due_date=due_date_obj,
-                    status="pending"
-                )
-
-                db.add(event)
-
-            db.commit()
-            print(f"✅ Reporting events created for contract {db_contract.id}")
-
-        except Exception as e:
-            print(f"⚠️ Failed creating reporting events: {e}")
-
-
-        # ✅ CRITICAL: Store ONLY the original PDF in S3 for AI Copilot
-        try:
-            # Store original PDF directly in S3 bucket
-            pdf_key = s3_service.store_original_pdf(
-                contract_id=db_contract.id,
-                filename=file.filename,
-                file_content=contents
-            )
-            
-            # Add S3 reference to PostgreSQL record
-            if pdf_key:
-                if not db_contract.comprehensive_data:
-                    db_contract.comprehensive_data = {}
-                
-                db_contract.comprehensive_data["s3_pdf"] = {
-                    "key": pdf_key,
-                    "uploaded_at": datetime.utcnow().isoformat(),
-                    "original_filename": file.filename
-                }
-                db.commit()
-                print(f"✅ Contract {db_contract.id} PDF stored in S3: {pdf_key}")
-            else:
-                print(f"⚠️ Warning: Failed to store PDF in S3 for contract {db_contract.id}")
-            
-        except Exception as s3_error:
-            print(f"⚠️ Warning: S3 storage failed: {s3_error}")
-            # Don't fail the upload if S3 fails
-            # Continue with PostgreSQL storage
+        # ✅ CRITICAL: Store ONLY the original PDF in S3 for AI Copilot (multipart from the spooled file)
+        await run_in_threadpool(
+            contract_ingestion.store_contract_pdf, db, db_contract, file.filename, upload.path, upload.sha256
+        )
         
         # Store embedding in ChromaDB only if we have a valid embedding
-        if embedding and len(embedding) > 0:
-            metadata = {
-                "filename": file.filename,
-                "contract_number": basic_data.get("contract_number") or "",
-                "grant_name": basic_data.get("grant_name") or "",
-                "total_amount": str(basic_data.get("total_amount")) if basic_data.get("total_amount") else "0",
-                "contract_id": str(db_contract.id)
-            }
-            
-            # Clean metadata (remove None values)
-            metadata = {k: v for k, v in metadata.items() if v is not None}
-            
-            chroma_id = vector_store.store_embedding(
-                contract_id=db_contract.id,
-                text=cleaned_text[:1000] if cleaned_text else "",
-                embedding=embedding,
-                metadata=metadata
-            )
-            
-            # Update contract with chroma_id
-            db_contract.chroma_id = chroma_id
-            db.commit()
-            db.refresh(db_contract)
+        contract_ingestion.index_contract_embedding(db, db_contract, cleaned_text, embedded)
         
         # Log activity
         log_activity(
@@ -1368,6 +1286,8 @@ async def upload_contract(
         
         return db_contract
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         import traceback
@@ -1376,6 +1296,7 @@ async def upload_contract(
         print(f"Error details: {error_details}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
     finally:
+        remove_spool(upload)
         await file.close()
 
 @app.get("/api/contracts/{contract_id}/assignment-details")
@@ -1422,16 +1343,9 @@ async def get_assignment_details(
         ]
     
     # Get all assigned users
-    all_assigned_ids = []
-    if contract.assigned_pm_users and isinstance(contract.assigned_pm_users, list):
-        all_assigned_ids.extend(contract.assigned_pm_users)
-    if contract.assigned_pgm_users and isinstance(contract.assigned_pgm_users, list):
-        all_assigned_ids.extend(contract.assigned_pgm_users)
-    if contract.assigned_director_users and isinstance(contract.assigned_director_users, list):
-        all_assigned_ids.extend(contract.assigned_director_users)
-    
-    # Remove duplicates and current user
-    all_assigned_ids = list(set(all_assigned_ids))
+    all_assigned_ids = list(get_assignment_resolver(db).resolve(contract).all)
+    
+    # Remove current user
     if current_user.id in all_assigned_ids:
         all_assigned_ids.remove(current_user.id)
     
@@ -1531,12 +1445,12 @@ async def delete_contract(
     db.delete(contract)
     db.commit()
     
-    # Log activity
+    # Log activity (the row no longer exists, so the id is only kept in details)
     log_activity(
         db, 
         current_user.id, 
         "delete_contract", 
-        contract_id=contract_id, 
+        contract_id=None, 
         details={"contract_id": contract_id}, 
         request=request
     )
@@ -1550,17 +1464,15 @@ async def get_contract_pdf_url(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get S3 URL for contract PDF"""
-    # Check permission
-    if not check_permission(current_user, contract_id, "view", db):
+    """Get S3 URL for contract PDF (a cached pre-signed URL, see S3Service.get_presigned_pdf_url)"""
+    # Load the contract once and check permission on it (a missing contract is a 403, as before)
+    loaded = load_contract_for_user(current_user, contract_id, db)
+    if not loaded or not check_contract_permission(current_user, loaded[0], "view", db, is_assigned=loaded[1]):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have permission to view this contract"
         )
-    
-    contract = db.query(models.Contract).filter(models.Contract.id == contract_id).first()
-    if not contract:
-        raise HTTPException(status_code=404, detail="Contract not found")
+    contract = loaded[0]
     
     # Get S3 key from comprehensive data
     s3_key = None
@@ -1570,16 +1482,17 @@ async def get_contract_pdf_url(
     if not s3_key:
         raise HTTPException(status_code=404, detail="PDF not found in S3 storage")
     
-    # Generate pre-signed URL
-    pdf_url = s3_service.get_pdf_url(s3_key)
+    # Pre-signed URL, reused until shortly before it expires
+    presigned = s3_service.get_presigned_pdf_url(s3_key)
     
-    if not pdf_url:
+    if not presigned:
         raise HTTPException(status_code=500, detail="Failed to generate PDF URL")
     
     return {
         "contract_id": contract_id,
-        "pdf_url": pdf_url,
-        "expires_in": "1 hour",
+        "pdf_url": presigned.url,
+        "expires_in": max(0, int(presigned.expires_at - time.time())),  # Seconds left
+        "expires_at": datetime.utcfromtimestamp(presigned.expires_at).isoformat() + "Z",
         "original_filename": contract.filename
     }
 
@@ -1600,6 +1513,7 @@ async def check_s3_health(
         "aws_region": settings.AWS_REGION,
         "s3_bucket": settings.S3_BUCKET_NAME,
         "s3_client_ready": s3_service.s3_client is not None,
+        "presigned_url_cache": s3_service.presigned_urls.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
     
@@ -1618,6 +1532,148 @@ async def check_s3_health(
     
     return status_info    
 
+@app.get("/api/health/extraction-cache")
+async def check_extraction_cache_health(
+    current_user: User = Depends(get_current_user)
+):
+    """Extraction cache size, hit/miss counters and hit rate (GPT calls avoided)"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+    
+    cache_stats = await run_in_threadpool(extraction_cache.stats)
+    cache_stats["timestamp"] = datetime.utcnow().isoformat()
+    return cache_stats
+
+@app.get("/api/health/llm")
+async def check_llm_health(
+    current_user: User = Depends(get_current_user)
+):
+    """LLM gateway limits and request/retry counters"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+    
+    gateway_stats = llm_gateway.stats()
+    gateway_stats["timestamp"] = datetime.utcnow().isoformat()
+    return gateway_stats
+
+@app.get("/api/health/activity-log")
+async def check_activity_log_health(
+    current_user: User = Depends(get_current_user)
+):
+    """Activity log write-behind queue depth and flushed/dropped counters"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+    
+    buffer_stats = activity_log_buffer.stats()
+    buffer_stats["timestamp"] = datetime.utcnow().isoformat()
+    return buffer_stats
+
+@app.get("/api/health/auth-cache")
+async def check_auth_cache_health(
+    current_user: User = Depends(get_current_user)
+):
+    """Principal cache hit rate and pending last-seen writes"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+    
+    return {
+        "principal_cache": principal_cache.stats(),
+        "last_seen": last_seen_tracker.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/api/health/copilot-context")
+async def check_copilot_context_health(
+    current_user: User = Depends(get_current_user)
+):
+    """Copilot caches (this worker): conversation passages and analytics SQL plans"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+    
+    return {
+        "conversation_cache": passage_index.conversation_cache.stats(),
+        "sql_plan_cache": sql_plan_cache.stats(),
+        "top_k": settings.COPILOT_PASSAGE_TOP_K,
+        "token_budget": settings.COPILOT_CONTEXT_TOKEN_BUDGET,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/api/health/dedup")
+async def check_dedup_health(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload dedupe by content hash: duplicate contracts in the portfolio and this worker's lookups"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+
+    return {
+        **dedup_stats(db),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@app.get("/api/health/portfolio-views")
+async def check_portfolio_views_health(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Materialized portfolio views (refresh state of this worker, last refresh of each view) and the dashboard cache"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+
+    refreshes = db.query(models.PortfolioViewRefresh).order_by(models.PortfolioViewRefresh.view_name).all()
+    return {
+        **portfolio_views.stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "last_refreshes": [{
+            "view_name": r.view_name,
+            "refreshed_at": r.refreshed_at.isoformat() if r.refreshed_at else None,
+            "duration_ms": r.duration_ms,
+            "row_count": r.row_count
+        } for r in refreshes],
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/api/health/db-pool")
+async def check_db_pool_health(
+    reset: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Database connection pool occupancy, checkout wait and hold times (this worker)"""
+    if current_user.role != "director":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Directors can check system health"
+        )
+    
+    pool_status = get_pool_status()
+    pool_status["timestamp"] = datetime.utcnow().isoformat()
+    if reset:
+        pool_metrics.reset()
+    return pool_status
+
 @app.get("/api/contracts/{contract_id}/comprehensive")
 async def get_comprehensive_data(
     contract_id: int, 
@@ -1693,66 +1749,7 @@ def is_user_assigned_to_contract(user_id: int, contract, db: Session) -> bool:
     """Check if a user is assigned to a contract"""
     if not contract:
         return False
-    
-    # Check PM assignments
-    if contract.assigned_pm_users:
-        if isinstance(contract.assigned_pm_users, list):
-            if user_id in contract.assigned_pm_users:
-                return True
-        elif isinstance(contract.assigned_pm_users, str):
-            # Try to parse as JSON or comma-separated
-            import json
-            try:
-                pm_list = json.loads(contract.assigned_pm_users)
-                if isinstance(pm_list, list) and user_id in pm_list:
-                    return True
-            except:
-                try:
-                    pm_ids = [int(id_str.strip()) for id_str in contract.assigned_pm_users.split(',') if id_str.strip().isdigit()]
-                    if user_id in pm_ids:
-                        return True
-                except:
-                    pass
-    
-    # Check PGM assignments
-    if contract.assigned_pgm_users:
-        if isinstance(contract.assigned_pgm_users, list):
-            if user_id in contract.assigned_pgm_users:
-                return True
-        elif isinstance(contract.assigned_pgm_users, str):
-            import json
-            try:
-                pgm_list = json.loads(contract.assigned_pgm_users)
-                if isinstance(pgm_list, list) and user_id in pgm_list:
-                    return True
-            except:
-                try:
-                    pgm_ids = [int(id_str.strip()) for id_str in contract.assigned_pgm_users.split(',') if id_str.strip().isdigit()]
-                    if user_id in pgm_ids:
-                        return True
-                except:
-                    pass
-    
-    # Check Director assignments
-    if contract.assigned_director_users:
-        if isinstance(contract.assigned_director_users, list):
-            if user_id in contract.assigned_director_users:
-                return True
-        elif isinstance(contract.assigned_director_users, str):
-            import json
-            try:
-                dir_list = json.loads(contract.assigned_director_users)
-                if isinstance(dir_list, list) and user_id in dir_list:
-                    return True
-            except:
-                try:
-                    dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                    if user_id in dir_ids:
-                        return True
-                except:
-                    pass
-    
-    return False
+    return get_assignment_resolver(db).is_assigned(user_id, contract)
     
 
 @app.post("/api/contracts/{contract_id}/project-manager/submit-review")
@@ -1878,15 +1875,7 @@ async def submit_contract_for_review(
 
         # Check both database columns and comprehensive_data for assigned users
         if contract.assigned_pgm_users:
-            if isinstance(contract.assigned_pgm_users, list):
-                assigned_program_managers = contract.assigned_pgm_users
-            elif isinstance(contract.assigned_pgm_users, str):
-                try:
-                    import json
-                    assigned_program_managers = json.loads(contract.assigned_pgm_users)
-                except:
-                    # Try comma-separated
-                    assigned_program_managers = [int(id_str.strip()) for id_str in contract.assigned_pgm_users.split(',') if id_str.strip().isdigit()]
+            assigned_program_managers = sorted(get_assignment_resolver(db).resolve(contract).pgm)
 
         # Also check comprehensive_data for assignments
         if not assigned_program_managers and contract.comprehensive_data:
@@ -2011,8 +2000,25 @@ async def fix_contract_metadata(
             "purpose": contract.purpose
         }
         
-        # Update fields that are provided
+        # Re-extract first (only sections changed since the last extraction reach
+        # the model), so the fields given explicitly below win over it
         update_fields = []
+        extraction_run = None
+        if metadata_update.reextract:
+            cleaned_text = page_store.get_contract_text(db, contract_id)
+            if not cleaned_text:
+                raise HTTPException(status_code=400, detail="No stored contract text to re-extract")
+            # The stored text is unchanged, so the chunk cache is bypassed: every chunk
+            # goes to the model again. Not committed yet: written with the version record below
+            extraction_run = await run_in_threadpool(
+                contract_ingestion.reextract_contract, db, contract, cleaned_text,
+                commit=False, use_cache=False
+            )
+            if extraction_run is None:
+                raise HTTPException(status_code=502, detail="Re-extraction failed")
+            update_fields = [field for field, value in old_values.items() if getattr(contract, field) != value]
+        
+        # Update fields that are provided
         if metadata_update.grant_name is not None:
             contract.grant_name = metadata_update.grant_name
             update_fields.append("grant_name")
@@ -2046,11 +2052,12 @@ async def fix_contract_metadata(
             update_fields.append("purpose")
         
         # If no fields were updated
-        if not update_fields:
+        if not update_fields and extraction_run is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="No fields to update"
             )
+        update_fields = list(dict.fromkeys(update_fields))
         
         # Get next version number
         last_version = db.query(models.ContractVersion).filter(
@@ -2073,7 +2080,8 @@ async def fix_contract_metadata(
                 "purpose": contract.purpose
             },
             "updated_fields": update_fields,
-            "notes": metadata_update.notes
+            "notes": metadata_update.notes,
+            "extraction_run": extraction_run
         }
         
         version = models.ContractVersion(
@@ -2130,13 +2138,158 @@ async def fix_contract_metadata(
             "message": "Metadata updated successfully",
             "contract_id": contract_id,
             "version_number": version_number,
-            "updated_fields": update_fields
+            "updated_fields": update_fields,
+            "extraction_run": extraction_run
         }
         
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to update metadata: {str(e)}")
 
+
+@app.post("/api/contracts/{contract_id}/project-manager/upload-version")
+async def upload_contract_version(
+    contract_id: int,
+    file: UploadFile = File(...),
+    notes: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    Upload a revised PDF of a contract - Project Manager (creator) only, in
+    'draft' or 'rejected' status. Only the sections that changed since the
+    last extraction are sent to the AI extractor.
+    """
+    if current_user.role != "project_manager":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Project Managers can upload contract versions"
+        )
+    
+    contract = db.query(models.Contract).filter(models.Contract.id == contract_id).first()
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    
+    if contract.created_by != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the contract creator can upload a new version"
+        )
+    
+    if contract.status not in ["draft", "rejected"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot update contract in '{contract.status}' status"
+        )
+    
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+    
+    upload = None
+    try:
+        upload = await spool_upload(file)
+        if upload.sha256 == contract.content_sha256:
+            raise HTTPException(status_code=400, detail="This PDF is identical to the current version")
+        
+        parsed = await run_in_threadpool(contract_ingestion.parse_pdf, upload.path)
+        cleaned_text = parsed["cleaned_text"]
+        
+        old_values = {
+            "filename": contract.filename,
+            "grant_name": contract.grant_name,
+            "contract_number": contract.contract_number,
+            "grantor": contract.grantor,
+            "grantee": contract.grantee,
+            "total_amount": contract.total_amount,
+            "start_date": contract.start_date,
+            "end_date": contract.end_date,
+            "purpose": contract.purpose
+        }
+        
+        embedded = await run_in_threadpool(contract_ingestion.embed_contract_text, cleaned_text)
+        
+        # Extraction, pages and the version record are committed together below
+        extraction_run = await run_in_threadpool(
+            contract_ingestion.reextract_contract, db, contract, cleaned_text,
+            parsed["extraction_result"].get("pages"), commit=False
+        )
+        if extraction_run is None:
+            raise HTTPException(status_code=502, detail="Extraction failed for the new version")
+        
+        contract.filename = file.filename
+        contract.content_sha256 = upload.sha256
+        contract.source_contract_id = None
+        
+        new_values = {field: getattr(contract, field) for field in old_values}
+        updated_fields = [field for field, value in old_values.items() if new_values[field] != value]
+        
+        last_version = db.query(models.ContractVersion).filter(
+            models.ContractVersion.contract_id == contract_id
+        ).order_by(models.ContractVersion.version_number.desc()).first()
+        version_number = (last_version.version_number + 1) if last_version else 1
+        
+        version = models.ContractVersion(
+            contract_id=contract_id,
+            version_number=version_number,
+            created_by=current_user.id,
+            contract_data={
+                "old_values": old_values,
+                "new_values": new_values,
+                "updated_fields": updated_fields,
+                "notes": notes,
+                "content_sha256": upload.sha256,
+                "extraction_run": extraction_run
+            },
+            changes_description=notes or f"New document version: {file.filename}",
+            version_type="document_update"
+        )
+        db.add(version)
+        contract.version = version_number
+        db.commit()
+        db.refresh(contract)
+        
+        await run_in_threadpool(
+            contract_ingestion.store_contract_pdf, db, contract, file.filename, upload.path, upload.sha256
+        )
+        contract_ingestion.index_contract_embedding(db, contract, cleaned_text, embedded)
+        
+        log_activity(
+            db,
+            current_user.id,
+            "upload_version",
+            contract_id=contract_id,
+            details={
+                "filename": file.filename,
+                "version_number": version_number,
+                "updated_fields": updated_fields,
+                "chunks_reused": extraction_run.get("chunks_reused", 0),
+                "chunk_count": extraction_run.get("chunk_count", 0)
+            },
+            request=request
+        )
+        
+        return {
+            "message": "Contract version uploaded successfully",
+            "contract_id": contract_id,
+            "version_number": version_number,
+            "updated_fields": updated_fields,
+            "extraction_run": extraction_run
+        }
+        
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to upload contract version: {str(e)}")
+    finally:
+        remove_spool(upload)
+        await file.close()
+
 @app.post("/api/contracts/{contract_id}/project-manager/respond-to-comments")
 async def respond_to_reviewer_comments(
     contract_id: int,
@@ -2338,38 +2491,47 @@ async def get_similar_contracts(
     request: Request = None
 ):
     """Find similar contracts"""
+    contract = db.query(models.Contract).filter(models.Contract.id == contract_id).first()
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    
     # Check permission for the main contract
-    if not check_permission(current_user, contract_id, "view", db):
+    if not check_contract_permission(current_user, contract, "view", db):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have permission to view this contract"
         )
     
-    contract = db.query(models.Contract).filter(models.Contract.id == contract_id).first()
-    if not contract:
-        raise HTTPException(status_code=404, detail="Contract not found")
-    
     # Get embedding for this contract
     if contract.chroma_id:
         vector_data = vector_store.get_by_contract_id(contract.id)
         if vector_data and vector_data.get("embedding"):
-            similar = vector_store.search_similar(vector_data["embedding"], n_results + 1)
+            # Only contracts the user created or is assigned to are searched
+            similar = vector_store.search_similar(
+                vector_data["embedding"],
+                n_results + 1,
+                where=vector_store.viewer_filter(current_user.id)
+            )
             # Filter out the current contract
             similar = [s for s in similar if s["contract_id"] != contract.id]
             
-            # Check permissions for similar contracts and get full details
+            # Load all candidates in one query, then apply the status-based rules
+            candidate_ids = [item["contract_id"] for item in similar]
+            candidates = {
+                c.id: c for c in db.query(models.Contract).filter(models.Contract.id.in_(candidate_ids)).all()
+            } if candidate_ids else {}
+            
             similar_contracts = []
-            for item in similar[:n_results]:
-                # Check if user has permission to view this similar contract
-                if check_permission(current_user, item["contract_id"], "view", db):
-                    similar_contract = db.query(models.Contract).filter(
-                        models.Contract.id == item["contract_id"]
-                    ).first()
-                    if similar_contract:
-                        similar_contracts.append({
-                            "contract": similar_contract,
-                            "similarity_score": item["similarity_score"]
-                        })
+            for item in similar:
+                similar_contract = candidates.get(item["contract_id"])
+                if similar_contract and check_contract_permission(current_user, similar_contract, "view", db):
+                    similar_contracts.append({
+                        "contract": similar_contract,
+                        "similarity_score": item["similarity_score"],
+                        "passage": item.get("passage")
+                    })
+                if len(similar_contracts) >= n_results:
+                    break
             
             # Log activity
             log_activity(
@@ -2398,30 +2560,9 @@ async def get_all_contracts(
     print(f"Current user: {current_user.username}, Role: {current_user.role}, ID: {current_user.id}")
     
     try:
-        # STRICT assignment-based filtering - FIXED VERSION
-        query = db.query(models.Contract)
-        
-        # For ALL roles, ONLY show contracts they are assigned to OR created
-        assigned_contract_ids = []
-        
-        # Get all contracts
-        all_contracts = db.query(models.Contract).all()
-        
-        for contract in all_contracts:
-            # Check if user is assigned to this contract
-            is_assigned = is_user_assigned_to_contract(current_user.id, contract, db)
-            is_creator = contract.created_by == current_user.id
-            
-            if is_assigned or is_creator:
-                assigned_contract_ids.append(contract.id)
-        
-        # Now filter query to ONLY show assigned/created contracts
-        if assigned_contract_ids:
-            query = query.filter(models.Contract.id.in_(assigned_contract_ids))
-        else:
-            # If no contracts assigned/created, return empty array
-            print(f"User {current_user.id} has no assigned/created contracts")
-            return []
+        # STRICT assignment-based filtering: ONLY contracts the user created or is
+        # assigned to, filtered and paginated in the database
+        query = db.query(models.Contract).filter(visible_to_user_clause(current_user.id))
         
         # Get contracts
         contracts = query.order_by(models.Contract.uploaded_at.desc()).offset(skip).limit(limit).all()
@@ -2548,17 +2689,15 @@ async def debug_user_assignments(
             })
             
             # Determine assignment role
-            if contract.assigned_pm_users and isinstance(contract.assigned_pm_users, list):
-                if user_id in contract.assigned_pm_users:
-                    assigned_contracts[-1]["assigned_as"].append("project_manager")
+            assignments = get_assignment_resolver(db).resolve(contract)
+            if user_id in assignments.pm:
+                assigned_contracts[-1]["assigned_as"].append("project_manager")
             
-            if contract.assigned_pgm_users and isinstance(contract.assigned_pgm_users, list):
-                if user_id in contract.assigned_pgm_users:
-                    assigned_contracts[-1]["assigned_as"].append("program_manager")
+            if user_id in assignments.pgm:
+                assigned_contracts[-1]["assigned_as"].append("program_manager")
             
-            if contract.assigned_director_users and isinstance(contract.assigned_director_users, list):
-                if user_id in contract.assigned_director_users:
-                    assigned_contracts[-1]["assigned_as"].append("director")
+            if user_id in assignments.director:
+                assigned_contracts[-1]["assigned_as"].append("director")
     
     return {
         "user": {
@@ -2878,22 +3017,7 @@ async def final_approval(
         raise HTTPException(status_code=404, detail="Contract not found")
 
     # ✅ FIX: Check if this director is assigned to the contract
-    is_assigned = False
-    if contract.assigned_director_users:
-        try:
-            if isinstance(contract.assigned_director_users, list):
-                is_assigned = current_user.id in contract.assigned_director_users
-            elif isinstance(contract.assigned_director_users, str):
-                import json
-                try:
-                    dir_list = json.loads(contract.assigned_director_users)
-                    if isinstance(dir_list, list):
-                        is_assigned = current_user.id in dir_list
-                except:
-                    dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                    is_assigned = current_user.id in dir_ids
-        except Exception as e:
-            print(f"Error checking director assignment: {e}")
+    is_assigned = current_user.id in get_assignment_resolver(db).resolve(contract).director
 
     if not is_assigned:
         raise HTTPException(
@@ -2975,25 +3099,38 @@ async def extract_from_text(
     current_user: User = Depends(get_current_user)
 ):
     """Extract data from raw text (for testing) - Requires authentication"""
-    extracted_data = ai_extractor.extract_contract_data(request_data.text)
+    extracted_data = await run_in_threadpool(ai_extractor.extract_contract_data, request_data.text)
     return {"extracted_data": extracted_data}
 
 @app.get("/search/")
 async def semantic_search(
     query: str, 
     n_results: int = 5,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Semantic search using ChromaDB - Requires authentication"""
     # Get embedding for query
-    query_embedding = ai_extractor.get_embedding(query)
+    query_embedding = await ai_extractor.aget_embedding(query)
     
-    # Search in ChromaDB
+    # Search in ChromaDB, restricted to contracts visible to the user
     search_results = vector_store.search_similar(
         query_embedding=query_embedding,
-        n_results=n_results
+        n_results=n_results,
+        where=vector_store.viewer_filter(current_user.id)
     )
     
+    # Re-check the status-based rules against the rows (one query for all hits)
+    result_ids = [item["contract_id"] for item in search_results]
+    contracts = {
+        c.id: c for c in db.query(models.Contract).filter(models.Contract.id.in_(result_ids)).all()
+    } if result_ids else {}
+    search_results = [
+        item for item in search_results
+        if item["contract_id"] in contracts
+        and check_contract_permission(current_user, contracts[item["contract_id"]], "view", db)
+    ]
+    
     return {
         "query": query,
         "results": search_results
@@ -3240,183 +3377,36 @@ async def update_contract_status_endpoint(
     }
 
 
-@app.get("/api/contracts/status/under_review")
-async def get_contracts_under_review(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get all contracts under review - Program Manager can see only contracts assigned to them"""
-    print("\n" + "="*80)
-    # print(f"🔍 DEBUG: get_contracts_under_review called")
-    # print(f"🔍 DEBUG: Current user: ID={current_user.id}, Username={current_user.username}, Role={current_user.role}")
-    # print(f"🔍 DEBUG: Request params: skip={skip}, limit={limit}")
-    print("="*80)
-    
-    if current_user.role != "program_manager":
-        # print(f"❌ DEBUG: Access denied - User role is {current_user.role}, not program_manager")
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only Program Managers can view contracts under review"
-        )
-    
-    try:
-        # Get ALL contracts with status 'under_review'
-        all_under_review = db.query(models.Contract).filter(
-            models.Contract.status == "under_review"
-        ).all()
-        
-        # print(f"\n📊 DEBUG: Found {len(all_under_review)} total contracts with status='under_review'")
-        
-        if len(all_under_review) == 0:
-            # print("⚠️ DEBUG: No contracts found with status 'under_review'")
-            # print("📋 DEBUG: Available contract statuses in database:")
-            all_statuses = db.query(models.Contract.status).distinct().all()
-            for status in all_statuses:
-                count = db.query(models.Contract).filter(models.Contract.status == status[0]).count()
-                print(f"   - {status[0]}: {count} contracts")
-        
-        # Filter to only show contracts assigned to this Program Manager
-        assigned_contracts = []
-        
-        for idx, contract in enumerate(all_under_review):
-            print(f"\n{'─'*50}")
-            # print(f"📄 DEBUG: Contract #{idx+1} - ID: {contract.id}")
-            print(f"   Grant Name: {contract.grant_name}")
-            print(f"   Filename: {contract.filename}")
-            print(f"   Status: {contract.status}")
-            print(f"   Created By: {contract.created_by}")
-            
-            # Check if this Program Manager is assigned to this contract
-            is_assigned = False
-            assignment_source = "Not assigned"
-            
-            # ============ CHECK assigned_pgm_users FIELD ============
-            if contract.assigned_pgm_users:
-                print(f"\n   📌 assigned_pgm_users field:")
-                print(f"      Value: {contract.assigned_pgm_users}")
-                print(f"      Type: {type(contract.assigned_pgm_users).__name__}")
-                
-                try:
-                    if isinstance(contract.assigned_pgm_users, list):
-                        print(f"      List contents: {contract.assigned_pgm_users}")
-                        if current_user.id in contract.assigned_pgm_users:
-                            is_assigned = True
-                            assignment_source = "assigned_pgm_users (list)"
-                            print(f"      ✅ User {current_user.id} FOUND in list!")
-                        else:
-                            print(f"      ❌ User {current_user.id} NOT in list: {contract.assigned_pgm_users}")
-                    
-                    elif isinstance(contract.assigned_pgm_users, str):
-                        print(f"      String value: '{contract.assigned_pgm_users}'")
-                        
-                        # Try to parse as JSON
-                        import json
-                        try:
-                            pgm_list = json.loads(contract.assigned_pgm_users)
-                            print(f"      Parsed as JSON: {pgm_list} (type: {type(pgm_list).__name__})")
-                            if isinstance(pgm_list, list):
-                                if current_user.id in pgm_list:
-                                    is_assigned = True
-                                    assignment_source = "assigned_pgm_users (JSON string)"
-                                    print(f"      ✅ User {current_user.id} FOUND in JSON list!")
-                                else:
-                                    print(f"      ❌ User {current_user.id} NOT in JSON list: {pgm_list}")
-                            else:
-                                print(f"      ⚠️ Parsed JSON is not a list: {pgm_list}")
-                        except json.JSONDecodeError as e:
-                            print(f"      ⚠️ Not valid JSON: {e}")
-                            
-                            # Try comma-separated
-                            try:
-                                pgm_ids = [int(id_str.strip()) for id_str in contract.assigned_pgm_users.split(',') if id_str.strip().isdigit()]
-                                print(f"      Parsed as comma-separated: {pgm_ids}")
-                                if current_user.id in pgm_ids:
-                                    is_assigned = True
-                                    assignment_source = "assigned_pgm_users (comma-separated)"
-                                    print(f"      ✅ User {current_user.id} FOUND in comma-separated list!")
-                                else:
-                                    print(f"      ❌ User {current_user.id} NOT in comma-separated list: {pgm_ids}")
-                            except Exception as e2:
-                                print(f"      ⚠️ Failed to parse as comma-separated: {e2}")
-                except Exception as e:
-                    print(f"      ❌ Error checking assigned_pgm_users: {e}")
-            else:
-                print(f"\n   📌 assigned_pgm_users field: None/Empty")
-            
-            # ============ CHECK COMPREHENSIVE DATA ============
-            if contract.comprehensive_data:
-                print(f"\n   📌 comprehensive_data present:")
-                
-                # Check assigned_users.pgm_users
-                if "assigned_users" in contract.comprehensive_data:
-                    assigned_users = contract.comprehensive_data["assigned_users"]
-                    print(f"      assigned_users: {assigned_users}")
-                    
-                    if assigned_users and "pgm_users" in assigned_users:
-                        pgm_users = assigned_users["pgm_users"]
-                        print(f"      pgm_users: {pgm_users} (type: {type(pgm_users).__name__})")
-                        
-                        if isinstance(pgm_users, list):
-                            if current_user.id in pgm_users:
-                                is_assigned = True
-                                assignment_source = "comprehensive_data.assigned_users.pgm_users"
-                                print(f"      ✅ User {current_user.id} FOUND in comprehensive_data.assigned_users.pgm_users!")
-                            else:
-                                print(f"      ❌ User {current_user.id} NOT in pgm_users list: {pgm_users}")
-                
-                # Check agreement_metadata.assigned_pgm_users
-                if "agreement_metadata" in contract.comprehensive_data:
-                    metadata = contract.comprehensive_data["agreement_metadata"]
-                    print(f"      agreement_metadata: {metadata}")
-                    
-                    if metadata and "assigned_pgm_users" in metadata:
-                        pgm_users = metadata["assigned_pgm_users"]
-                        print(f"      assigned_pgm_users: {pgm_users} (type: {type(pgm_users).__name__})")
-                        
-                        if isinstance(pgm_users, list):
-                            if current_user.id in pgm_users:
-                                is_assigned = True
-                                assignment_source = "comprehensive_data.agreement_metadata.assigned_pgm_users"
-                                print(f"      ✅ User {current_user.id} FOUND in comprehensive_data.agreement_metadata.assigned_pgm_users!")
-                            else:
-                                print(f"      ❌ User {current_user.id} NOT in assigned_pgm_users list: {pgm_users}")
-            else:
-                print(f"\n   📌 comprehensive_data: None")
-            
-            # ============ CHECK ASSIGNMENT HISTORY ============
-            if not is_assigned and contract.comprehensive_data and "assignment_history" in contract.comprehensive_data:
-                print(f"\n   📌 Checking assignment_history:")
-                assignment_history = contract.comprehensive_data["assignment_history"]
-                print(f"      History entries: {len(assignment_history)}")
-                
-                for entry_idx, entry in enumerate(assignment_history):
-                    if "assigned_users" in entry:
-                        assigned_users = entry["assigned_users"]
-                        print(f"      Entry {entry_idx}: assigned_users = {assigned_users}")
-                        
-                        if isinstance(assigned_users, list):
-                            if current_user.id in assigned_users:
-                                is_assigned = True
-                                assignment_source = f"assignment_history[{entry_idx}]"
-                                print(f"      ✅ User {current_user.id} FOUND in assignment_history!")
-                                print(f"         Assigned by: {entry.get('assigned_by_name', 'Unknown')}")
-                                print(f"         Assigned at: {entry.get('assigned_at', 'Unknown')}")
-            
-            if is_assigned:
-                print(f"\n   ✅ FINAL: Contract {contract.id} IS assigned to user {current_user.id}")
-                print(f"      Assignment source: {assignment_source}")
-                assigned_contracts.append(contract)
-            else:
-                print(f"\n   ❌ FINAL: Contract {contract.id} IS NOT assigned to user {current_user.id}")
-        
-        print(f"\n{'='*50}")
-        print(f"📊 DEBUG FINAL: User {current_user.id} has {len(assigned_contracts)} assigned contracts under review")
-        print(f"{'='*50}\n")
+@app.get("/api/contracts/status/under_review")
+async def get_contracts_under_review(
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get all contracts under review - Program Manager can see only contracts assigned to them"""
+    print("\n" + "="*80)
+    # print(f"🔍 DEBUG: get_contracts_under_review called")
+    # print(f"🔍 DEBUG: Current user: ID={current_user.id}, Username={current_user.username}, Role={current_user.role}")
+    # print(f"🔍 DEBUG: Request params: skip={skip}, limit={limit}")
+    print("="*80)
+    
+    if current_user.role != "program_manager":
+        # print(f"❌ DEBUG: Access denied - User role is {current_user.role}, not program_manager")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only Program Managers can view contracts under review"
+        )
+    
+    try:
+        # Contracts under review assigned to this Program Manager (via assigned_pgm_users,
+        # comprehensive_data assignment copies or assignment_history), paginated in SQL
+        contracts = db.query(models.Contract).filter(
+            models.Contract.status == "under_review",
+            pgm_review_assignment_clause(current_user.id)
+        ).order_by(models.Contract.id).offset(skip).limit(limit).all()
         
-        # Apply pagination
-        contracts = assigned_contracts[skip:skip + limit]
+        print(f"📊 User {current_user.id} has {len(contracts)} assigned contracts under review (page skip={skip}, limit={limit})")
         
         # Helper function to safely format dates
         def format_date(date_value):
@@ -5003,22 +4993,7 @@ async def director_final_approval(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # ✅ FIX: Check if this director is assigned to the contract
-    is_assigned = False
-    if contract.assigned_director_users:
-        try:
-            if isinstance(contract.assigned_director_users, list):
-                is_assigned = current_user.id in contract.assigned_director_users
-            elif isinstance(contract.assigned_director_users, str):
-                import json
-                try:
-                    dir_list = json.loads(contract.assigned_director_users)
-                    if isinstance(dir_list, list):
-                        is_assigned = current_user.id in dir_list
-                except:
-                    dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                    is_assigned = current_user.id in dir_ids
-        except Exception as e:
-            print(f"Error checking director assignment: {e}")
+    is_assigned = current_user.id in get_assignment_resolver(db).resolve(contract).director
     
     if not is_assigned:
         raise HTTPException(
@@ -5130,16 +5105,7 @@ async def director_final_approval(
         ).distinct(ReviewComment.user_id).all()
         
         # Also check assigned_pgm_users
-        assigned_pgm_users = []
-        if contract.assigned_pgm_users:
-            if isinstance(contract.assigned_pgm_users, list):
-                assigned_pgm_users = contract.assigned_pgm_users
-            elif isinstance(contract.assigned_pgm_users, str):
-                try:
-                    import json
-                    assigned_pgm_users = json.loads(contract.assigned_pgm_users)
-                except:
-                    assigned_pgm_users = [int(id_str.strip()) for id_str in contract.assigned_pgm_users.split(',') if id_str.strip().isdigit()]
+        assigned_pgm_users = sorted(get_assignment_resolver(db).resolve(contract).pgm)
         
         # Combine both lists and remove duplicates
         all_pgm_users = list(set([review.user_id for review in program_manager_reviews] + assigned_pgm_users))
@@ -5282,22 +5248,7 @@ async def director_view_complete_contract(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # ✅ FIX: Check if this director is assigned to the contract
-    is_assigned = False
-    if contract.assigned_director_users:
-        try:
-            if isinstance(contract.assigned_director_users, list):
-                is_assigned = current_user.id in contract.assigned_director_users
-            elif isinstance(contract.assigned_director_users, str):
-                import json
-                try:
-                    dir_list = json.loads(contract.assigned_director_users)
-                    if isinstance(dir_list, list):
-                        is_assigned = current_user.id in dir_list
-                except:
-                    dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                    is_assigned = current_user.id in dir_ids
-        except Exception as e:
-            print(f"Error checking director assignment: {e}")
+    is_assigned = current_user.id in get_assignment_resolver(db).resolve(contract).director
     
     if not is_assigned:
         raise HTTPException(
@@ -5424,28 +5375,11 @@ async def get_director_assigned_approvals_count(
         ).all()
         
         assigned_count = 0
+        resolver = get_assignment_resolver(db)
         
         for contract in all_reviewed_contracts:
             # Check if current director is assigned
-            is_assigned = False
-            
-            if contract.assigned_director_users:
-                try:
-                    if isinstance(contract.assigned_director_users, list):
-                        is_assigned = current_user.id in contract.assigned_director_users
-                    elif isinstance(contract.assigned_director_users, str):
-                        import json
-                        try:
-                            dir_list = json.loads(contract.assigned_director_users)
-                            if isinstance(dir_list, list):
-                                is_assigned = current_user.id in dir_list
-                        except:
-                            dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                            is_assigned = current_user.id in dir_ids
-                except Exception as e:
-                    print(f"Error checking director assignment for count: {e}")
-            
-            if is_assigned:
+            if current_user.id in resolver.resolve(contract).director:
                 assigned_count += 1
         
         return {
@@ -5484,31 +5418,11 @@ async def get_director_dashboard_contracts(
         all_contracts = db.query(models.Contract).all()
         
         assigned_contracts = []
+        resolver = get_assignment_resolver(db)
         
         for contract in all_contracts:
             # Check if current director is assigned
-            is_assigned = False
-            
-            # Check assigned_director_users
-            if contract.assigned_director_users:
-                try:
-                    if isinstance(contract.assigned_director_users, list):
-                        if current_user.id in contract.assigned_director_users:
-                            is_assigned = True
-                    elif isinstance(contract.assigned_director_users, str):
-                        # Try to parse as JSON
-                        import json
-                        try:
-                            dir_list = json.loads(contract.assigned_director_users)
-                            if isinstance(dir_list, list) and current_user.id in dir_list:
-                                is_assigned = True
-                        except:
-                            # Try comma-separated
-                            dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                            if current_user.id in dir_ids:
-                                is_assigned = True
-                except Exception as e:
-                    print(f"Error checking Director assignment for contract {contract.id}: {e}")
+            is_assigned = current_user.id in resolver.resolve(contract).director
             
             # Directors can ONLY see assigned contracts, NOT all contracts
             if is_assigned:
@@ -5630,34 +5544,12 @@ async def get_contracts_for_director_approval(
         # print(f"DEBUG: Found {len(all_reviewed_contracts)} contracts in 'reviewed' status")
         
         assigned_to_current_director = []
+        resolver = get_assignment_resolver(db)
         
         for contract in all_reviewed_contracts:
             # Check if current director is assigned to this contract
-            is_assigned = False
-            
-            # Check assigned_director_users
-            if contract.assigned_director_users:
-                try:
-                    if isinstance(contract.assigned_director_users, list):
-                        if current_user.id in contract.assigned_director_users:
-                            is_assigned = True
-                            print(f"  ✅ Contract {contract.id} assigned to Director {current_user.id} (list)")
-                    elif isinstance(contract.assigned_director_users, str):
-                        # Try to parse as JSON
-                        import json
-                        try:
-                            dir_list = json.loads(contract.assigned_director_users)
-                            if isinstance(dir_list, list) and current_user.id in dir_list:
-                                is_assigned = True
-                                print(f"  ✅ Contract {contract.id} assigned to Director {current_user.id} (JSON string)")
-                        except:
-                            # Try comma-separated
-                            dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                            if current_user.id in dir_ids:
-                                is_assigned = True
-                                print(f"  ✅ Contract {contract.id} assigned to Director {current_user.id} (comma-separated)")
-                except Exception as e:
-                    print(f"  ❌ Error checking Director users for contract {contract.id}: {e}")
+            director_ids = resolver.resolve(contract).director
+            is_assigned = current_user.id in director_ids
             
             if is_assigned:
                 # Get program manager review info
@@ -5671,16 +5563,7 @@ async def get_contracts_for_director_approval(
                 # Check if any other directors are also assigned
                 other_directors_assigned = []
                 if contract.assigned_director_users:
-                    if isinstance(contract.assigned_director_users, list):
-                        director_ids = contract.assigned_director_users
-                    elif isinstance(contract.assigned_director_users, str):
-                        try:
-                            import json
-                            director_ids = json.loads(contract.assigned_director_users)
-                        except:
-                            director_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                    
-                    for dir_id in director_ids:
+                    for dir_id in sorted(director_ids):
                         if dir_id != current_user.id:
                             dir_user = db.query(User).filter(User.id == dir_id).first()
                             if dir_user:
@@ -5709,7 +5592,7 @@ async def get_contracts_for_director_approval(
                     "priority": determine_priority(pm_review, contract.total_amount),
                     "assigned_to_current_director": True,
                     "other_directors_assigned": other_directors_assigned,
-                    "total_assigned_directors": len(director_ids) if 'director_ids' in locals() else 1
+                    "total_assigned_directors": len(director_ids)
                 })
             else:
                 print(f"  ❌ Contract {contract.id} NOT assigned to Director {current_user.id}")
@@ -5787,6 +5670,7 @@ def determine_priority(pm_review, total_amount):
 @app.get("/api/deliverables/{deliverable_id}/file")
 async def get_deliverable_file(
     deliverable_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -5830,15 +5714,31 @@ async def get_deliverable_file(
             )
         
         # Check if file exists
-        if not deliverable.uploaded_file_path and not deliverable.file_data:
+        if not deliverable.uploaded_file_path and not deliverable.file_data and not deliverable.blob_key:
             raise HTTPException(status_code=404, detail="No file uploaded for this deliverable")
         
+        file_name = deliverable.uploaded_file_name or (deliverable.file_data or {}).get('filename', 'file')
+        
+        # Case 0: File is in blob storage - streamed with Range/ETag support
+        if deliverable.blob_key:
+            info = await run_in_threadpool(blob_storage.head, deliverable.blob_key)
+            if not info:
+                raise HTTPException(status_code=404, detail="File not found in storage")
+            content_type = (deliverable.file_data or {}).get('content_type') or info.content_type
+            return blob_response(
+                request, info,
+                lambda start, end, chunk_size: blob_storage.iter_range(info.key, start, end, chunk_size),
+                file_name,
+                media_type=content_type,
+                content_disposition_type="inline"
+            )
+        
         # Case 1: File is stored in S3
         if deliverable.uploaded_file_path and deliverable.uploaded_file_path.startswith('http'):
             # Redirect to S3 URL
             return RedirectResponse(url=deliverable.uploaded_file_path)
         
-        # Case 2: File is stored in database (base64)
+        # Case 2: File is stored in database (base64 - legacy, see migrate_blob_storage.py)
         elif deliverable.file_data and deliverable.file_data.get('base64_content'):
             import base64
             from io import BytesIO
@@ -5864,22 +5764,13 @@ async def get_deliverable_file(
         # Case 3: Local file system (legacy - should be migrated)
         elif deliverable.uploaded_file_path and os.path.exists(deliverable.uploaded_file_path):
             try:
-                with open(deliverable.uploaded_file_path, 'rb') as f:
-                    file_content = f.read()
-                
-                # Determine content type
-                import mimetypes
-                content_type = mimetypes.guess_type(deliverable.uploaded_file_path)[0] or 'application/octet-stream'
-                
-                return Response(
-                    content=file_content,
-                    media_type=content_type,
-                    headers={
-                        "Content-Disposition": f"inline; filename=\"{deliverable.uploaded_file_name}\"",
-                        "Cache-Control": "no-cache, no-store, must-revalidate",
-                        "Pragma": "no-cache",
-                        "Expires": "0"
-                    }
+                file_path = deliverable.uploaded_file_path
+                info = file_blob_info(file_path)
+                return blob_response(
+                    request, info,
+                    lambda start, end, chunk_size: iter_file_range(file_path, start, end, chunk_size),
+                    file_name,
+                    content_disposition_type="inline"
                 )
             except FileNotFoundError:
                 raise HTTPException(status_code=404, detail="File not found on server")
@@ -5991,98 +5882,102 @@ _ALLOWED_VIEWS = {
 
 
 def _is_safe_sql(sql: str) -> bool:
-    """Only allow plain SELECT queries against whitelisted views."""
-    from sqlalchemy import text as sa_text
-    s = sql.strip().upper()
-    if not s.startswith("SELECT"):
-        return False
-    forbidden = ["INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE",
-                 "TRUNCATE", "GRANT", "REVOKE", "EXECUTE", "CALL", "--", ";"]
-    return not any(kw in s for kw in forbidden)
+    """Only allow plain SELECT queries against whitelisted views (see app/sql_guard.py)."""
+    return is_safe_select(sql, _ALLOWED_VIEWS)
 
 
-@app.post("/api/copilot/chat")
-async def copilot_chat(
+def _copilot_document_context(
     request: schemas.CopilotChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Dual-mode copilot:
-      - contract_id provided → Document RAG (answer from the PDF text)
-      - contract_id absent   → Portfolio Analytics (Text-to-SQL over DB views)
-    """
-    from app.models import Contract
-    from sqlalchemy import text as sa_text
+    contract: models.Contract,
+    current_user: User,
+    db: Session,
+    query_embedding: Optional[List[float]]
+) -> Dict[str, Any]:
+    """Chat messages and response metadata for document mode (permission checked by the caller)"""
+    conversation_id = request.conversation_id or uuid4().hex
+    # Only the passages relevant to this question (plus those already used in the conversation)
+    context = passage_index.select_context(
+        db, contract.id, request.message,
+        query_embedding=query_embedding,
+        conversation_id=conversation_id,
+        user_id=current_user.id
+    )
 
-    if not ai_extractor or not ai_extractor.client:
-        raise HTTPException(status_code=503, detail="AI service not available")
+    structured_summary = ""
+    if contract.comprehensive_data:
+        try:
+            summary_fields = {
+                k: contract.comprehensive_data[k]
+                for k in ["parties", "contract_details", "financial_details",
+                           "deliverables", "reporting_requirements"]
+                if k in contract.comprehensive_data
+            }
+            structured_summary = json.dumps(summary_fields, separators=(",", ":"), default=str)[:8000]
+        except Exception:
+            pass
+
+    # Fixed parts first: passages only get appended between turns, so the prompt prefix stays the same
+    context_block = ""
+    if structured_summary:
+        context_block += f"\n\n--- STRUCTURED EXTRACTION ---\n{structured_summary}"
+    if context and context["passages"]:
+        context_block += f"\n\n--- RELEVANT CONTRACT PASSAGES ---\n{passage_index.render_passages(context['passages'])}"
+    elif contract.full_text:
+        # Contracts stored before the page store: only the preview is available
+        context_block += f"\n\n--- CONTRACT TEXT (PREVIEW) ---\n{contract.full_text}"
+
+    contract_name = contract.grant_name or contract.filename or f"Contract #{contract.id}"
+
+    system_prompt = (
+        f"You are a helpful AI assistant specializing in grant contract analysis.\n"
+        f"You are answering questions about: \"{contract_name}\".\n"
+        f"Answer ONLY based on the contract content below (excerpts of the contract). "
+        f"If information is not found, say so clearly. "
+        f"Cite specific sections or clauses when possible."
+        f"{context_block}"
+    )
 
-    # ─────────────────────────────────────────────────────────────
-    # MODE 1 — Document RAG
-    # ─────────────────────────────────────────────────────────────
-    if request.contract_id is not None:
-        contract = db.query(Contract).filter(Contract.id == request.contract_id).first()
-        if not contract:
-            raise HTTPException(status_code=404, detail="Contract not found")
+    messages = [{"role": "system", "content": system_prompt}]
+    for msg in request.chat_history:
+        messages.append({"role": msg.role, "content": msg.content})
+    messages.append({"role": "user", "content": request.message})
+
+    return {
+        "messages": messages,
+        "metadata": {
+            "mode": "document",
+            "contract_id": contract.id,
+            "contract_name": contract_name,
+            "conversation_id": conversation_id,
+            "passages": [
+                {k: p[k] for k in ("passage_index", "heading", "char_start", "char_end")}
+                for p in (context or {}).get("passages", [])
+            ],
+            "context_tokens": (context or {}).get("tokens", 0),
+        }
+    }
 
-        MAX_CHARS = 60000
-        full_text = (contract.full_text or "")[:MAX_CHARS]
 
-        structured_summary = ""
-        if contract.comprehensive_data:
-            try:
-                summary_fields = {
-                    k: contract.comprehensive_data[k]
-                    for k in ["parties", "contract_details", "financial_details",
-                               "deliverables", "reporting_requirements"]
-                    if k in contract.comprehensive_data
-                }
-                structured_summary = json.dumps(summary_fields, indent=2)[:8000]
-            except Exception:
-                pass
-
-        context_block = ""
-        if full_text:
-            context_block += f"\n\n--- CONTRACT FULL TEXT ---\n{full_text}"
-        if structured_summary:
-            context_block += f"\n\n--- STRUCTURED EXTRACTION ---\n{structured_summary}"
-
-        contract_name = contract.grant_name or contract.filename or f"Contract #{contract.id}"
-
-        system_prompt = (
-            f"You are a helpful AI assistant specializing in grant contract analysis.\n"
-            f"You are answering questions about: \"{contract_name}\".\n"
-            f"Answer ONLY based on the contract content below. "
-            f"If information is not found, say so clearly. "
-            f"Cite specific sections or clauses when possible."
-            f"{context_block}"
-        )
+async def _load_copilot_contract(
+    request: schemas.CopilotChatRequest,
+    current_user: User,
+    db: Session
+):
+    """Document mode: load and permission-check the contract, and embed the question"""
+    contract = db.query(models.Contract).filter(models.Contract.id == request.contract_id).first()
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
 
-        messages = [{"role": "system", "content": system_prompt}]
-        for msg in request.chat_history:
-            messages.append({"role": msg.role, "content": msg.content})
-        messages.append({"role": "user", "content": request.message})
+    if not check_contract_permission(current_user, contract, "view", db):
+        raise HTTPException(status_code=403, detail="You don't have permission to view this contract")
 
-        try:
-            completion = ai_extractor.client.chat.completions.create(
-                model="gpt-4o", messages=messages, temperature=0.3, max_tokens=1200,
-            )
-            return {
-                "response": completion.choices[0].message.content,
-                "mode": "document",
-                "contract_id": contract.id,
-                "contract_name": contract_name,
-            }
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
+    query_embedding = await ai_extractor.aget_embedding(request.message) if contract.chroma_id else None
+    return contract, query_embedding
 
-    # ─────────────────────────────────────────────────────────────
-    # MODE 2 — Portfolio Analytics (Text-to-SQL)
-    # ─────────────────────────────────────────────────────────────
 
-    # Stage 1: ask GPT-4o to generate SQL from the question
-    sql_gen_messages = [
+def _copilot_sql_messages(question: str) -> List[Dict[str, str]]:
+    """Stage 1 prompt: generate SQL over the copilot views"""
+    return [
         {
             "role": "system",
             "content": (
@@ -6096,42 +5991,87 @@ async def copilot_chat(
                 "- If the question cannot be answered with these views, reply exactly: CANNOT_ANSWER"
             ),
         },
-        {"role": "user", "content": request.message},
+        {"role": "user", "content": question},
     ]
 
+
+_CANNOT_ANSWER_RESPONSE = (
+    "I can answer questions about your grant portfolio using live data — "
+    "such as financial summaries, overdue reports, risk exposure, and upcoming deadlines. "
+    "Could you rephrase your question?"
+)
+
+
+def _clean_generated_sql(raw_sql: str) -> str:
+    # Strip any accidental markdown fences
+    return raw_sql.replace("```sql", "").replace("```", "").strip()
+
+
+async def _plan_copilot_sql(question: str, db: Session) -> Optional[SqlPlan]:
+    """
+    Stage 1: SQL for the question, from the plan cache (templates, then
+    exact and similar earlier questions) or generated by the model.
+    None means the question can't be answered from the views.
+    """
+    sql_plan_cache.check_schema(db, sorted(_ALLOWED_VIEWS), _VIEWS_SCHEMA)
+
+    plan = sql_plan_cache.match_template(question) or sql_plan_cache.get_exact(question)
+    if plan:
+        return plan
+
+    embedding = await ai_extractor.aget_embedding(question) if sql_plan_cache.enabled else None
+    plan = sql_plan_cache.get_similar(question, embedding)
+    if plan:
+        return plan
+
     try:
-        sql_resp = ai_extractor.client.chat.completions.create(
-            model="gpt-4o", messages=sql_gen_messages, temperature=0, max_tokens=300,
+        sql_resp = await llm_gateway.achat(
+            model=settings.COPILOT_MODEL, messages=_copilot_sql_messages(question), temperature=0, max_tokens=300,
         )
         raw_sql = sql_resp.choices[0].message.content.strip()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
 
     if raw_sql == "CANNOT_ANSWER":
-        return {
-            "response": (
-                "I can answer questions about your grant portfolio using live data — "
-                "such as financial summaries, overdue reports, risk exposure, and upcoming deadlines. "
-                "Could you rephrase your question?"
-            ),
-            "mode": "analytics",
-        }
+        return None
+    return SqlPlan(sql=_clean_generated_sql(raw_sql), params={}, source="generated", embedding=embedding)
 
-    # Strip any accidental markdown fences
-    raw_sql = raw_sql.replace("```sql", "").replace("```", "").strip()
 
+def _run_copilot_query(db: Session, question: str, plan: SqlPlan) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Stage 2: safety-check and execute the planned SQL against the materialized
+    views; generated plans are cached once they run. Returns (rows,
+    data_refreshed_at), the latter None when the live views were read.
+    """
+    from sqlalchemy import text as sa_text
+
+    raw_sql = plan.sql
     if not _is_safe_sql(raw_sql):
         raise HTTPException(status_code=400, detail="Generated query failed safety check.")
 
-    # Stage 2: execute the query
+    sql, materialized = portfolio_views.materialized_sql(raw_sql)
     try:
-        result = db.execute(sa_text(raw_sql + " LIMIT 200"))
-        columns = list(result.keys())
-        rows = [dict(zip(columns, row)) for row in result.fetchall()]
+        if settings.COPILOT_SQL_ROLE:
+            # Read-only role granted SELECT on the views only; SET LOCAL ends with the transaction
+            db.execute(sa_text(f'SET LOCAL ROLE "{settings.COPILOT_SQL_ROLE}"'))
+        result = db.execute(sa_text(sql + " LIMIT 200"), plan.params)
+        columns = [column for column in result.keys() if column != "mv_row_id"]
+        rows = [{column: row._mapping[column] for column in columns} for row in result.fetchall()]
+        if settings.COPILOT_SQL_ROLE:
+            db.execute(sa_text("RESET ROLE"))
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"Query execution failed: {str(e)}")
 
-    # Stage 3: format results as natural language
+    if plan.source == "generated":
+        sql_plan_cache.store(question, raw_sql, plan.embedding)
+
+    refreshed_at = portfolio_views.refreshed_at(db) if materialized else None
+    return rows, refreshed_at.isoformat() if refreshed_at else None
+
+
+def _copilot_format_messages(request: schemas.CopilotChatRequest, rows: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Stage 3 prompt: format the query results as natural language"""
     data_str = json.dumps(rows, indent=2, default=str)[:8000]
     format_messages = [
         {"role": "system", "content": _ANALYTICS_SYSTEM},
@@ -6148,20 +6088,158 @@ async def copilot_chat(
             f"If the result is empty, explain what that means in context."
         ),
     })
+    return format_messages
+
+
+@app.post("/api/copilot/chat")
+async def copilot_chat(
+    request: schemas.CopilotChatRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Dual-mode copilot:
+      - contract_id provided → Document RAG (answer from the PDF text)
+      - contract_id absent   → Portfolio Analytics (Text-to-SQL over DB views)
+    See /api/copilot/chat/stream for the streaming variant.
+    """
+    if not llm_gateway.is_configured:
+        raise HTTPException(status_code=503, detail="AI service not available")
+
+    # ─────────────────────────────────────────────────────────────
+    # MODE 1 — Document RAG
+    # ─────────────────────────────────────────────────────────────
+    if request.contract_id is not None:
+        contract, query_embedding = await _load_copilot_contract(request, current_user, db)
+        # Passage loading and ranking hit the database and run BM25: keep them off the event loop
+        document = await run_in_threadpool(
+            _copilot_document_context, request, contract, current_user, db, query_embedding
+        )
+
+        try:
+            completion = await llm_gateway.achat(
+                model=settings.COPILOT_MODEL, messages=document["messages"], temperature=0.3, max_tokens=1200,
+            )
+            return {"response": completion.choices[0].message.content, **document["metadata"]}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
+
+    # ─────────────────────────────────────────────────────────────
+    # MODE 2 — Portfolio Analytics (Text-to-SQL)
+    # ─────────────────────────────────────────────────────────────
+
+    # Stage 1: SQL from the plan cache, or ask GPT-4o to generate it from the question
+    plan = await _plan_copilot_sql(request.message, db)
+    if plan is None:
+        return {"response": _CANNOT_ANSWER_RESPONSE, "mode": "analytics"}
+
+    # Stage 2: execute the query
+    rows, data_refreshed_at = await run_in_threadpool(_run_copilot_query, db, request.message, plan)
 
+    # Stage 3: format results as natural language
     try:
-        fmt_resp = ai_extractor.client.chat.completions.create(
-            model="gpt-4o", messages=format_messages, temperature=0.3, max_tokens=1200,
+        fmt_resp = await llm_gateway.achat(
+            model=settings.COPILOT_MODEL, messages=_copilot_format_messages(request, rows), temperature=0.3, max_tokens=1200,
         )
         return {
             "response": fmt_resp.choices[0].message.content,
             "mode": "analytics",
             "rows_returned": len(rows),
+            "sql_source": plan.source,
+            "data_refreshed_at": data_refreshed_at,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/api/copilot/chat/stream")
+async def copilot_chat_stream(
+    request: schemas.CopilotChatRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-sent events variant of /api/copilot/chat. Events:
+      stage  {"stage": ...}   retrieving | generating_sql | sql_generated | rows_fetched | formatting | answering
+                              (sql_generated carries the SQL for super_admin users only)
+      token  {"text": ...}    completion text as it arrives
+      done   {...}            the full response plus the metadata /api/copilot/chat returns
+      error  {"detail": ...}
+    When the client disconnects the stream stops and the OpenAI request is cancelled.
+    """
+    if not llm_gateway.is_configured:
+        raise HTTPException(status_code=503, detail="AI service not available")
+
+    # Not found / forbidden are reported as normal HTTP errors before the stream starts
+    contract, query_embedding = None, None
+    if request.contract_id is not None:
+        contract, query_embedding = await _load_copilot_contract(request, current_user, db)
+
+    async def stream_completion(messages, metadata):
+        parts = []
+        async for text in llm_gateway.astream_chat(
+            model=settings.COPILOT_MODEL, messages=messages, temperature=0.3, max_tokens=1200,
+        ):
+            parts.append(text)
+            yield _sse("token", {"text": text})
+        yield _sse("done", {"response": "".join(parts), **metadata})
+
+    async def events():
+        try:
+            if request.contract_id is not None:
+                yield _sse("stage", {"stage": "retrieving"})
+                document = await run_in_threadpool(
+                    _copilot_document_context, request, contract, current_user, db, query_embedding
+                )
+                yield _sse("stage", {"stage": "answering", "passages": len(document["metadata"]["passages"])})
+                async for event in stream_completion(document["messages"], document["metadata"]):
+                    yield event
+                return
+
+            yield _sse("stage", {"stage": "generating_sql"})
+            plan = await _plan_copilot_sql(request.message, db)
+            if plan is None:
+                yield _sse("done", {"response": _CANNOT_ANSWER_RESPONSE, "mode": "analytics"})
+                return
+            sql_stage = {"stage": "sql_generated", "source": plan.source}
+            if current_user.role == "super_admin":
+                # The generated SQL exposes view and column names: only admins see it
+                sql_stage["sql"] = plan.sql
+            yield _sse("stage", sql_stage)
+
+            if await http_request.is_disconnected():
+                return
+            rows, data_refreshed_at = await run_in_threadpool(_run_copilot_query, db, request.message, plan)
+            yield _sse("stage", {"stage": "rows_fetched", "rows": len(rows)})
+
+            yield _sse("stage", {"stage": "formatting"})
+            async for event in stream_completion(
+                _copilot_format_messages(request, rows),
+                {
+                    "mode": "analytics",
+                    "rows_returned": len(rows),
+                    "sql_source": plan.source,
+                    "data_refreshed_at": data_refreshed_at
+                }
+            ):
+                yield event
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+        except Exception as e:
+            yield _sse("error", {"detail": f"AI error: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/debug/deliverables/{contract_id}")
 async def debug_contract_deliverables(
     contract_id: int,
@@ -6359,247 +6437,106 @@ async def get_assigned_drafts(
             # Directors see ALL statuses except approved/rejected (finalized)
             status_filter = ["draft", "under_review", "reviewed", "approved", "rejected"]
         
-        all_contracts = db.query(models.Contract).filter(
-            models.Contract.status.in_(status_filter)
+        # Filter and paginate in the database (JSONB containment on the assignment columns)
+        assigned_query = db.query(models.Contract).filter(
+            models.Contract.status.in_(status_filter),
+            assigned_to_user_clause(current_user.id)
+        ).order_by(models.Contract.id)
+        
+        # Lightweight rows for the summary statistics - no full comprehensive_data payloads
+        summary_rows = assigned_query.with_entities(
+            models.Contract.id,
+            models.Contract.status,
+            models.Contract.assigned_pm_users,
+            models.Contract.assigned_pgm_users,
+            models.Contract.assigned_director_users,
+            models.Contract.comprehensive_data["assignment_history"].label("assignment_history"),
+            models.Contract.comprehensive_data["assignment_tracking"].label("assignment_tracking"),
+            models.Contract.last_edited_by
         ).all()
         
-        # print(f"DEBUG: Found {len(all_contracts)} contracts with statuses {status_filter}")
-        
-        assigned_contracts = []
-        
-        for contract in all_contracts:
-            # Debug info for each contract
-            # print(f"DEBUG: Checking contract {contract.id} - {contract.grant_name} - Status: {contract.status}")
-            
-            # Check if user is in any of the assignment lists
-            is_assigned = False
+        paginated_contracts = assigned_query.offset(skip).limit(limit).all()
+        
+        # Resolve every referenced user (assignees and assigners) with a single query
+        referenced_user_ids = set()
+        for row in summary_rows:
+            referenced_user_ids.update(get_user_ids_from_field(row.assigned_pm_users))
+            referenced_user_ids.update(get_user_ids_from_field(row.assigned_pgm_users))
+            referenced_user_ids.update(get_user_ids_from_field(row.assigned_director_users))
+            if row.last_edited_by:
+                referenced_user_ids.add(row.last_edited_by)
+        users_by_id = {
+            u.id: u for u in db.query(User).filter(User.id.in_(referenced_user_ids)).all()
+        } if referenced_user_ids else {}
+        
+        def build_assignment_info(pm_field, pgm_field, director_field, assignment_history, assignment_tracking, last_edited_by):
+            """Assignment role, assigner and assigned users for one contract"""
             assignment_role = None
+            all_assigned_users_info = []
+            for assignment_type, field in (
+                ("project_manager", pm_field),
+                ("program_manager", pgm_field),
+                ("director", director_field),
+            ):
+                user_ids = get_user_ids_from_field(field)
+                if assignment_role is None and current_user.id in user_ids:
+                    assignment_role = assignment_type
+                for user_id in user_ids:
+                    user_obj = users_by_id.get(user_id)
+                    if user_obj:
+                        all_assigned_users_info.append({
+                            "id": user_obj.id,
+                            "name": user_obj.full_name or user_obj.username,
+                            "role": user_obj.role,
+                            "assignment_type": assignment_type
+                        })
             
-            # Check assigned_pm_users
-            if contract.assigned_pm_users:
-                try:
-                    # Handle different data types
-                    if isinstance(contract.assigned_pm_users, list):
-                        if current_user.id in contract.assigned_pm_users:
-                            is_assigned = True
-                            assignment_role = "project_manager"
-                    elif isinstance(contract.assigned_pm_users, str):
-                        # Try to parse as JSON
-                        import json
-                        try:
-                            pm_list = json.loads(contract.assigned_pm_users)
-                            if isinstance(pm_list, list) and current_user.id in pm_list:
-                                is_assigned = True
-                                assignment_role = "project_manager"
-                        except:
-                            # Try comma-separated
-                            pm_ids = [int(id_str.strip()) for id_str in contract.assigned_pm_users.split(',') if id_str.strip().isdigit()]
-                            if current_user.id in pm_ids:
-                                is_assigned = True
-                                assignment_role = "project_manager"
-                except Exception as e:
-                    print(f"  ❌ Error checking PM users: {e}")
+            assigned_by_info = {
+                "id": None,
+                "name": "Unknown",
+                "role": "Unknown"
+            }
             
-            # Check assigned_pgm_users
-            if not is_assigned and contract.assigned_pgm_users:
-                try:
-                    if isinstance(contract.assigned_pgm_users, list):
-                        if current_user.id in contract.assigned_pgm_users:
-                            is_assigned = True
-                            assignment_role = "program_manager"
-                    elif isinstance(contract.assigned_pgm_users, str):
-                        import json
-                        try:
-                            pgm_list = json.loads(contract.assigned_pgm_users)
-                            if isinstance(pgm_list, list) and current_user.id in pgm_list:
-                                is_assigned = True
-                                assignment_role = "program_manager"
-                        except:
-                            pgm_ids = [int(id_str.strip()) for id_str in contract.assigned_pgm_users.split(',') if id_str.strip().isdigit()]
-                            if current_user.id in pgm_ids:
-                                is_assigned = True
-                                assignment_role = "program_manager"
-                except Exception as e:
-                    print(f"  ❌ Error checking PGM users: {e}")
+            # Get the most recent assignment for current user
+            for entry in assignment_history or []:
+                if isinstance(entry, dict) and "assigned_users" in entry:
+                    if current_user.id in (entry["assigned_users"] or []):
+                        assigned_by_info["id"] = entry.get("assigned_by")
+                        assigned_by_info["name"] = entry.get("assigned_by_name", "Unknown")
+                        assigned_by_info["role"] = entry.get("assigned_by_role", "Unknown")
+                        break
             
-            # Check assigned_director_users
-            if not is_assigned and contract.assigned_director_users:
-                try:
-                    if isinstance(contract.assigned_director_users, list):
-                        if current_user.id in contract.assigned_director_users:
-                            is_assigned = True
-                            assignment_role = "director"
-                    elif isinstance(contract.assigned_director_users, str):
-                        import json
-                        try:
-                            dir_list = json.loads(contract.assigned_director_users)
-                            if isinstance(dir_list, list) and current_user.id in dir_list:
-                                is_assigned = True
-                                assignment_role = "director"
-                        except:
-                            dir_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                            if current_user.id in dir_ids:
-                                is_assigned = True
-                                assignment_role = "director"
-                except Exception as e:
-                    print(f"  ❌ Error checking Director users: {e}")
+            # Fallback to assignment tracking
+            if assigned_by_info["id"] is None and isinstance(assignment_tracking, dict):
+                assigned_by_info["id"] = assignment_tracking.get("assigned_by")
+                assigned_by_info["name"] = assignment_tracking.get("assigned_by_name", "Unknown")
+                assigned_by_info["role"] = assignment_tracking.get("assigned_by_role", "Unknown")
             
-            if is_assigned:
-                # Get assigned_by information from comprehensive_data
-                assigned_by_info = {
-                    "id": None,
-                    "name": "Unknown",
-                    "role": "Unknown"
-                }
-                
-                # Get ALL assigned users information
-                all_assigned_users_info = []
-                
-                # Get user details for assigned PMs
-                if contract.assigned_pm_users:
-                    pm_user_ids = []
-                    if isinstance(contract.assigned_pm_users, list):
-                        pm_user_ids = contract.assigned_pm_users
-                    elif isinstance(contract.assigned_pm_users, str):
-                        try:
-                            import json
-                            pm_user_ids = json.loads(contract.assigned_pm_users)
-                        except:
-                            pm_user_ids = [int(id_str.strip()) for id_str in contract.assigned_pm_users.split(',') if id_str.strip().isdigit()]
-                    
-                    for user_id in pm_user_ids:
-                        try:
-                            user_obj = db.query(User).filter(User.id == user_id).first()
-                            if user_obj:
-                                all_assigned_users_info.append({
-                                    "id": user_obj.id,
-                                    "name": user_obj.full_name or user_obj.username,
-                                    "role": user_obj.role,
-                                    "assignment_type": "project_manager"
-                                })
-                        except:
-                            pass
-                
-                # Get user details for assigned PGMs
-                if contract.assigned_pgm_users:
-                    pgm_user_ids = []
-                    if isinstance(contract.assigned_pgm_users, list):
-                        pgm_user_ids = contract.assigned_pgm_users
-                    elif isinstance(contract.assigned_pgm_users, str):
-                        try:
-                            import json
-                            pgm_user_ids = json.loads(contract.assigned_pgm_users)
-                        except:
-                            pgm_user_ids = [int(id_str.strip()) for id_str in contract.assigned_pgm_users.split(',') if id_str.strip().isdigit()]
-                    
-                    for user_id in pgm_user_ids:
-                        try:
-                            user_obj = db.query(User).filter(User.id == user_id).first()
-                            if user_obj:
-                                all_assigned_users_info.append({
-                                    "id": user_obj.id,
-                                    "name": user_obj.full_name or user_obj.username,
-                                    "role": user_obj.role,
-                                    "assignment_type": "program_manager"
-                                })
-                        except:
-                            pass
-                
-                # Get user details for assigned Directors
-                if contract.assigned_director_users:
-                    director_user_ids = []
-                    if isinstance(contract.assigned_director_users, list):
-                        director_user_ids = contract.assigned_director_users
-                    elif isinstance(contract.assigned_director_users, str):
-                        try:
-                            import json
-                            director_user_ids = json.loads(contract.assigned_director_users)
-                        except:
-                            director_user_ids = [int(id_str.strip()) for id_str in contract.assigned_director_users.split(',') if id_str.strip().isdigit()]
-                    
-                    for user_id in director_user_ids:
-                        try:
-                            user_obj = db.query(User).filter(User.id == user_id).first()
-                            if user_obj:
-                                all_assigned_users_info.append({
-                                    "id": user_obj.id,
-                                    "name": user_obj.full_name or user_obj.username,
-                                    "role": user_obj.role,
-                                    "assignment_type": "director"
-                                })
-                        except:
-                            pass
-                
-                if contract.comprehensive_data:
-                    # Check for assignment history
-                    if "assignment_history" in contract.comprehensive_data:
-                        assignment_history = contract.comprehensive_data["assignment_history"]
-                        if assignment_history:
-                            # Get the most recent assignment for current user
-                            for entry in assignment_history:
-                                if "assigned_users" in entry:
-                                    assigned_users = entry["assigned_users"]
-                                    if current_user.id in assigned_users:
-                                        assigned_by_info["id"] = entry.get("assigned_by")
-                                        assigned_by_info["name"] = entry.get("assigned_by_name", "Unknown")
-                                        assigned_by_info["role"] = entry.get("assigned_by_role", "Unknown")
-                                        break
-                    
-                    # Fallback to assignment tracking
-                    if assigned_by_info["id"] is None and "assignment_tracking" in contract.comprehensive_data:
-                        assignment_data = contract.comprehensive_data["assignment_tracking"]
-                        if isinstance(assignment_data, dict):
-                            assigned_by_info["id"] = assignment_data.get("assigned_by")
-                            assigned_by_info["name"] = assignment_data.get("assigned_by_name", "Unknown")
-                            assigned_by_info["role"] = assignment_data.get("assigned_by_role", "Unknown")
-                
-                # If no assignment info found, try to get from audit fields
-                if assigned_by_info["id"] is None:
-                    if contract.last_edited_by:
-                        try:
-                            assigner = db.query(User).filter(User.id == contract.last_edited_by).first()
-                            if assigner:
-                                assigned_by_info["id"] = assigner.id
-                                assigned_by_info["name"] = assigner.full_name or assigner.username
-                                assigned_by_info["role"] = assigner.role
-                        except:
-                            pass
-                
-                assigned_contracts.append({
-                    "id": contract.id,
-                    "filename": contract.filename,
-                    "grant_name": contract.grant_name,
-                    "contract_number": contract.contract_number,
-                    "grantor": contract.grantor,
-                    "grantee": contract.grantee,
-                    "total_amount": contract.total_amount,
-                    "start_date": contract.start_date,
-                    "end_date": contract.end_date,
-                    "purpose": contract.purpose,
-                    "uploaded_at": contract.uploaded_at,
-                    "status": contract.status,  # ✅ This will now show all statuses
-                    "created_by": contract.created_by,
-                    "assigned_pm_users": contract.assigned_pm_users,
-                    "assigned_pgm_users": contract.assigned_pgm_users,
-                    "assigned_director_users": contract.assigned_director_users,
-                    "comprehensive_data": contract.comprehensive_data,
-                    "assignment_role": assignment_role,
-                    "assigned_by": assigned_by_info,
-                    "assigned_at": contract.last_edited_at or contract.uploaded_at,
-                    "all_assigned_users": all_assigned_users_info,
-                    "assigned_pm_count": len([u for u in all_assigned_users_info if u["assignment_type"] == "project_manager"]),
-                    "assigned_pgm_count": len([u for u in all_assigned_users_info if u["assignment_type"] == "program_manager"]),
-                    "assigned_director_count": len([u for u in all_assigned_users_info if u["assignment_type"] == "director"])
-                })
-                
-                print(f"  ✅ Contract {contract.id} ({contract.status}) assigned to user by {assigned_by_info['name']}")
-            else:
-                print(f"  ❌ Contract {contract.id} NOT assigned to user")
-        
-        # print(f"DEBUG: Total assigned contracts: {len(assigned_contracts)}")
+            # If no assignment info found, try to get from audit fields
+            if assigned_by_info["id"] is None and last_edited_by:
+                assigner = users_by_id.get(last_edited_by)
+                if assigner:
+                    assigned_by_info["id"] = assigner.id
+                    assigned_by_info["name"] = assigner.full_name or assigner.username
+                    assigned_by_info["role"] = assigner.role
+            
+            return {
+                "assignment_role": assignment_role,
+                "assigned_by": assigned_by_info,
+                "all_assigned_users": all_assigned_users_info,
+                "assigned_pm_count": len([u for u in all_assigned_users_info if u["assignment_type"] == "project_manager"]),
+                "assigned_pgm_count": len([u for u in all_assigned_users_info if u["assignment_type"] == "program_manager"]),
+                "assigned_director_count": len([u for u in all_assigned_users_info if u["assignment_type"] == "director"])
+            }
         
-        # Apply pagination
-        paginated_contracts = assigned_contracts[skip:skip + limit]
+        assigned_contracts = []
+        for row in summary_rows:
+            info = build_assignment_info(
+                row.assigned_pm_users, row.assigned_pgm_users, row.assigned_director_users,
+                row.assignment_history, row.assignment_tracking, row.last_edited_by
+            )
+            info["status"] = row.status
+            assigned_contracts.append(info)
         
         # Helper function to safely format dates
         def format_date(date_value):
@@ -6610,31 +6547,36 @@ async def get_assigned_drafts(
         # Format response
         formatted_contracts = []
         for contract in paginated_contracts:
+            comp_data = contract.comprehensive_data or {}
+            info = build_assignment_info(
+                contract.assigned_pm_users, contract.assigned_pgm_users, contract.assigned_director_users,
+                comp_data.get("assignment_history"), comp_data.get("assignment_tracking"), contract.last_edited_by
+            )
             formatted_contracts.append({
-                "id": contract["id"],
-                "filename": contract["filename"] or "Unknown",
-                "uploaded_at": format_date(contract["uploaded_at"]),
-                "status": contract["status"] or "draft",
-                "contract_number": contract["contract_number"],
-                "grant_name": contract["grant_name"] or "Unnamed Contract",
-                "grantor": contract["grantor"] or "Unknown Grantor",
-                "grantee": contract["grantee"] or "Unknown Grantee",
-                "total_amount": float(contract["total_amount"]) if contract["total_amount"] else 0.0,
-                "start_date": format_date(contract["start_date"]),
-                "end_date": format_date(contract["end_date"]),
-                "purpose": contract["purpose"],
-                "created_by": contract["created_by"],
-                "assigned_pm_users": contract["assigned_pm_users"] or [],
-                "assigned_pgm_users": contract["assigned_pgm_users"] or [],
-                "assigned_director_users": contract["assigned_director_users"] or [],
-                "comprehensive_data": contract["comprehensive_data"],
-                "assignment_role": contract["assignment_role"],
-                "assigned_by": contract["assigned_by"],
-                "assigned_at": format_date(contract["assigned_at"]),
-                "all_assigned_users": contract["all_assigned_users"],
-                "assigned_pm_count": contract["assigned_pm_count"],
-                "assigned_pgm_count": contract["assigned_pgm_count"],
-                "assigned_director_count": contract["assigned_director_count"]
+                "id": contract.id,
+                "filename": contract.filename or "Unknown",
+                "uploaded_at": format_date(contract.uploaded_at),
+                "status": contract.status or "draft",
+                "contract_number": contract.contract_number,
+                "grant_name": contract.grant_name or "Unnamed Contract",
+                "grantor": contract.grantor or "Unknown Grantor",
+                "grantee": contract.grantee or "Unknown Grantee",
+                "total_amount": float(contract.total_amount) if contract.total_amount else 0.0,
+                "start_date": format_date(contract.start_date),
+                "end_date": format_date(contract.end_date),
+                "purpose": contract.purpose,
+                "created_by": contract.created_by,
+                "assigned_pm_users": contract.assigned_pm_users or [],
+                "assigned_pgm_users": contract.assigned_pgm_users or [],
+                "assigned_director_users": contract.assigned_director_users or [],
+                "comprehensive_data": contract.comprehensive_data,
+                "assignment_role": info["assignment_role"],
+                "assigned_by": info["assigned_by"],
+                "assigned_at": format_date(contract.last_edited_at or contract.uploaded_at),
+                "all_assigned_users": info["all_assigned_users"],
+                "assigned_pm_count": info["assigned_pm_count"],
+                "assigned_pgm_count": info["assigned_pgm_count"],
+                "assigned_director_count": info["assigned_director_count"]
             })
         
         # Calculate statistics by status
@@ -6707,6 +6649,7 @@ async def get_agreements_assigned_by_me(
         # print(f"DEBUG: Found {len(all_drafts)} total draft contracts")
         
         assigned_by_me_drafts = []
+        resolver = get_assignment_resolver(db)
         
         for draft in all_drafts:
             # Check comprehensive data for assignment history
@@ -6721,18 +6664,10 @@ async def get_agreements_assigned_by_me(
                         
                         # Get all assigned users information
                         all_assigned_users_info = []
+                        draft_assignments = resolver.resolve(draft)
                         
                         # Get user details for assigned PMs
-                        pm_user_ids = []
-                        if draft.assigned_pm_users:
-                            if isinstance(draft.assigned_pm_users, list):
-                                pm_user_ids = draft.assigned_pm_users
-                            elif isinstance(draft.assigned_pm_users, str):
-                                try:
-                                    import json
-                                    pm_user_ids = json.loads(draft.assigned_pm_users)
-                                except:
-                                    pm_user_ids = [int(id_str.strip()) for id_str in draft.assigned_pm_users.split(',') if id_str.strip().isdigit()]
+                        pm_user_ids = sorted(draft_assignments.pm)
                         
                         for user_id in pm_user_ids:
                             try:
@@ -6748,16 +6683,7 @@ async def get_agreements_assigned_by_me(
                                 pass
                         
                         # Get user details for assigned PGMs
-                        pgm_user_ids = []
-                        if draft.assigned_pgm_users:
-                            if isinstance(draft.assigned_pgm_users, list):
-                                pgm_user_ids = draft.assigned_pgm_users
-                            elif isinstance(draft.assigned_pgm_users, str):
-                                try:
-                                    import json
-                                    pgm_user_ids = json.loads(draft.assigned_pgm_users)
-                                except:
-                                    pgm_user_ids = [int(id_str.strip()) for id_str in draft.assigned_pgm_users.split(',') if id_str.strip().isdigit()]
+                        pgm_user_ids = sorted(draft_assignments.pgm)
                         
                         for user_id in pgm_user_ids:
                             try:
@@ -6773,16 +6699,7 @@ async def get_agreements_assigned_by_me(
                                 pass
                         
                         # Get user details for assigned Directors
-                        director_user_ids = []
-                        if draft.assigned_director_users:
-                            if isinstance(draft.assigned_director_users, list):
-                                director_user_ids = draft.assigned_director_users
-                            elif isinstance(draft.assigned_director_users, str):
-                                try:
-                                    import json
-                                    director_user_ids = json.loads(draft.assigned_director_users)
-                                except:
-                                    director_user_ids = [int(id_str.strip()) for id_str in draft.assigned_director_users.split(',') if id_str.strip().isdigit()]
+                        director_user_ids = sorted(draft_assignments.director)
                         
                         for user_id in director_user_ids:
                             try:
@@ -1,5 +1,5 @@
 # app/models.py - Update with ContractVersion model
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, Float, ForeignKey, UniqueConstraint, JSON, Date
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, Float, ForeignKey, UniqueConstraint, JSON, Date, Index, LargeBinary
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
@@ -94,6 +94,24 @@ class Contract(Base):
     published_at = Column(DateTime(timezone=True), nullable=True)
     published_by = Column(Integer, ForeignKey("users.id"), nullable=True)
 
+    # Upload dedupe (app/contract_dedup.py): SHA-256 of the uploaded PDF bytes, and the
+    # contract whose extraction, text and vectors were reused when this upload matched it
+    content_sha256 = Column(String(64), nullable=True)
+    source_contract_id = Column(Integer, ForeignKey("contracts.id", ondelete="SET NULL"), nullable=True)
+
+    # GIN indexes serve the JSONB containment (@>) assignment filters in app/assignments.py
+    __table_args__ = (
+        Index("ix_contracts_assigned_pm_users", "assigned_pm_users",
+              postgresql_using="gin", postgresql_ops={"assigned_pm_users": "jsonb_path_ops"}),
+        Index("ix_contracts_assigned_pgm_users", "assigned_pgm_users",
+              postgresql_using="gin", postgresql_ops={"assigned_pgm_users": "jsonb_path_ops"}),
+        Index("ix_contracts_assigned_director_users", "assigned_director_users",
+              postgresql_using="gin", postgresql_ops={"assigned_director_users": "jsonb_path_ops"}),
+        Index("ix_contracts_created_by", "created_by"),
+        Index("ix_contracts_status", "status"),
+        Index("ix_contracts_content_sha256", "content_sha256"),
+    )
+
 class ContractVersion(Base):
     __tablename__ = "contract_versions"
     
@@ -156,6 +174,7 @@ class ReportingEvent(Base):
     uploaded_file_name = Column(String, nullable=True)
     uploaded_file_path = Column(String, nullable=True)
     uploaded_at = Column(DateTime, nullable=True)
+    blob_key = Column(String, nullable=True)  # Key in blob storage (app/blob_storage.py)
 
     pgm_approved = Column(Boolean, default=False)
     pgm_approved_at = Column(DateTime, nullable=True)
@@ -163,3 +182,96 @@ class ReportingEvent(Base):
 
     director_approved = Column(Boolean, default=False)
     director_approved_at = Column(DateTime, nullable=True)
+
+
+class ContractPage(Base):
+    """Full extracted text of a contract, one zlib-compressed row per page (see app/page_store.py)"""
+    __tablename__ = "contract_pages"
+    __table_args__ = (
+        UniqueConstraint("contract_id", "page_number", name="uq_contract_pages_contract_page"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    contract_id = Column(Integer, ForeignKey("contracts.id", ondelete="CASCADE"), nullable=False, index=True)
+    page_number = Column(Integer, nullable=False)
+
+    # Offsets of this page's text / table text within the cleaned contract text
+    char_start = Column(Integer, nullable=False)
+    char_end = Column(Integer, nullable=False)
+    tables_start = Column(Integer, nullable=True)
+    tables_end = Column(Integer, nullable=True)
+
+    text_compressed = Column(LargeBinary, nullable=False)
+    tables_compressed = Column(LargeBinary, nullable=True)  # JSON list of tables (rows of cells)
+    raw_bytes = Column(Integer, default=0)  # Uncompressed size of text + tables
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ContractPassage(Base):
+    """BM25 term statistics per retrieval passage of a contract (see app/passage_index.py)"""
+    __tablename__ = "contract_passages"
+    __table_args__ = (
+        UniqueConstraint("contract_id", "passage_index", name="uq_contract_passages_contract_passage"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    contract_id = Column(Integer, ForeignKey("contracts.id", ondelete="CASCADE"), nullable=False, index=True)
+    passage_index = Column(Integer, nullable=False)  # Same numbering as the vector chunks
+
+    # Offsets within the cleaned contract text (text is read from contract_pages)
+    char_start = Column(Integer, nullable=False)
+    char_end = Column(Integer, nullable=False)
+    heading = Column(String(200), nullable=True)
+
+    term_counts = Column(JSONB, nullable=False)  # {term: frequency}
+    term_total = Column(Integer, nullable=False)  # Passage length in terms
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class PortfolioViewRefresh(Base):
+    """Last refresh of each materialized portfolio view (see app/portfolio_views.py)"""
+    __tablename__ = "portfolio_view_refreshes"
+
+    view_name = Column(String(100), primary_key=True)
+    refreshed_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Integer, default=0)
+    row_count = Column(Integer, default=0)
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: uuid4().hex)
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=True)  # Spooled upload, removed once the job finishes
+    file_size = Column(Integer, nullable=True)
+    content_sha256 = Column(String(64), nullable=True)  # Of the spooled upload, for dedupe
+
+    status = Column(String, default="queued")  # queued | running | completed | failed
+    current_stage = Column(String, nullable=True)
+    stages = Column(JSONB, default=dict)  # {stage: {status, started_at, finished_at, duration_seconds, detail}}
+    error = Column(Text, nullable=True)
+
+    contract_id = Column(Integer, ForeignKey("contracts.id", ondelete="SET NULL"), nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class ExtractionCacheEntry(Base):
+    """Shared AI extraction cache (postgres backend of app/extraction_cache.py)"""
+    __tablename__ = "extraction_cache"
+
+    cache_key = Column(String(64), primary_key=True)  # sha256(prompt version + model + normalized text)
+    model = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON-encoded extraction result
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
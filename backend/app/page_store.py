@@ -0,0 +1,275 @@
+# app/page_store.py
+"""
+Page-addressable store for the full extracted text of a contract.
+
+Contract.full_text only keeps a 5,000 character preview, and re-parsing the
+PDF from S3 is slow. The complete text is stored in contract_pages instead:
+one row per page, with the page text and its tables zlib-compressed
+separately.
+
+Every page also records where its text (and its table text) sits in the
+cleaned contract text: the same string AIExtractor and the vector index see.
+Chunk offsets from the vector store (chunk_start/chunk_end) therefore map
+straight onto pages, so callers can fetch just the pages they need:
+
+    get_contract_text(db, contract_id, max_chars=60000)   # prefix of the document
+    get_text_span(db, contract_id, start, end)            # e.g. one chunk
+    get_pages(db, contract_id, [3, 4])                    # specific pages
+"""
+import json
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import insert, literal, select, or_, and_
+from sqlalchemy.orm import Session
+
+from app import models
+from app.pdf_processor import PDFProcessor
+
+TABLES_HEADING = "=== TABLES ==="
+
+_clean_text = PDFProcessor().clean_text
+
+
+class PageText(NamedTuple):
+    page_number: int
+    char_start: int
+    char_end: int
+    text: str
+    tables: Optional[List[Any]]
+
+
+def compress_text(value: str) -> bytes:
+    return zlib.compress(value.encode("utf-8"), 6)
+
+
+def decompress_text(value: bytes) -> str:
+    return zlib.decompress(value).decode("utf-8")
+
+
+def render_tables(tables: List[Any]) -> str:
+    """Table text exactly as PDFProcessor.extract_text writes it"""
+    lines = []
+    for table in tables:
+        for row in table:
+            lines.append(" | ".join([str(cell) if cell else "" for cell in row]) + "\n")
+        lines.append("\n")
+    return "".join(lines)
+
+
+def layout_pages(pages: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Place each page's cleaned text and table text in the cleaned contract
+    text. Segments are separated by single spaces, matching
+    PDFProcessor.clean_text over the extracted text (page texts first, then
+    "=== TABLES ===" and every page's tables in page order).
+    """
+    position = 0
+    wrote_any = False
+
+    def place(segment: str):
+        nonlocal position, wrote_any
+        if not segment:
+            return position, position
+        if wrote_any:
+            position += 1  # the separating space
+        start = position
+        position += len(segment)
+        wrote_any = True
+        return start, position
+
+    layout = []
+    for page in pages:
+        text = _clean_text(page.get("text") or "")
+        start, end = place(text)
+        layout.append({
+            "page_number": page["page"],
+            "text": text,
+            "char_start": start,
+            "char_end": end,
+            "tables": page.get("tables") or [],
+            "tables_start": None,
+            "tables_end": None
+        })
+
+    first_tables = True
+    for entry in layout:
+        if entry["tables"]:
+            tables_text = _clean_text(render_tables(entry["tables"]))
+            if first_tables:
+                # The "=== TABLES ===" heading is stored as part of the first table segment
+                tables_text = " ".join(part for part in (TABLES_HEADING, tables_text) if part)
+                first_tables = False
+            entry["tables_start"], entry["tables_end"] = place(tables_text)
+
+    return layout
+
+
+def store_contract_pages(
+    db: Session, contract_id: int, pages: Sequence[Dict[str, Any]], commit: bool = True
+) -> Dict[str, int]:
+    """
+    Replace the stored pages of a contract (pages as returned by
+    PDFProcessor.extract_text). With commit=False the caller commits.
+    """
+    layout = layout_pages(pages)
+    rows = []
+    raw_total = 0
+    stored_total = 0
+    for entry in layout:
+        tables_json = json.dumps(entry["tables"]) if entry["tables"] else None
+        text_compressed = compress_text(entry["text"])
+        tables_compressed = compress_text(tables_json) if tables_json else None
+        raw_bytes = len(entry["text"].encode("utf-8")) + (len(tables_json.encode("utf-8")) if tables_json else 0)
+        raw_total += raw_bytes
+        stored_total += len(text_compressed) + (len(tables_compressed) if tables_compressed else 0)
+        rows.append({
+            "contract_id": contract_id,
+            "page_number": entry["page_number"],
+            "char_start": entry["char_start"],
+            "char_end": entry["char_end"],
+            "tables_start": entry["tables_start"],
+            "tables_end": entry["tables_end"],
+            "text_compressed": text_compressed,
+            "tables_compressed": tables_compressed,
+            "raw_bytes": raw_bytes
+        })
+
+    db.query(models.ContractPage).filter(models.ContractPage.contract_id == contract_id).delete(
+        synchronize_session=False
+    )
+    if rows:
+        db.execute(insert(models.ContractPage), rows)
+    if commit:
+        db.commit()
+
+    return {"pages": len(rows), "raw_bytes": raw_total, "stored_bytes": stored_total}
+
+
+def copy_contract_pages(db: Session, source_contract_id: int, contract_id: int) -> int:
+    """Copy the stored (still compressed) pages of one contract to another; returns the page count"""
+    columns = ["page_number", "char_start", "char_end", "tables_start", "tables_end",
+               "text_compressed", "tables_compressed", "raw_bytes"]
+    source = select(
+        literal(contract_id), *[getattr(models.ContractPage, c) for c in columns]
+    ).where(models.ContractPage.contract_id == source_contract_id)
+
+    db.query(models.ContractPage).filter(models.ContractPage.contract_id == contract_id).delete(
+        synchronize_session=False
+    )
+    result = db.execute(insert(models.ContractPage).from_select(["contract_id", *columns], source))
+    db.commit()
+    return result.rowcount
+
+
+def _page_query(db: Session, contract_id: int, include_tables: bool):
+    columns = [
+        models.ContractPage.page_number,
+        models.ContractPage.char_start,
+        models.ContractPage.char_end,
+        models.ContractPage.tables_start,
+        models.ContractPage.tables_end,
+        models.ContractPage.text_compressed
+    ]
+    if include_tables:
+        columns.append(models.ContractPage.tables_compressed)
+    return db.query(*columns).filter(models.ContractPage.contract_id == contract_id)
+
+
+def _to_page_text(row, include_tables: bool) -> PageText:
+    tables = None
+    if include_tables and row.tables_compressed:
+        tables = json.loads(decompress_text(row.tables_compressed))
+    return PageText(
+        page_number=row.page_number,
+        char_start=row.char_start,
+        char_end=row.char_end,
+        text=decompress_text(row.text_compressed),
+        tables=tables
+    )
+
+
+def has_pages(db: Session, contract_id: int) -> bool:
+    return db.query(models.ContractPage.id).filter(
+        models.ContractPage.contract_id == contract_id
+    ).first() is not None
+
+
+def get_pages(
+    db: Session,
+    contract_id: int,
+    page_numbers: Optional[Sequence[int]] = None,
+    include_tables: bool = False
+) -> List[PageText]:
+    """Pages of a contract (all, or only page_numbers), in page order"""
+    query = _page_query(db, contract_id, include_tables)
+    if page_numbers is not None:
+        query = query.filter(models.ContractPage.page_number.in_(list(page_numbers)))
+    rows = query.order_by(models.ContractPage.page_number).all()
+    return [_to_page_text(row, include_tables) for row in rows]
+
+
+def _overlapping_rows(db: Session, contract_id: int, start: int, end: int):
+    """Rows whose page text or table text overlaps [start, end)"""
+    text_overlaps = and_(models.ContractPage.char_start < end, models.ContractPage.char_end > start)
+    tables_overlap = and_(
+        models.ContractPage.tables_start.isnot(None),
+        models.ContractPage.tables_start < end,
+        models.ContractPage.tables_end > start
+    )
+    return _page_query(db, contract_id, True).filter(
+        or_(text_overlaps, tables_overlap)
+    ).order_by(models.ContractPage.page_number).all()
+
+
+def _assemble(rows, start: int, end: int) -> str:
+    """Rebuild the cleaned text between start and end from stored segments"""
+    segments = []
+    for row in rows:
+        text = decompress_text(row.text_compressed)
+        if text:
+            segments.append((row.char_start, text))
+        if row.tables_start is not None and row.tables_compressed:
+            tables_text = _clean_text(render_tables(json.loads(decompress_text(row.tables_compressed))))
+            if row.tables_end - row.tables_start != len(tables_text):
+                tables_text = " ".join(part for part in (TABLES_HEADING, tables_text) if part)
+            segments.append((row.tables_start, tables_text))
+
+    if not segments:
+        return ""
+
+    # Segments are separated by single spaces; pad gaps so offsets stay exact.
+    # (A separator right after the last fetched segment is not reproduced.)
+    segments.sort()
+    base = min(start, segments[0][0])
+    cursor = base
+    buffer = []
+    for segment_start, text in segments:
+        if segment_start > cursor:
+            buffer.append(" " * (segment_start - cursor))
+        buffer.append(text)
+        cursor = segment_start + len(text)
+
+    assembled = "".join(buffer)
+    return assembled[start - base:max(0, end - base)]
+
+
+def get_text_span(db: Session, contract_id: int, start: int, end: int) -> str:
+    """Cleaned contract text between two offsets, reading only the pages that cover it"""
+    rows = _overlapping_rows(db, contract_id, start, end)
+    return _assemble(rows, start, end)
+
+
+def get_contract_text(db: Session, contract_id: int, max_chars: Optional[int] = None) -> Optional[str]:
+    """Full cleaned contract text (or its first max_chars); None when no pages are stored"""
+    if max_chars is None:
+        rows = _page_query(db, contract_id, True).order_by(models.ContractPage.page_number).all()
+        if not rows:
+            return None
+        end = max(max(row.char_end for row in rows), max((row.tables_end or 0) for row in rows))
+        return _assemble(rows, 0, end)
+
+    rows = _overlapping_rows(db, contract_id, 0, max_chars)
+    if not rows:
+        return None if not has_pages(db, contract_id) else ""
+    return _assemble(rows, 0, max_chars)
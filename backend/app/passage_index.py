@@ -0,0 +1,333 @@
+# app/passage_index.py
+"""
+Per-contract passage retrieval for the copilot's document mode.
+
+Document mode used to paste the first 60,000 characters of the contract (plus
+the structured extraction) into the system prompt of every turn. Now only the
+passages relevant to the question are sent:
+
+- At ingestion the cleaned text is split into the same section-aligned chunks
+  as the vector index (chunk_sections, VECTOR_CHUNK_CHARS), and their BM25 term
+  counts are stored in contract_passages. The passage text itself is read
+  back from the page store (app/page_store.py) by offset.
+- A question is ranked with BM25 and, when the contract has chunk vectors,
+  by embedding similarity; the two rankings are fused (reciprocal rank fusion)
+  and the top COPILOT_PASSAGE_TOP_K passages are kept within
+  COPILOT_CONTEXT_TOKEN_BUDGET.
+- The passages chosen for a conversation are cached per conversation_id.
+  Later turns keep them, in the same order, and only add what the new
+  question needs, so follow-up questions ("what about the second one?")
+  still see the earlier context and the prompt prefix stays stable.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import insert, literal, select
+from sqlalchemy.orm import Session
+
+from app import models, page_store
+from app.config import settings
+from app.text_sections import chunk_sections
+from app.vector_store import vector_store
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+shall any all such may not no which who what when where how does do under per than then there these those
+""".split())
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant
+CHARS_PER_TOKEN = 4  # Rough estimate for budgeting (no tokenizer dependency)
+
+
+def tokenize(text: str) -> List[str]:
+    return [term for term in TERM_PATTERN.findall((text or "").lower()) if term not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+# ─────────────────────────────────────────────────────────────
+# Index build
+# ─────────────────────────────────────────────────────────────
+
+def build_passage_index(db: Session, contract_id: int, cleaned_text: str) -> int:
+    """Replace the passage index of a contract; returns the number of passages"""
+    rows = []
+    for chunk in chunk_sections(cleaned_text or "", settings.VECTOR_CHUNK_CHARS):
+        terms = tokenize(chunk.text)
+        rows.append({
+            "contract_id": contract_id,
+            "passage_index": chunk.index,
+            "char_start": chunk.start,
+            "char_end": chunk.end,
+            "heading": ", ".join(chunk.headings)[:200],
+            "term_counts": dict(Counter(terms)),
+            "term_total": len(terms)
+        })
+
+    db.query(models.ContractPassage).filter(models.ContractPassage.contract_id == contract_id).delete(
+        synchronize_session=False
+    )
+    if rows:
+        db.execute(insert(models.ContractPassage), rows)
+    db.commit()
+
+    conversation_cache.invalidate_contract(contract_id)
+    return len(rows)
+
+
+def copy_passage_index(db: Session, source_contract_id: int, contract_id: int) -> int:
+    """Copy the passage index of a contract with the same text; returns the number of passages"""
+    columns = ["passage_index", "char_start", "char_end", "heading", "term_counts", "term_total"]
+    source = select(
+        literal(contract_id), *[getattr(models.ContractPassage, c) for c in columns]
+    ).where(models.ContractPassage.contract_id == source_contract_id)
+
+    db.query(models.ContractPassage).filter(models.ContractPassage.contract_id == contract_id).delete(
+        synchronize_session=False
+    )
+    result = db.execute(insert(models.ContractPassage).from_select(["contract_id", *columns], source))
+    db.commit()
+
+    conversation_cache.invalidate_contract(contract_id)
+    return result.rowcount
+
+
+def load_passages(db: Session, contract_id: int):
+    return db.query(
+        models.ContractPassage.passage_index,
+        models.ContractPassage.char_start,
+        models.ContractPassage.char_end,
+        models.ContractPassage.heading,
+        models.ContractPassage.term_counts,
+        models.ContractPassage.term_total
+    ).filter(
+        models.ContractPassage.contract_id == contract_id
+    ).order_by(models.ContractPassage.passage_index).all()
+
+
+def ensure_passage_index(db: Session, contract_id: int):
+    """
+    Passages of a contract. Contracts stored before the index existed are
+    indexed on first use from their stored pages; returns [] if there are none.
+    """
+    passages = load_passages(db, contract_id)
+    if passages:
+        return passages
+
+    full_text = page_store.get_contract_text(db, contract_id)
+    if not full_text:
+        return []
+    count = build_passage_index(db, contract_id, full_text)
+    print(f"✓ Built passage index for contract {contract_id} ({count} passages)")
+    return load_passages(db, contract_id)
+
+
+# ─────────────────────────────────────────────────────────────
+# Ranking
+# ─────────────────────────────────────────────────────────────
+
+def bm25_rank(passages: Sequence[Any], query: str) -> List[int]:
+    """passage_index values with a positive BM25 score, best first"""
+    query_terms = set(tokenize(query))
+    if not passages or not query_terms:
+        return []
+
+    count = len(passages)
+    average_length = sum(p.term_total for p in passages) / count or 1
+    document_frequency = {
+        term: sum(1 for p in passages if term in p.term_counts) for term in query_terms
+    }
+
+    scores = []
+    for p in passages:
+        score = 0.0
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * p.term_total / average_length)
+        for term in query_terms:
+            frequency = p.term_counts.get(term)
+            if not frequency:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+        if score > 0:
+            scores.append((score, p.passage_index))
+
+    scores.sort(key=lambda item: (-item[0], item[1]))
+    return [passage_index for _, passage_index in scores]
+
+
+def vector_rank(passages: Sequence[Any], contract_id: int, query_embedding: List[float], n_results: int) -> List[int]:
+    """passage_index values by chunk vector similarity, best first"""
+    by_index = {p.passage_index: p for p in passages}
+    ranked = []
+    for hit in vector_store.search_contract_chunks(contract_id, query_embedding, n_results=n_results):
+        passage = by_index.get(hit["chunk_index"])
+        # Vectors built from different text (older index) don't line up with the passages
+        if passage and passage.char_start == hit["start"] and passage.char_end == hit["end"]:
+            ranked.append(passage.passage_index)
+    return ranked
+
+
+def rank_passages(
+    passages: Sequence[Any],
+    contract_id: int,
+    query: str,
+    query_embedding: Optional[List[float]] = None,
+    top_k: Optional[int] = None
+) -> List[int]:
+    """Fused BM25 + vector ranking; the opening passages when nothing matches"""
+    top_k = top_k or settings.COPILOT_PASSAGE_TOP_K
+    rankings = [bm25_rank(passages, query)]
+    if query_embedding:
+        rankings.append(vector_rank(passages, contract_id, query_embedding, min(len(passages), top_k * 3)))
+
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, passage_index in enumerate(ranking):
+            fused[passage_index] = fused.get(passage_index, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+    if not fused:
+        return [p.passage_index for p in passages[:top_k]]
+    return sorted(fused, key=lambda passage_index: (-fused[passage_index], passage_index))[:top_k]
+
+
+# ─────────────────────────────────────────────────────────────
+# Conversation context
+# ─────────────────────────────────────────────────────────────
+
+class ConversationContextCache:
+    """Passages (with text) selected so far, per (conversation_id, user_id, contract_id)"""
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "passages_reused": 0, "passages_fetched": 0}
+
+    def get(self, key: tuple) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._counters["misses"] += 1
+                return []
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return list(entry[1])
+
+    def put(self, key: tuple, passages: List[Dict[str, Any]]):
+        if not self.ttl_seconds:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, list(passages))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, reused: int, fetched: int):
+        with self._lock:
+            self._counters["passages_reused"] += reused
+            self._counters["passages_fetched"] += fetched
+
+    def invalidate_contract(self, contract_id: int):
+        with self._lock:
+            for key in [key for key in self._entries if key[2] == contract_id]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+                **self._counters
+            }
+
+
+conversation_cache = ConversationContextCache(
+    ttl_seconds=settings.COPILOT_CONVERSATION_TTL_SECONDS,
+    max_entries=settings.COPILOT_CONVERSATION_MAX_ENTRIES
+)
+
+
+def select_context(
+    db: Session,
+    contract_id: int,
+    question: str,
+    query_embedding: Optional[List[float]] = None,
+    conversation_id: Optional[str] = None,
+    user_id: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Passages to answer `question` with, within COPILOT_CONTEXT_TOKEN_BUDGET.
+    Passages already used in the conversation come first, in their original
+    order; new ones follow in rank order. When over budget, earlier passages
+    the current question did not rank are dropped first (oldest first), then
+    the least relevant new ones. Returns None when the contract has no
+    passage index (no stored pages).
+    """
+    passages = ensure_passage_index(db, contract_id)
+    if not passages:
+        return None
+
+    key = (conversation_id, user_id, contract_id)
+    previous = conversation_cache.get(key) if conversation_id else []
+    ranked = rank_passages(passages, contract_id, question, query_embedding)
+    wanted = set(ranked)
+
+    selected = list(previous)
+    have = {p["passage_index"] for p in selected}
+    by_index = {p.passage_index: p for p in passages}
+    fetched = 0
+    for passage_index in ranked:
+        if passage_index in have:
+            continue
+        passage = by_index[passage_index]
+        text = page_store.get_text_span(db, contract_id, passage.char_start, passage.char_end).strip()
+        fetched += 1
+        selected.append({
+            "passage_index": passage_index,
+            "char_start": passage.char_start,
+            "char_end": passage.char_end,
+            "heading": passage.heading or "",
+            "text": text,
+            "tokens": estimate_tokens(text)
+        })
+
+    budget = settings.COPILOT_CONTEXT_TOKEN_BUDGET
+    total = sum(p["tokens"] for p in selected)
+    for passage in list(selected):
+        if total <= budget:
+            break
+        if passage["passage_index"] not in wanted:
+            selected.remove(passage)
+            total -= passage["tokens"]
+    while total > budget and len(selected) > 1:
+        total -= selected.pop()["tokens"]
+
+    reused = len([p for p in selected if p["passage_index"] in have])
+    conversation_cache.record(reused=reused, fetched=fetched)
+    if conversation_id:
+        conversation_cache.put(key, selected)
+
+    return {"passages": selected, "tokens": total, "reused": reused}
+
+
+def render_passages(passages: Sequence[Dict[str, Any]]) -> str:
+    return "\n\n".join(
+        f"[Passage {p['passage_index'] + 1}{' — ' + p['heading'] if p['heading'] else ''}]\n{p['text']}"
+        for p in passages
+    )
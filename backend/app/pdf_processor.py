@@ -1,67 +1,190 @@
 import pdfplumber
 import io
-from typing import Dict, Any, Optional
+import mmap
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Union
 import PyPDF2
 
+from app.config import settings
+
+PdfSource = Union[bytes, str, mmap.mmap]  # PDF bytes, a path on disk, or a memory-mapped file
+
+_page_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    global _page_pool
+    if _page_pool is None:
+        # spawn: never fork a process that holds DB connections and threads
+        _page_pool = ProcessPoolExecutor(
+            max_workers=settings.INGESTION_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _page_pool
+
+
+def shutdown_page_pool(wait: bool = False):
+    """Stop the page extraction processes (called on application shutdown)"""
+    global _page_pool
+    if _page_pool is not None:
+        _page_pool.shutdown(wait=wait, cancel_futures=True)
+        _page_pool = None
+
+
+def _pdf_stream(source: PdfSource):
+    if isinstance(source, (str, mmap.mmap)):
+        if isinstance(source, mmap.mmap):
+            source.seek(0)
+        return source  # pdfplumber opens paths itself and reads an mmap like a file
+    return io.BytesIO(source)
+
+
+@contextmanager
+def mapped_file(path: str) -> Iterator[Union[mmap.mmap, bytes]]:
+    """Read-only memory map of a file (b"" for an empty file, which can't be mapped)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield view
+        finally:
+            view.close()
+
+
+def _open_pdf(source: PdfSource):
+    return pdfplumber.open(_pdf_stream(source))
+
+
+def _extract_pages(pdf, start: int, end: int) -> List[Dict[str, Any]]:
+    """Text and tables for pages start..end-1, in one pass over each page"""
+    pages = []
+    for index in range(start, end):
+        started = time.perf_counter()
+        page_text = ""
+        page_tables = []
+        try:
+            page = pdf.pages[index]
+            page_text = page.extract_text() or ""
+            page_tables = page.extract_tables() or []
+            page.flush_cache()
+        except Exception as e:
+            print(f"pdfplumber error on page {index + 1}: {e}")
+        pages.append({
+            "page": index + 1,
+            "text": page_text,
+            "tables": page_tables,
+            "seconds": round(time.perf_counter() - started, 4)
+        })
+    return pages
+
+
+def extract_page_range(source: PdfSource, start: int, end: int) -> List[Dict[str, Any]]:
+    """Process pool task: open the document and extract one range of pages"""
+    with _open_pdf(source) as pdf:
+        return _extract_pages(pdf, start, end)
+
+
 class PDFProcessor:
     def __init__(self):
         pass
-    
-    def extract_text(self, pdf_bytes: bytes) -> Dict[str, Any]:
+
+    def extract_text(self, pdf_source: PdfSource, source_path: Optional[str] = None) -> Dict[str, Any]:
         """
-        Extract text from PDF with multiple methods for best results
+        Extract text and tables from a PDF (bytes, file path or mmap) in a single
+        pass over the pages. Documents with at least PDF_PARALLEL_MIN_PAGES pages
+        are split into ranges of PDF_PAGES_PER_TASK and extracted in a process
+        pool; the workers open `source_path` (or the path / bytes source), so an
+        mmap source is only split when its path is given.
         """
-        text_content = ""
+        pages: List[Dict[str, Any]] = []
         metadata = {}
-        
+        page_count = 0
+        started = time.perf_counter()
+
         try:
-            # Method 1: pdfplumber (best for structured data)
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_content += page_text + "\n\n"
-                
-                # Try to extract tables if any
-                tables = []
-                for page in pdf.pages:
-                    page_tables = page.extract_tables()
-                    if page_tables:
-                        tables.extend(page_tables)
-                
-                if tables:
-                    text_content += "\n\n=== TABLES ===\n\n"
-                    for table in tables:
-                        for row in table:
-                            text_content += " | ".join([str(cell) if cell else "" for cell in row]) + "\n"
-                        text_content += "\n"
-        
+            # pdfplumber (best for structured data); metadata and page count come from the same handle
+            with _open_pdf(pdf_source) as pdf:
+                page_count = len(pdf.pages)
+                metadata = dict(pdf.metadata or {})
+
+                step = max(1, settings.PDF_PAGES_PER_TASK)
+                worker_source = source_path or pdf_source
+                if (
+                    page_count >= settings.PDF_PARALLEL_MIN_PAGES
+                    and settings.INGESTION_PROCESS_WORKERS > 1
+                    and not isinstance(worker_source, mmap.mmap)  # Not picklable
+                ):
+                    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+                    pool = _get_page_pool()
+                    futures = [pool.submit(extract_page_range, worker_source, start, end) for start, end in ranges]
+                    for (start, end), future in zip(ranges, futures):
+                        try:
+                            pages.extend(future.result())
+                        except Exception as e:
+                            # A crashed or broken worker must not drop its pages: redo the range here
+                            print(f"⚠️ Page worker failed on pages {start + 1}-{end} ({e}), extracting in-process")
+                            pages.extend(_extract_pages(pdf, start, end))
+                else:
+                    pages = _extract_pages(pdf, 0, page_count)
+
         except Exception as e:
             print(f"pdfplumber error: {e}")
-        
-        # Method 2: PyPDF2 as fallback
+
+        text_parts = [page["text"] + "\n\n" for page in pages if page["text"]]
+        tables = [table for page in pages for table in page["tables"]]
+        if tables:
+            text_parts.append("\n\n=== TABLES ===\n\n")
+            for table in tables:
+                for row in table:
+                    text_parts.append(" | ".join([str(cell) if cell else "" for cell in row]) + "\n")
+                text_parts.append("\n")
+        text_content = "".join(text_parts)
+
+        # PyPDF2 as fallback
         if not text_content.strip():
             try:
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-                for page in pdf_reader.pages:
-                    text_content += page.extract_text() + "\n\n"
+                pdf_reader = PyPDF2.PdfReader(_pdf_stream(pdf_source))
+                pages = [
+                    {"page": i + 1, "text": page.extract_text() or "", "tables": [], "seconds": 0.0}
+                    for i, page in enumerate(pdf_reader.pages)
+                ]
+                text_content = "".join(page["text"] + "\n\n" for page in pages)
+                page_count = page_count or len(pdf_reader.pages)
+                metadata = metadata or {str(k): str(v) for k, v in (pdf_reader.metadata or {}).items()}
             except Exception as e:
                 print(f"PyPDF2 error: {e}")
-        
-        # Extract metadata
-        try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-            metadata = pdf_reader.metadata
-        except:
-            metadata = {}
-        
+
+        page_timings = [
+            {
+                "page": page["page"],
+                "seconds": page["seconds"],
+                "characters": len(page["text"]),
+                "tables": len(page["tables"])
+            }
+            for page in pages
+        ]
+        slow_pages = [t["page"] for t in page_timings if t["seconds"] >= settings.PDF_SLOW_PAGE_SECONDS]
+        if slow_pages:
+            print(f"⚠️ Slow PDF pages (>= {settings.PDF_SLOW_PAGE_SECONDS}s): {slow_pages}")
+
         return {
             "text": text_content.strip(),
             "metadata": metadata,
-            "page_count": len(pdf_reader.pages) if 'pdf_reader' in locals() else 0,
-            "has_tables": "=== TABLES ===" in text_content
+            "page_count": page_count,
+            "has_tables": bool(tables),
+            # Per-page text and tables, for the contract_pages store (app/page_store.py)
+            "pages": [{"page": p["page"], "text": p["text"], "tables": p["tables"]} for p in pages],
+            "page_timings": page_timings,
+            "slow_pages": slow_pages,
+            "parse_seconds": round(time.perf_counter() - started, 4)
         }
-    
+
     def clean_text(self, text: str) -> str:
         """Clean extracted text"""
         # Remove excessive whitespace
@@ -69,4 +192,22 @@ class PDFProcessor:
         text = re.sub(r'\s+', ' ', text)
         # Fix common OCR issues
         text = re.sub(r'(\d),(\d)', r'\1,\2', text)  # Fix comma in numbers
-        return text.strip()
\ No newline at end of file
+        return text.strip()
+
+
+def extract_pdf_file(file_path: str) -> Dict[str, Any]:
+    """
+    Extract and clean the text of a PDF on disk, read through a memory map.
+    Page-range workers open the file themselves, so the bytes are never
+    shipped to the process pool.
+    """
+    processor = PDFProcessor()
+    with mapped_file(file_path) as view:
+        extraction_result = processor.extract_text(view, source_path=file_path)
+    extraction_result["metadata"] = {
+        str(k): str(v) for k, v in (extraction_result.get("metadata") or {}).items()
+    }
+    return {
+        "extraction_result": extraction_result,
+        "cleaned_text": processor.clean_text(extraction_result["text"])
+    }
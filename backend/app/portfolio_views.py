@@ -0,0 +1,382 @@
+# app/portfolio_views.py
+"""
+Materialized portfolio aggregates for the dashboards and the copilot.
+
+get_dashboard_metrics joined reporting_events to contracts several times per
+request, and the copilot's analytics views (portfolio_health,
+grant_risk_exposure, overdue_reports, ...) are plain views recomputed on every
+query. Both now read precomputed rows:
+
+- mv_contract_reporting: one row per contract with its status, amount and
+  reporting-event counts (overdue / due in 30 days / submitted). The
+  dashboards aggregate these rows.
+- mv_<view> for each copilot view: a materialized copy of the live view
+  (definition-agnostic: SELECT * FROM the view) plus an mv_row_id column for
+  the unique index REFRESH ... CONCURRENTLY needs. The views have no unique
+  natural key, so mv_row_id is the md5 of the row's content plus its number
+  among identical rows: unchanged rows keep their id across refreshes and
+  only changed rows are rewritten. materialized_sql() rewrites copilot SQL
+  to read them.
+
+Views are refreshed CONCURRENTLY (readers are never blocked):
+
+- shortly after any commit that creates, deletes or changes the status,
+  amount, owner or due date of a contract or reporting event (approvals,
+  uploads, archiving...), coalesced over PORTFOLIO_VIEWS_MIN_REFRESH_SECONDS
+- every PORTFOLIO_VIEWS_REFRESH_SECONDS, and when the date changes (overdue
+  and due-soon counts depend on CURRENT_DATE)
+
+One worker refreshes at a time (transaction advisory lock), and the time of
+the last refresh is kept in portfolio_view_refreshes so every worker can
+report how fresh the rows are.
+"""
+import hashlib
+import re
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import column, event, inspect, table, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.database import engine
+
+CONTRACT_REPORTING_VIEW = "mv_contract_reporting"
+
+# Also used directly (as a subquery) when the materialized view is unavailable
+CONTRACT_REPORTING_SELECT = """
+SELECT
+    c.id AS contract_id,
+    c.created_by,
+    c.status,
+    c.grant_name,
+    c.grantor,
+    c.total_amount,
+    COUNT(e.id) FILTER (WHERE e.status = 'pending' AND e.due_date < CURRENT_DATE) AS overdue_pending_events,
+    COUNT(e.id) FILTER (
+        WHERE e.status = 'pending' AND e.due_date BETWEEN CURRENT_DATE AND CURRENT_DATE + 30
+    ) AS upcoming_pending_events,
+    COUNT(e.id) FILTER (WHERE e.status = 'submitted') AS submitted_events,
+    MIN(e.due_date) FILTER (WHERE e.status = 'pending' AND e.due_date < CURRENT_DATE) AS oldest_overdue_due_date,
+    MIN(e.due_date) FILTER (WHERE e.status = 'pending' AND e.due_date >= CURRENT_DATE) AS next_due_date
+FROM contracts c
+LEFT JOIN reporting_events e ON e.contract_id = c.id
+GROUP BY c.id
+"""
+
+CONTRACT_REPORTING_COLUMNS = (
+    "contract_id", "created_by", "status", "grant_name", "grantor", "total_amount",
+    "overdue_pending_events", "upcoming_pending_events", "submitted_events",
+    "oldest_overdue_due_date", "next_due_date"
+)
+
+contract_reporting = table(CONTRACT_REPORTING_VIEW, *[column(name) for name in CONTRACT_REPORTING_COLUMNS])
+
+# Columns whose changes make the aggregates stale
+WATCHED_FIELDS = {
+    models.Contract: ("status", "total_amount", "created_by", "grant_name", "grantor"),
+    models.ReportingEvent: ("status", "due_date", "contract_id", "pgm_approved", "director_approved"),
+}
+
+REFRESH_LOCK_KEY = 0x5046_5256  # pg advisory lock shared by every worker
+
+
+def _ensure_materialized_view(conn, name: str, source_view: Optional[str], select_sql: str, index_sqls: List[str]) -> bool:
+    """
+    Create the materialized view unless one with the same definition exists.
+    The definition (our SELECT, plus the source view's definition for the
+    copilot copies, whose SELECT * is expanded at creation) is signed in the
+    view's comment. Returns True if the view was (re)created.
+    """
+    source_definition = ""
+    if source_view:
+        source_definition = conn.execute(
+            text("SELECT definition FROM pg_views WHERE viewname = :view"), {"view": source_view}
+        ).scalar()
+        if source_definition is None:
+            raise ValueError(f"view {source_view} does not exist")
+
+    signature = hashlib.sha256(f"{select_sql}\x00{source_definition}".encode("utf-8")).hexdigest()[:16]
+    current = conn.execute(
+        text("SELECT obj_description(to_regclass(:name), 'pg_class')"), {"name": name}
+    ).scalar()
+    if current == signature:
+        return False
+
+    conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {name}"))
+    conn.execute(text(f"CREATE MATERIALIZED VIEW {name} AS {select_sql}"))
+    for sql in index_sqls:
+        conn.execute(text(sql))
+    conn.execute(text(f"COMMENT ON MATERIALIZED VIEW {name} IS '{signature}'"))
+    return True
+
+
+class PortfolioViews:
+    def __init__(self, refresh_seconds: int, min_refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self._lock = threading.Lock()
+        self._materialized: Dict[str, str] = {}  # source view -> materialized view
+        self._contract_reporting = False
+        self._pending = False
+        self._last_refresh = 0.0
+        self._last_refresh_date: Optional[date] = None
+        self._refreshed_at: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._refresh_listeners: List[Callable[[], None]] = []
+        self._counters = {"refreshes": 0, "skipped_locked": 0, "requested": 0, "errors": 0, "last_duration_ms": 0}
+
+    # ── Setup ────────────────────────────────────────────────────────────
+
+    def setup(self, copilot_views: Iterable[str]):
+        """Create (or recreate, when their definition changed) the materialized views and start refreshing"""
+        specs = [(
+            CONTRACT_REPORTING_VIEW,
+            None,
+            CONTRACT_REPORTING_SELECT,
+            [
+                f"CREATE UNIQUE INDEX ux_{CONTRACT_REPORTING_VIEW} ON {CONTRACT_REPORTING_VIEW} (contract_id)",
+                f"CREATE INDEX ix_{CONTRACT_REPORTING_VIEW}_created_by ON {CONTRACT_REPORTING_VIEW} (created_by)",
+            ]
+        )]
+        for view in sorted(copilot_views):
+            materialized = f"mv_{view}"
+            specs.append((
+                materialized,
+                view,
+                f"SELECT md5(v::text) || ':' || row_number() OVER (PARTITION BY md5(v::text)) AS mv_row_id, v.* "
+                f"FROM {view} v",
+                [f"CREATE UNIQUE INDEX ux_{materialized} ON {materialized} (mv_row_id)"]
+            ))
+
+        ready = []
+        for materialized, source_view, select_sql, index_sqls in specs:
+            try:
+                with engine.begin() as conn:
+                    # Serialized with refreshes and with other workers starting up
+                    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": REFRESH_LOCK_KEY})
+                    if _ensure_materialized_view(conn, materialized, source_view, select_sql, index_sqls):
+                        print(f"✓ Created materialized view {materialized}")
+            except Exception as e:
+                print(f"⚠️ Materialized view {materialized} unavailable: {str(e).splitlines()[0]}")
+                continue
+            ready.append(materialized)
+            with self._lock:
+                if source_view is None:
+                    self._contract_reporting = True
+                else:
+                    self._materialized[source_view] = materialized
+
+        if ready:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="portfolio-views", daemon=True)
+                self._thread.start()
+
+    def close(self):
+        self._stop.set()
+
+    # ── Refresh ──────────────────────────────────────────────────────────
+
+    def add_refresh_listener(self, listener: Callable[[], None]):
+        """Call `listener` after every refresh of this worker (e.g. to drop results cached from the old rows)"""
+        self._refresh_listeners.append(listener)
+
+    def request_refresh(self):
+        with self._lock:
+            self._pending = True
+            self._counters["requested"] += 1
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            now = time.time()
+            with self._lock:
+                pending = self._pending and now - self._last_refresh >= self.min_refresh_seconds
+                scheduled = (
+                    now - self._last_refresh >= self.refresh_seconds
+                    or self._last_refresh_date != date.today()
+                )
+            if pending:
+                self.refresh()
+            elif scheduled and not self._refreshed_elsewhere():
+                self.refresh()
+
+    def _refreshed_elsewhere(self) -> bool:
+        """True if another worker refreshed within the schedule interval (today)"""
+        refreshed_at = self.refreshed_at(force=True)
+        if refreshed_at is None:
+            return False
+        age = (datetime.now(timezone.utc) - refreshed_at).total_seconds()
+        if age < self.refresh_seconds and refreshed_at.astimezone().date() == date.today():
+            with self._lock:
+                self._last_refresh = time.time() - age
+                self._last_refresh_date = date.today()
+            return True
+        return False
+
+    def _views(self) -> List[str]:
+        with self._lock:
+            views = [CONTRACT_REPORTING_VIEW] if self._contract_reporting else []
+            return views + sorted(self._materialized.values())
+
+    def refresh(self) -> bool:
+        """REFRESH ... CONCURRENTLY every view in one transaction; False if another worker holds the lock"""
+        views = self._views()
+        with self._lock:
+            self._pending = False
+        if not views:
+            return False
+
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("SET LOCAL statement_timeout = 0"))
+                locked = conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REFRESH_LOCK_KEY}).scalar()
+                if not locked:
+                    with self._lock:
+                        self._pending = True  # Retry after the other worker's refresh
+                        self._counters["skipped_locked"] += 1
+                    return False
+
+                refreshed_at = datetime.now(timezone.utc)
+                for view in views:
+                    view_started = time.perf_counter()
+                    conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+                    row_count = conn.execute(text(f"SELECT COUNT(*) FROM {view}")).scalar()
+                    conn.execute(text("""
+                        INSERT INTO portfolio_view_refreshes (view_name, refreshed_at, duration_ms, row_count)
+                        VALUES (:view, :refreshed_at, :duration_ms, :row_count)
+                        ON CONFLICT (view_name) DO UPDATE
+                        SET refreshed_at = EXCLUDED.refreshed_at,
+                            duration_ms = EXCLUDED.duration_ms,
+                            row_count = EXCLUDED.row_count
+                    """), {
+                        "view": view,
+                        "refreshed_at": refreshed_at,
+                        "duration_ms": int((time.perf_counter() - view_started) * 1000),
+                        "row_count": row_count
+                    })
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+                self._last_refresh = time.time()  # Back off for min_refresh_seconds before retrying
+                self._pending = True
+            print(f"⚠️ Portfolio view refresh failed: {e}")
+            return False
+
+        with self._lock:
+            self._last_refresh = time.time()
+            self._last_refresh_date = date.today()
+            self._refreshed_at = refreshed_at
+            self._counters["refreshes"] += 1
+            self._counters["last_duration_ms"] = int((time.perf_counter() - started) * 1000)
+        for listener in self._refresh_listeners:
+            listener()
+        return True
+
+    # ── Reads ────────────────────────────────────────────────────────────
+
+    @property
+    def contract_reporting_available(self) -> bool:
+        return self._contract_reporting
+
+    def contract_reporting_source(self):
+        """mv_contract_reporting, or the same aggregate computed live if it's unavailable"""
+        if self._contract_reporting:
+            return contract_reporting
+        return text(CONTRACT_REPORTING_SELECT).columns(
+            *[column(name) for name in CONTRACT_REPORTING_COLUMNS]
+        ).subquery("contract_reporting")
+
+    def refreshed_at(self, db: Optional[Session] = None, force: bool = False) -> Optional[datetime]:
+        """When the views were last refreshed (by any worker); None when reading live data"""
+        if not force:
+            with self._lock:
+                if self._refreshed_at is not None and time.time() - self._last_refresh < self.min_refresh_seconds:
+                    return self._refreshed_at
+        if not self._views():
+            return None
+        try:
+            if db is not None:
+                value = db.query(models.PortfolioViewRefresh.refreshed_at).filter(
+                    models.PortfolioViewRefresh.view_name.in_(self._views())
+                ).order_by(models.PortfolioViewRefresh.refreshed_at).limit(1).scalar()
+            else:
+                with engine.connect() as conn:
+                    value = conn.execute(text(
+                        "SELECT MIN(refreshed_at) FROM portfolio_view_refreshes WHERE view_name = ANY(:views)"
+                    ), {"views": self._views()}).scalar()
+        except Exception as e:
+            print(f"⚠️ Could not read portfolio view freshness: {e}")
+            return None
+        return value
+
+    def materialized_sql(self, sql: str) -> Tuple[str, bool]:
+        """Point copilot SQL at the materialized copies of its views; returns (sql, rewritten)"""
+        with self._lock:
+            materialized = dict(self._materialized)
+        if not materialized:
+            return sql, False
+        pattern = re.compile(r"\b(" + "|".join(re.escape(v) for v in materialized) + r")\b", re.IGNORECASE)
+        rewritten = pattern.sub(lambda m: materialized[m.group(1).lower()], sql)
+        return rewritten, rewritten != sql
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "views": ([CONTRACT_REPORTING_VIEW] if self._contract_reporting else []) + sorted(self._materialized.values()),
+                "pending": self._pending,
+                "refresh_seconds": self.refresh_seconds,
+                "min_refresh_seconds": self.min_refresh_seconds,
+                "refreshed_at": self._refreshed_at.isoformat() if self._refreshed_at else None,
+                **self._counters
+            }
+
+
+portfolio_views = PortfolioViews(
+    refresh_seconds=settings.PORTFOLIO_VIEWS_REFRESH_SECONDS,
+    min_refresh_seconds=settings.PORTFOLIO_VIEWS_MIN_REFRESH_SECONDS
+)
+
+
+# ─────────────────────────────────────────────────────────────
+# Refresh after status-changing writes
+# ─────────────────────────────────────────────────────────────
+
+def _affects_portfolio(obj, check_fields: bool) -> bool:
+    fields = WATCHED_FIELDS.get(type(obj))
+    if fields is None:
+        return False
+    if not check_fields:
+        return True
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_portfolio_changes(session, flush_context):
+    changed = (
+        any(_affects_portfolio(obj, False) for obj in session.new)
+        or any(_affects_portfolio(obj, False) for obj in session.deleted)
+        or any(_affects_portfolio(obj, True) for obj in session.dirty)
+    )
+    if changed:
+        session.info["portfolio_views_stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_changed_portfolio(session):
+    if session.info.pop("portfolio_views_stale", False):
+        portfolio_views.request_refresh()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_portfolio_changes(session):
+    session.info.pop("portfolio_views_stale", None)
@@ -0,0 +1,208 @@
+# app/principal_cache.py
+"""
+Token -> principal cache for get_current_user, plus coalesced last-seen writes.
+
+get_current_user used to decode the JWT, load the user by username and then
+UPDATE users.last_login with a commit on every API call, so dashboard polling
+turned every GET into a row-locking write.
+
+- PrincipalCache keeps the decoded user row per token for
+  PRINCIPAL_CACHE_TTL_SECONDS (never past the token's exp). A hit re-attaches
+  the user to the request session without a query, so endpoints still get a
+  normal ORM User they can modify and commit.
+- Entries for a user are dropped after any commit that changes or deletes
+  that user (role, is_active, password...). Other worker processes pick the
+  change up when their entry expires.
+- LastSeenTracker keeps the latest request time per user in memory and
+  writes them all with one bulk UPDATE every LAST_SEEN_FLUSH_INTERVAL
+  seconds (and on shutdown).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.config import settings
+from app.auth_models import User
+
+_user_columns = None
+
+
+def _get_user_columns():
+    """
+    Attribute names of User's columns. Computed on first use: inspecting the
+    mapper at import time would configure every mapper before app.models
+    (Contract, ...) is imported.
+    """
+    global _user_columns
+    if _user_columns is None:
+        _user_columns = [attr.key for attr in inspect(User).column_attrs]
+    return _user_columns
+
+
+def _token_key(token: str) -> str:
+    # Don't keep raw bearer tokens in memory longer than needed
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get_user(self, db: Session, token: str) -> Optional[User]:
+        """Cached user for this token, attached to `db` without a SELECT"""
+        if not self.ttl_seconds:
+            return None
+        key = _token_key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            values = entry[2]
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, token: str, user: User, token_expires_at: Optional[float] = None):
+        # Inactive users are never cached, so a hit always means an active account
+        if not self.ttl_seconds or not user.is_active:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at:
+            expires_at = min(expires_at, token_expires_at)
+        values = {column: getattr(user, column) for column in _get_user_columns()}
+        with self._lock:
+            self._entries[_token_key(token)] = (expires_at, user.id, values)
+            self._entries.move_to_end(_token_key(token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] == user_id]
+            for key in stale:
+                del self._entries[key]
+            self._counters["invalidations"] += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+            }
+
+
+class LastSeenTracker:
+    """Coalesces per-request last-seen timestamps into periodic bulk UPDATEs"""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[int, datetime] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"touches": 0, "flushes": 0, "rows_written": 0, "errors": 0}
+
+    def touch(self, user_id: int):
+        with self._lock:
+            self._pending[user_id] = datetime.now(timezone.utc)
+            self._counters["touches"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="last-seen-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        from app.database import SessionLocal
+        db = SessionLocal()
+        try:
+            # ORM bulk UPDATE by primary key: one executemany for every user seen
+            db.execute(update(User), [
+                {"id": user_id, "last_login": seen_at} for user_id, seen_at in pending.items()
+            ])
+            db.commit()
+            with self._lock:
+                self._counters["flushes"] += 1
+                self._counters["rows_written"] += len(pending)
+            return len(pending)
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self._counters["errors"] += 1
+                # Keep the newest timestamp for the next attempt
+                for user_id, seen_at in pending.items():
+                    self._pending.setdefault(user_id, seen_at)
+            print(f"⚠️ Failed to write last-seen timestamps: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def close(self):
+        """Write pending timestamps and stop the writer (application shutdown)"""
+        self._stop.set()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "flush_interval_seconds": self.flush_interval,
+                **self._counters
+            }
+
+
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES
+)
+last_seen_tracker = LastSeenTracker(flush_interval=settings.LAST_SEEN_FLUSH_INTERVAL)
+
+
+# ─────────────────────────────────────────────────────────────
+# Drop cached principals when their user row changes
+# ─────────────────────────────────────────────────────────────
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_changes(session, flush_context):
+    changed = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault("principal_changes", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("principal_changes", ()):
+        principal_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session):
+    session.info.pop("principal_changes", None)
@@ -1,11 +1,113 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
 from app.config import settings
 import uuid
 
+# Every object of a contract lives under contracts/{id}/, so listing or
+# deleting a contract's files touches only its own keys. Keys written before
+# this layout were contract_{id}_{filename} at the bucket root
+# (migrate_s3_keys.py moves them).
+CONTRACT_PREFIX = "contracts/"
+LEGACY_CONTRACT_KEY = re.compile(r"^contract_(\d+)_(.+)$")
+DELETE_BATCH_SIZE = 1000  # delete_objects limit
+
+# upload_file: multipart (parallel parts, read from disk) above the threshold
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=settings.S3_MULTIPART_THRESHOLD_BYTES,
+    multipart_chunksize=settings.S3_MULTIPART_CHUNK_BYTES,
+    max_concurrency=settings.S3_MAX_CONCURRENCY
+)
+
+
+class PresignedUrl(NamedTuple):
+    url: str
+    expires_at: float  # Unix time
+
+
+class PresignedUrlCache:
+    """
+    Presigned GET URLs reused until shortly before they expire.
+
+    Time is cut into buckets of (expires_in - min_remaining) seconds and a URL
+    is keyed by (key, expires_in, bucket). A URL generated in a bucket expires
+    min_remaining seconds after the bucket ends, so whatever is served always
+    has at least min_remaining seconds left, and callers in the same bucket
+    (e.g. the PDF viewer paging through a contract) get the same URL, which
+    the browser can cache too.
+    """
+
+    def __init__(self, min_remaining_seconds: int, max_entries: int):
+        self.min_remaining_seconds = min_remaining_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, PresignedUrl]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def window(self, expires_in: int, now: float):
+        """(bucket, seconds the URL must be valid for from now)"""
+        margin = min(self.min_remaining_seconds, expires_in // 2)
+        bucket_seconds = max(1, expires_in - margin)
+        bucket = int(now // bucket_seconds)
+        return bucket, int((bucket + 1) * bucket_seconds + margin - now)
+
+    def get(self, key: tuple) -> Optional[PresignedUrl]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry
+
+    def put(self, key: tuple, presigned: PresignedUrl):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = presigned
+            # Expired URLs belong to earlier buckets and are never asked for again
+            for stale in [k for k, entry in self._entries.items() if entry.expires_at <= now]:
+                del self._entries[stale]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_keys(self, s3_keys: List[str]):
+        s3_keys = set(s3_keys)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in s3_keys]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "min_remaining_seconds": self.min_remaining_seconds,
+                "max_entries": self.max_entries,
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+            }
+
+
+def contract_prefix(contract_id: int) -> str:
+    return f"{CONTRACT_PREFIX}{contract_id}/"
+
+
+def contract_pdf_key(contract_id: int, filename: str) -> str:
+    """contracts/{id}/{filename}, without spaces and parentheses"""
+    original_name = os.path.splitext(filename)[0]
+    original_ext = os.path.splitext(filename)[1] or '.pdf'
+    name = f"{original_name}{original_ext}".replace(' ', '_').replace('(', '').replace(')', '')
+    return f"{contract_prefix(contract_id)}{name}"
+
+
 class S3Service:
     def __init__(self):
         """Initialize S3 client with credentials from settings"""
@@ -16,6 +118,10 @@ class S3Service:
         
         # Initialize S3 client
         self.s3_client = self._create_s3_client()
+        self.presigned_urls = PresignedUrlCache(
+            min_remaining_seconds=settings.PRESIGNED_URL_MIN_REMAINING_SECONDS,
+            max_entries=settings.PRESIGNED_URL_CACHE_MAX_ENTRIES
+        )
     
     def _create_s3_client(self):
         """Create and return S3 client"""
@@ -32,7 +138,7 @@ class S3Service:
     
     def store_original_pdf(self, contract_id: int, filename: str, file_content: bytes) -> Optional[str]:
         """
-        Store original PDF in S3 bucket (PDF alone, no subfolders)
+        Store original PDF in S3 under contracts/{contract_id}/
         
         Args:
             contract_id: The contract ID from PostgreSQL
@@ -47,20 +153,11 @@ class S3Service:
             return None
         
         try:
-            # Generate clean filename - just PDF alone, no folders
-            # Keep original filename but make it unique with contract_id
-            original_name = os.path.splitext(filename)[0]
-            original_ext = os.path.splitext(filename)[1] or '.pdf'
-            
-            # Create simple S3 key: contract_{id}_{original_name}.pdf
-            s3_key = f"contract_{contract_id}_{original_name}{original_ext}"
-            
-            # Remove any special characters and spaces
-            s3_key = s3_key.replace(' ', '_').replace('(', '').replace(')', '')
+            # Keep original filename, under the contract's own prefix
+            s3_key = contract_pdf_key(contract_id, filename)
             
             print(f"📤 Uploading PDF to S3: {s3_key}")
             
-            # Upload to S3 - just the PDF file, no folders
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=s3_key,
@@ -74,7 +171,7 @@ class S3Service:
                 }
             )
             
-            print(f"✅ PDF stored in S3 bucket root: {s3_key}")
+            print(f"✅ PDF stored in S3: {s3_key}")
             return s3_key
             
         except ClientError as e:
@@ -84,20 +181,120 @@ class S3Service:
             print(f"⚠️ Error storing PDF in S3: {e}")
             return None
     
-    def get_pdf_url(self, s3_key: str, expires_in: int = 3600) -> Optional[str]:
+    def store_original_pdf_file(self, contract_id: int, filename: str, file_path: str,
+                                sha256: Optional[str] = None) -> Optional[str]:
         """
-        Generate a pre-signed URL for accessing the PDF
+        Store original PDF from a file on disk (a spooled upload), streamed with
+        a multipart upload above S3_MULTIPART_THRESHOLD_BYTES
         
         Args:
-            s3_key: The S3 object key (PDF filename)
+            contract_id: The contract ID from PostgreSQL
+            filename: Original filename
+            file_path: Path of the PDF on disk
+            sha256: Content hash, stored as object metadata
+            
+        Returns:
+            S3 key if successful, None otherwise
+        """
+        if not self.s3_client:
+            print("⚠️ S3 client not initialized. Check AWS credentials.")
+            return None
+        
+        try:
+            s3_key = contract_pdf_key(contract_id, filename)
+            metadata = {
+                'contract_id': str(contract_id),
+                'original_filename': filename,
+                'upload_timestamp': datetime.now().isoformat(),
+                'upload_type': 'original_pdf'
+            }
+            if sha256:
+                metadata['sha256'] = sha256
+            
+            print(f"📤 Uploading PDF to S3: {s3_key} ({os.path.getsize(file_path)} bytes)")
+            self.s3_client.upload_file(
+                file_path,
+                self.bucket_name,
+                s3_key,
+                ExtraArgs={'ContentType': 'application/pdf', 'Metadata': metadata},
+                Config=TRANSFER_CONFIG
+            )
+            
+            print(f"✅ PDF stored in S3: {s3_key}")
+            return s3_key
+            
+        except ClientError as e:
+            print(f"⚠️ AWS S3 Error: {e}")
+            return None
+        except Exception as e:
+            print(f"⚠️ Error storing PDF in S3: {e}")
+            return None
+    
+    def copy_original_pdf(self, source_key: str, contract_id: int, filename: str,
+                          sha256: Optional[str] = None) -> Optional[str]:
+        """
+        Server-side copy of another contract's PDF (same content) to this
+        contract's key, with this contract's object metadata
+
+        Returns:
+            S3 key if successful, None otherwise
+        """
+        if not self.s3_client:
+            print("⚠️ S3 client not initialized. Check AWS credentials.")
+            return None
+
+        try:
+            s3_key = contract_pdf_key(contract_id, filename)
+            metadata = {
+                'contract_id': str(contract_id),
+                'original_filename': filename,
+                'upload_timestamp': datetime.now().isoformat(),
+                'upload_type': 'original_pdf',
+                'copied_from': source_key
+            }
+            if sha256:
+                metadata['sha256'] = sha256
+
+            self.s3_client.copy(
+                {'Bucket': self.bucket_name, 'Key': source_key},
+                self.bucket_name,
+                s3_key,
+                ExtraArgs={'ContentType': 'application/pdf', 'Metadata': metadata, 'MetadataDirective': 'REPLACE'},
+                Config=TRANSFER_CONFIG
+            )
+
+            print(f"✅ PDF copied in S3: {source_key} -> {s3_key}")
+            return s3_key
+
+        except ClientError as e:
+            print(f"⚠️ AWS S3 Error: {e}")
+            return None
+        except Exception as e:
+            print(f"⚠️ Error copying PDF in S3: {e}")
+            return None
+
+    def get_presigned_pdf_url(self, s3_key: str, expires_in: int = 3600) -> Optional[PresignedUrl]:
+        """
+        Pre-signed URL for accessing the PDF, reused from the cache until
+        PRESIGNED_URL_MIN_REMAINING_SECONDS before it expires
+        
+        Args:
+            s3_key: The S3 object key
             expires_in: URL expiry time in seconds (default: 1 hour)
             
         Returns:
-            Pre-signed URL if successful, None otherwise
+            PresignedUrl (url, expires_at) if successful, None otherwise
         """
         if not self.s3_client:
             return None
         
+        now = time.time()
+        bucket, valid_for = self.presigned_urls.window(expires_in, now)
+        cache_key = (s3_key, expires_in, bucket)
+        cached = self.presigned_urls.get(cache_key)
+        if cached:
+            return cached
+        
         try:
             url = self.s3_client.generate_presigned_url(
                 'get_object',
@@ -105,16 +302,70 @@ class S3Service:
                     'Bucket': self.bucket_name,
                     'Key': s3_key
                 },
-                ExpiresIn=expires_in
+                ExpiresIn=valid_for
             )
-            return url
         except Exception as e:
             print(f"Error generating pre-signed URL: {e}")
             return None
+        
+        presigned = PresignedUrl(url=url, expires_at=now + valid_for)
+        self.presigned_urls.put(cache_key, presigned)
+        return presigned
+    
+    def get_pdf_url(self, s3_key: str, expires_in: int = 3600) -> Optional[str]:
+        """
+        Pre-signed URL for accessing the PDF (cached, see get_presigned_pdf_url)
+        
+        Args:
+            s3_key: The S3 object key
+            expires_in: URL expiry time in seconds (default: 1 hour)
+            
+        Returns:
+            Pre-signed URL if successful, None otherwise
+        """
+        presigned = self.get_presigned_pdf_url(s3_key, expires_in)
+        return presigned.url if presigned else None
+    
+    def iter_objects(self, prefix: str = "") -> Iterator[dict]:
+        """All objects under `prefix`, following list_objects_v2 pagination"""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            yield from page.get('Contents', [])
+
+    def delete_keys(self, keys: List[str]) -> int:
+        """
+        Delete objects in batches of up to 1,000 keys (one request per batch)
+        
+        Returns:
+            Number of objects deleted; raises if any key could not be deleted
+        """
+        deleted = 0
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[i:i + DELETE_BATCH_SIZE]
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+            )
+            errors = response.get('Errors', [])
+            deleted += len(batch) - len(errors)
+            if errors:
+                details = ", ".join(f"{e['Key']}: {e.get('Code')}" for e in errors[:5])
+                raise Exception(f"{len(errors)} of {len(batch)} objects not deleted ({details})")
+        return deleted
+    
+    def copy_object(self, source_key: str, target_key: str):
+        """Server-side copy within the bucket, metadata included"""
+        self.s3_client.copy_object(
+            Bucket=self.bucket_name,
+            Key=target_key,
+            CopySource={'Bucket': self.bucket_name, 'Key': source_key},
+            MetadataDirective='COPY'
+        )
     
     def delete_contract_files(self, contract_id: int) -> bool:
         """
-        Delete contract PDF from S3 bucket
+        Delete every S3 object of a contract: its contracts/{id}/ prefix, plus
+        contract_{id}_* keys at the bucket root not yet migrated
         
         Args:
             contract_id: The contract ID
@@ -126,27 +377,16 @@ class S3Service:
             return False
         
         try:
-            # Since we store PDFs with contract_id in filename, we can find them
-            # List all objects and find ones matching our contract
-            files_deleted = 0
+            keys = [obj['Key'] for obj in self.iter_objects(contract_prefix(contract_id))]
+            # The prefix ends at the "_" after the id, so contract 1 never matches contract_12_...
+            keys += [obj['Key'] for obj in self.iter_objects(f"contract_{contract_id}_")]
             
-            # List all objects in bucket
-            response = self.s3_client.list_objects_v2(Bucket=self.bucket_name)
+            self.presigned_urls.invalidate_keys(keys)
+            files_deleted = self.delete_keys(keys) if keys else 0
+            for key in keys:
+                print(f"🗑️ Deleted from S3: {key}")
             
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    # Check if this file belongs to our contract
-                    if f'contract_{contract_id}_' in key:
-                        # Delete this PDF
-                        self.s3_client.delete_object(
-                            Bucket=self.bucket_name,
-                            Key=key
-                        )
-                        files_deleted += 1
-                        print(f"🗑️ Deleted PDF from S3: {key}")
-            
-            print(f"✅ Deleted {files_deleted} PDFs from S3 for contract {contract_id}")
+            print(f"✅ Deleted {files_deleted} files from S3 for contract {contract_id}")
             return True
             
         except Exception as e:
@@ -164,21 +404,15 @@ class S3Service:
             return []
         
         try:
-            pdfs = []
-            
-            response = self.s3_client.list_objects_v2(Bucket=self.bucket_name)
-            
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.lower().endswith('.pdf'):
-                        pdfs.append({
-                            'filename': key,
-                            'size': obj['Size'],
-                            'last_modified': obj['LastModified'].isoformat()
-                        })
-            
-            return pdfs
+            return [
+                {
+                    'filename': obj['Key'],
+                    'size': obj['Size'],
+                    'last_modified': obj['LastModified'].isoformat()
+                }
+                for obj in self.iter_objects()
+                if obj['Key'].lower().endswith('.pdf')
+            ]
         except Exception as e:
             print(f"Error listing S3 PDFs: {e}")
             return []
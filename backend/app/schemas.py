@@ -99,6 +99,7 @@ class MetadataUpdateRequest(BaseModel):
     end_date: Optional[str] = None
     purpose: Optional[str] = None
     notes: Optional[str] = None
+    reextract: Optional[bool] = False  # Re-run the AI extraction on the stored text first (every chunk, bypassing the extraction cache)
 
 class RespondToCommentsRequest(BaseModel):
     response: str
@@ -234,4 +235,5 @@ class CopilotMessage(BaseModel):
 class CopilotChatRequest(BaseModel):
     message: str
     contract_id: Optional[int] = None  # None = analytics/portfolio mode
-    chat_history: List[CopilotMessage] = []
\ No newline at end of file
+    chat_history: List[CopilotMessage] = []
+    conversation_id: Optional[str] = None  # Returned by the first answer; reuses document passages across turns
\ No newline at end of file
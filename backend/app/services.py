@@ -1,4 +1,3 @@
-import openai
 import pdfplumber
 import PyPDF2
 import tiktoken
@@ -8,13 +7,13 @@ import os
 from datetime import datetime
 import logging
 import numpy as np
+from app.llm_gateway import llm_gateway
 
 logger = logging.getLogger(__name__)
 
 class PDFExtractor:
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.openai_api_key
         
     def extract_text_from_pdf(self, file_path: str) -> Dict[str, Any]:
         """Extract text from PDF using multiple methods for accuracy"""
@@ -109,7 +108,7 @@ class PDFExtractor:
         """
         
         try:
-            response = openai.ChatCompletion.create(
+            response = llm_gateway.chat(
                 model="gpt-3.5-turbo",  # Using gpt-3.5-turbo for cost efficiency
                 messages=[
                     {"role": "system", "content": "You are a contract analysis expert. Extract structured data from contracts."},
@@ -182,11 +181,11 @@ class PDFExtractor:
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding vector for text"""
         try:
-            response = openai.Embedding.create(
+            response = llm_gateway.embed(
                 model="text-embedding-ada-002",
                 input=text[:8000]  # Limit text for embedding
             )
-            return response['data'][0]['embedding']
+            return response.data[0].embedding
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
             return [0] * 1536  # Return zero vector if failed
@@ -194,7 +193,7 @@ class PDFExtractor:
     def generate_summary(self, text: str, max_length: int = 200) -> str:
         """Generate a concise summary of the contract"""
         try:
-            response = openai.ChatCompletion.create(
+            response = llm_gateway.chat(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "You are a contract summarizer."},
@@ -0,0 +1,149 @@
+# app/sql_guard.py
+"""
+Safety check for the SELECT statements the copilot generates.
+
+The statement is tokenized (string literals, quoted and unquoted identifiers,
+operators) rather than matched with regexes, so every relation it reads is
+found wherever it appears:
+
+- after FROM / JOIN, and after each comma of a FROM list
+  (FROM a, b / FROM a JOIN b ON ... , c)
+- inside subqueries at any depth
+- quoted ("users") or schema-qualified (public.users) names
+
+Every relation must be one of the allowed views. Table functions in FROM,
+system/admin functions that can read other relations (query_to_xml,
+pg_read_file, dblink, ...) and anything the tokenizer does not recognize
+are rejected. FROM inside EXTRACT(... FROM col) and similar calls is not a
+relation reference.
+"""
+import re
+from typing import Iterable, List, Optional, Tuple
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")+")
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+  | (?P<param>:[A-Za-z_]\w*)
+  | (?P<op>::|<>|<=|>=|!=|\|\||[(),.*=<>+\-/%\[\]])
+""", re.VERBOSE)
+
+_FORBIDDEN_WORDS = frozenset("""
+insert update delete drop alter create truncate grant revoke execute call copy
+table into do lock listen notify vacuum analyze
+""".split())
+
+# Calls whose FROM is an argument, not a relation
+_FROM_FUNCTIONS = frozenset({"extract", "substring", "trim", "overlay", "position"})
+
+# Functions that read files, other relations or settings behind the check's back
+_FORBIDDEN_FUNCTION = re.compile(
+    r"^(?:pg_|lo_|dblink|query_to_|table_to_|cursor_to_|schema_to_|database_to_|"
+    r"current_setting$|set_config$|xpath|txid_|version$)"
+)
+
+# Keywords that end a FROM list at the same parenthesis depth
+_FROM_LIST_END = frozenset("""
+where group order having limit offset union intersect except window fetch for returning
+""".split())
+
+Token = Tuple[str, str]
+
+
+def tokenize(sql: str) -> Optional[List[Token]]:
+    """(kind, value) tokens without whitespace; None if the text has anything unrecognized"""
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = _TOKEN.match(sql, position)
+        if not match:
+            return None
+        position = match.end()
+        if match.lastgroup == "string" and "\\" in match.group():
+            # E'...' escapes would end the literal somewhere else than this tokenizer thinks
+            return None
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+    return tokens
+
+
+def _identifier(token: Token) -> Optional[str]:
+    kind, value = token
+    if kind == "word":
+        return value.lower()
+    if kind == "quoted":
+        # Quoted names are case-sensitive in Postgres
+        return value[1:-1].replace('""', '"')
+    return None
+
+
+def is_safe_select(sql: str, allowed_relations: Iterable[str]) -> bool:
+    """True for a single SELECT that only reads `allowed_relations`"""
+    allowed = {name.lower() for name in allowed_relations}
+    # Comments and statement separators could hide text from the tokenizer
+    if "--" in sql or "/*" in sql or ";" in sql:
+        return False
+    tokens = tokenize(sql.strip())
+    if not tokens or _identifier(tokens[0]) != "select":
+        return False
+
+    # Per parenthesis depth: (opened by a FROM-argument function, inside a FROM list)
+    stack = [(False, False)]
+    relations = 0
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        word = value.lower() if kind == "word" else None
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+
+        if word in _FORBIDDEN_WORDS:
+            return False
+        if kind == "word" and following == ("op", "(") and _FORBIDDEN_FUNCTION.match(word):
+            return False
+
+        if value == "(":
+            previous = _identifier(tokens[i - 1]) if i else None
+            stack.append((previous in _FROM_FUNCTIONS, False))
+        elif value == ")":
+            if len(stack) == 1:
+                return False
+            stack.pop()
+        elif word in ("from", "join") and not stack[-1][0]:
+            stack[-1] = (False, True)
+        elif word in _FROM_LIST_END:
+            stack[-1] = (stack[-1][0], False)
+
+        starts_relation = (word in ("from", "join") and not stack[-1][0]) or (value == "," and stack[-1][1])
+        if not starts_relation:
+            i += 1
+            continue
+
+        # Read the relation that follows
+        i += 1
+        while i < len(tokens) and tokens[i][0] == "word" and tokens[i][1].lower() in ("lateral", "only"):
+            i += 1
+        if i >= len(tokens):
+            return False
+        if tokens[i] == ("op", "("):
+            # Subquery: its own FROM clauses are checked as the scan continues
+            continue
+
+        name = _identifier(tokens[i])
+        if name is None:
+            return False
+        i += 1
+        if i + 1 < len(tokens) and tokens[i] == ("op", "."):
+            schema, name = name, _identifier(tokens[i + 1])
+            if schema != "public" or name is None:
+                return False
+            i += 2
+        if i < len(tokens) and tokens[i] == ("op", "("):
+            # Table function
+            return False
+        if name not in allowed:
+            return False
+        relations += 1
+
+    return len(stack) == 1 and relations > 0
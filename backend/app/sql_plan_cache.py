@@ -0,0 +1,340 @@
+# app/sql_plan_cache.py
+"""
+Question -> SQL plan cache for the copilot's analytics mode.
+
+Every analytics question used to cost a GPT-4o round trip just to write the
+SQL, even for the handful of questions the portfolio team asks all day.
+Plans are now looked up in three steps before generation:
+
+1. Templates: pre-seeded, parameterized queries for common questions
+   ("overdue reports", "reports due in the next 14 days", "funds at risk",
+   "balance remaining for <grant>"), matched by pattern on the normalized
+   question. Parameters are bound, never interpolated.
+2. Exact: generated SQL previously validated (it passed the safety check and
+   executed) for the same normalized question.
+3. Similar: the nearest cached question by embedding cosine similarity, at or
+   above SQL_PLAN_SIMILARITY_THRESHOLD. Generated SQL embeds the question's
+   values (grant names, dates, day counts), and "balance for grant Alpha"
+   embeds close to "balance for grant Beta", so a plan with literals is only
+   reused when the new question has the same values (question_literals).
+
+Generated plans expire after SQL_PLAN_CACHE_TTL_SECONDS. The whole cache is
+dropped when the schema fingerprint changes: a hash of the prompt's view
+description plus the live definitions of the views (pg_views), checked at
+most every SQL_PLAN_SCHEMA_CHECK_SECONDS.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.sql_guard import tokenize
+
+FILLER_WORDS = frozenset("""
+a an the please show me list give get can could you would what which are is of all our my us for tell display
+""".split())
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and filler words ("show me the ..."), collapse whitespace"""
+    words = re.findall(r"[a-z0-9]+", (question or "").lower())
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def question_literals(question: str) -> frozenset:
+    """
+    The values a question can pass into generated SQL: numbers, quoted
+    phrases and capitalized words other than a sentence's first word
+    """
+    question = question or ""
+    values = set(re.findall(r"\d+(?:\.\d+)?", question))
+    values.update(phrase.strip().lower() for phrase in re.findall(r"[\"'“‘]([^\"'”’]+)[\"'”’]", question))
+    for sentence in re.split(r"[.?!]\s+", question):
+        words = re.findall(r"[A-Za-z][\w&-]*", sentence)
+        values.update(word.lower() for word in words[1:] if word[0].isupper())
+    return frozenset(values)
+
+
+def sql_literals(sql: str) -> Optional[frozenset]:
+    """Words of the string and number constants in generated SQL; None when it embeds none"""
+    tokens = tokenize(sql) or []
+    constants = [value for kind, value in tokens if kind in ("string", "number")]
+    if tokens and not constants:
+        return None
+    return frozenset(word for value in constants for word in re.findall(r"[a-z0-9]+", value.lower()))
+
+
+class SqlPlan(NamedTuple):
+    sql: str
+    params: Dict[str, Any]
+    source: str  # template | exact | similar | generated
+    similarity: Optional[float] = None
+    template: Optional[str] = None
+    embedding: Optional[List[float]] = None  # Question embedding, kept for store()
+
+
+class SqlTemplate(NamedTuple):
+    name: str
+    pattern: "re.Pattern"
+    sql: str
+    params: Callable[["re.Match"], Dict[str, Any]]
+
+
+def _no_params(match) -> Dict[str, Any]:
+    return {}
+
+
+def _first_group_int(name: str):
+    return lambda match: {name: int(next(group for group in match.groups() if group))}
+
+
+# Patterns must match the whole normalize_question() output (filler words
+# removed), so a more specific question ("overdue reports for grant X") is
+# left to generation instead of getting a generic answer.
+TEMPLATES: List[SqlTemplate] = [
+    SqlTemplate(
+        name="reports_due_within_days",
+        pattern=re.compile(
+            r"(?:upcoming\s+)?reports?\s+(?:due\s+)?(?:in\s+|within\s+)?next\s+(\d{1,3})\s+days?"
+            r"|reports?\s+due\s+(?:in|within)\s+(\d{1,3})\s+days?"
+        ),
+        sql=(
+            "SELECT grant_name, report_type, due_date, days_remaining, status, responsible_person "
+            "FROM active_reports_tracker WHERE days_remaining BETWEEN 0 AND :days ORDER BY due_date"
+        ),
+        params=_first_group_int("days")
+    ),
+    SqlTemplate(
+        name="overdue_reports",
+        pattern=re.compile(r"(?:overdue|late)\s+reports?|reports?\s+(?:overdue|past\s+due|late)"),
+        sql=(
+            "SELECT grant_name, report_type, due_date, days_overdue, status "
+            "FROM overdue_reports ORDER BY days_overdue DESC"
+        ),
+        params=_no_params
+    ),
+    SqlTemplate(
+        name="upcoming_reports",
+        pattern=re.compile(r"upcoming\s+(?:reports?|deadlines?)|reports?\s+(?:due\s+soon|coming\s+up)"),
+        sql=(
+            "SELECT grant_name, report_type, due_date, days_remaining, status, responsible_person "
+            "FROM upcoming_reports_30_days ORDER BY due_date"
+        ),
+        params=_no_params
+    ),
+    SqlTemplate(
+        name="funds_at_risk",
+        pattern=re.compile(
+            r"(?:funds?|money|funding|amount)\s+at\s+risk|(?:financial\s+)?risk\s+exposure"
+            r"|how\s+much\s+(?:money|funding)\s+at\s+risk"
+        ),
+        sql=(
+            "SELECT grant_name, risk_type, financial_exposure "
+            "FROM grant_risk_exposure ORDER BY financial_exposure DESC"
+        ),
+        params=_no_params
+    ),
+    SqlTemplate(
+        name="grants_at_risk",
+        pattern=re.compile(r"grants?\s+at\s+risk|at\s+risk\s+grants?"),
+        sql="SELECT grant_name, reporting_status FROM portfolio_health WHERE reporting_status = 'At Risk' ORDER BY grant_name",
+        params=_no_params
+    ),
+    SqlTemplate(
+        name="grant_balance",
+        pattern=re.compile(r"(?:remaining\s+)?balance(?:\s+remaining)?\s+(?:on\s+|grant\s+)+([a-z0-9]+(?:\s+[a-z0-9]+){0,9})"),
+        sql=(
+            "SELECT grant_name, total_amount, amount_received, balance_remaining "
+            "FROM grant_financial_summary WHERE grant_name ILIKE :grant_name ORDER BY grant_name"
+        ),
+        # Words joined by % so punctuation dropped by normalization still matches
+        params=lambda match: {"grant_name": "%" + "%".join(match.group(1).split()) + "%"}
+    ),
+    SqlTemplate(
+        name="portfolio_overview",
+        pattern=re.compile(
+            r"(?:total\s+)?portfolio\s+(?:value|size|overview)|total\s+(?:grant\s+|portfolio\s+)?value"
+            r"|how\s+many\s+grants(?:\s+do\s+we\s+have)?"
+        ),
+        sql="SELECT total_grants, total_value FROM portfolio_financial_overview",
+        params=_no_params
+    ),
+]
+
+
+class SqlPlanCache:
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_entries: int,
+        similarity_threshold: float,
+        schema_check_seconds: int,
+        templates: Sequence[SqlTemplate] = ()
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.schema_check_seconds = schema_check_seconds
+        self.templates = list(templates)
+        self._lock = threading.Lock()
+        # normalized question -> (expires_at, sql, unit embedding or None,
+        #                         (question_literals, sql_literals) or None when the SQL has no constants)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._fingerprint: Optional[str] = None
+        self._fingerprint_checked = 0.0
+        self._counters = {
+            "template_hits": 0,
+            "exact_hits": 0,
+            "similar_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "invalidations": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    # ── Schema fingerprint ───────────────────────────────────────────────
+
+    def check_schema(self, db: Session, views: Sequence[str], schema_description: str):
+        """Drop every cached plan if the view definitions (or their description) changed"""
+        now = time.time()
+        if self._fingerprint is not None and now - self._fingerprint_checked < self.schema_check_seconds:
+            return
+
+        digest = hashlib.sha256(schema_description.encode("utf-8"))
+        try:
+            rows = db.execute(
+                text("SELECT viewname, definition FROM pg_views WHERE viewname = ANY(:views) ORDER BY viewname"),
+                {"views": list(views)}
+            ).fetchall()
+            for viewname, definition in rows:
+                digest.update(f"\x00{viewname}\x00{definition}".encode("utf-8"))
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Could not read view definitions for the SQL plan cache: {e}")
+        fingerprint = digest.hexdigest()
+
+        with self._lock:
+            if self._fingerprint is not None and fingerprint != self._fingerprint:
+                self._entries.clear()
+                self._counters["invalidations"] += 1
+                print("✓ Copilot view definitions changed, SQL plan cache cleared")
+            self._fingerprint = fingerprint
+            self._fingerprint_checked = now
+
+    # ── Lookup ───────────────────────────────────────────────────────────
+
+    def match_template(self, question: str) -> Optional[SqlPlan]:
+        normalized = normalize_question(question)
+        for template in self.templates:
+            match = template.pattern.fullmatch(normalized)
+            if match:
+                self._count("template_hits")
+                return SqlPlan(sql=template.sql, params=template.params(match), source="template", template=template.name)
+        return None
+
+    def get_exact(self, question: str) -> Optional[SqlPlan]:
+        if not self.enabled:
+            return None
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._counters["exact_hits"] += 1
+            return SqlPlan(sql=entry[1], params={}, source="exact", similarity=1.0)
+
+    def get_similar(self, question: str, embedding: Optional[List[float]]) -> Optional[SqlPlan]:
+        if not self.enabled or not embedding:
+            self._count("misses")
+            return None
+        query = _unit(embedding)
+        literals = question_literals(question)
+        words = set(re.findall(r"[a-z0-9]+", (question or "").lower()))
+        now = time.time()
+        with self._lock:
+            # Plans that embed values only serve questions with the same values:
+            # equal numbers / names, and every word of the SQL's string constants
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry[0] > now and entry[2] is not None and len(entry[2]) == len(query)
+                and (entry[3] is None or (entry[3][0] == literals and entry[3][1] <= words))
+            ]
+            if candidates:
+                similarities = np.stack([entry[2] for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self._counters["similar_hits"] += 1
+                    return SqlPlan(sql=entry[1], params={}, source="similar", similarity=round(float(similarities[best]), 4))
+            self._counters["misses"] += 1
+        return None
+
+    def store(self, question: str, sql: str, embedding: Optional[List[float]] = None):
+        """Cache a generated plan; call only after it passed the safety check and executed"""
+        if not self.enabled:
+            return
+        key = normalize_question(question)
+        if not key:
+            return
+        constants = sql_literals(sql)
+        literals = (question_literals(question), constants) if constants is not None else None
+        with self._lock:
+            self._entries[key] = (
+                time.time() + self.ttl_seconds, sql, _unit(embedding) if embedding else None, literals
+            )
+            self._entries.move_to_end(key)
+            self._counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._counters["template_hits"] + self._counters["exact_hits"] + self._counters["similar_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "templates": len(self.templates),
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+                "schema_fingerprint": self._fingerprint[:12] if self._fingerprint else None,
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+sql_plan_cache = SqlPlanCache(
+    ttl_seconds=settings.SQL_PLAN_CACHE_TTL_SECONDS,
+    max_entries=settings.SQL_PLAN_CACHE_MAX_ENTRIES,
+    similarity_threshold=settings.SQL_PLAN_SIMILARITY_THRESHOLD,
+    schema_check_seconds=settings.SQL_PLAN_SCHEMA_CHECK_SECONDS,
+    templates=TEMPLATES
+)
@@ -0,0 +1,190 @@
+# app/text_sections.py
+"""
+Section-aware splitting of contract text.
+
+The cleaned contract text has its whitespace collapsed (no newlines survive
+PDFProcessor.clean_text / AIExtractor._preprocess_text), so section boundaries
+are detected from inline heading patterns: "ARTICLE 4", "Section 7.2",
+"SCHEDULE B", "ANNEX 1", numbered all-caps titles such as "5. PAYMENT TERMS".
+Sections are then packed into chunks that stay under a character budget.
+
+Every section carries a content hash (section_hash), so a re-chunking of an
+edited document can keep the earlier chunks whose sections did not change
+(chunk_sections(previous_layout=...)); AIExtractor uses this to re-extract
+only the chunks around an edit.
+"""
+import hashlib
+import re
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+HEADING_PATTERN = re.compile(
+    r"""(?x)
+    (?:(?<=\s)|^)
+    (?:
+        (?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause)\s+(?:\d+(?:\.\d+)*|[IVXLC]+)\b
+      | (?:SCHEDULE|Schedule|ANNEX|Annex|ANNEXURE|Annexure|APPENDIX|Appendix|EXHIBIT|Exhibit|ATTACHMENT|Attachment)\s+(?:[A-Z]|\d+|[IVXLC]+)\b
+      | \d{1,2}\.(?:\d{1,2}\.?)*\s+[A-Z][A-Z&,\-]+(?:\s+[A-Z][A-Z&,\-]+){0,6}(?=\s|$)
+    )
+    """
+)
+
+# Sentence boundary used when a single section exceeds the chunk budget
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.;:])\s+(?=[A-Z0-9(])')
+
+
+class Section(NamedTuple):
+    index: int
+    heading: str
+    start: int
+    end: int
+    text: str
+
+
+class Chunk(NamedTuple):
+    index: int
+    start: int
+    end: int
+    text: str
+    headings: List[str]
+    section_hashes: Tuple[str, ...] = ()
+
+
+def section_hash(text: str) -> str:
+    """Content hash of a section, ignoring whitespace and case"""
+    normalized = re.sub(r'\s+', ' ', (text or "").strip().lower())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def split_sections(text: str, min_section_chars: int = 200) -> List[Section]:
+    """
+    Split text at heading boundaries. Headings closer than min_section_chars to
+    the previous boundary (tables of contents, cross references) are ignored.
+    """
+    if not text:
+        return []
+
+    boundaries = [(0, "")]
+    for match in HEADING_PATTERN.finditer(text):
+        if match.start() == 0:
+            boundaries[0] = (0, match.group(0).strip())
+            continue
+        if match.start() - boundaries[-1][0] < min_section_chars:
+            continue
+        boundaries.append((match.start(), match.group(0).strip()))
+
+    sections = []
+    for i, (start, heading) in enumerate(boundaries):
+        end = boundaries[i + 1][0] if i + 1 < len(boundaries) else len(text)
+        sections.append(Section(
+            index=i,
+            heading=heading or "Preamble",
+            start=start,
+            end=end,
+            text=text[start:end]
+        ))
+    return sections
+
+
+def _split_oversized(section: Section, max_chars: int) -> List[Section]:
+    """Break a section longer than max_chars at sentence (or hard) boundaries"""
+    pieces = []
+    start = section.start
+    end_limit = section.end
+    text = section.text
+
+    while start < end_limit:
+        end = min(start + max_chars, end_limit)
+        if end < end_limit:
+            window = text[start - section.start:end - section.start]
+            cut = None
+            for m in SENTENCE_BOUNDARY.finditer(window):
+                if m.start() > max_chars // 2:
+                    cut = m.start()
+            if cut:
+                end = start + cut
+        pieces.append(Section(
+            index=section.index,
+            heading=section.heading,
+            start=start,
+            end=end,
+            text=text[start - section.start:end - section.start]
+        ))
+        start = end
+        # Skip the whitespace at the cut
+        while start < end_limit and text[start - section.start].isspace():
+            start += 1
+    return pieces
+
+
+def chunk_sections(
+    text: str,
+    max_chars: int = 12000,
+    previous_layout: Optional[Sequence[Sequence[str]]] = None
+) -> List[Chunk]:
+    """
+    Pack consecutive sections into chunks of at most max_chars. Sections are
+    never split unless a single section is larger than the budget.
+
+    previous_layout is the section_hashes of every chunk of an earlier
+    chunking of the same document. Where the same run of sections occurs
+    again it becomes the same chunk, so an edit only changes the chunks it
+    touches instead of shifting the packing of everything after it.
+    """
+    pieces: List[Section] = []
+    for section in split_sections(text):
+        if len(section.text) > max_chars:
+            pieces.extend(_split_oversized(section, max_chars))
+        else:
+            pieces.append(section)
+    hashes = [section_hash(piece.text) for piece in pieces]
+
+    # First section hash -> earlier chunks starting with that section
+    earlier = {}
+    for layout in previous_layout or ():
+        if layout:
+            earlier.setdefault(layout[0], []).append(list(layout))
+
+    chunks: List[Chunk] = []
+
+    def flush(group: List[Section], group_hashes: List[str]):
+        if not group:
+            return
+        start, end = group[0].start, group[-1].end
+        headings = []
+        for piece in group:
+            if piece.heading not in headings:
+                headings.append(piece.heading)
+        chunks.append(Chunk(
+            index=len(chunks),
+            start=start,
+            end=end,
+            text=text[start:end].strip(),
+            headings=headings,
+            section_hashes=tuple(group_hashes)
+        ))
+
+    current: List[Section] = []
+    current_hashes: List[str] = []
+    i = 0
+    while i < len(pieces):
+        kept = next(
+            (layout for layout in earlier.get(hashes[i], ()) if hashes[i:i + len(layout)] == layout),
+            None
+        )
+        if kept:
+            flush(current, current_hashes)
+            current, current_hashes = [], []
+            flush(pieces[i:i + len(kept)], kept)
+            i += len(kept)
+            continue
+
+        piece = pieces[i]
+        if current and piece.end - current[0].start > max_chars:
+            flush(current, current_hashes)
+            current, current_hashes = [], []
+        current.append(piece)
+        current_hashes.append(hashes[i])
+        i += 1
+    flush(current, current_hashes)
+
+    return chunks
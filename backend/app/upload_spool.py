@@ -0,0 +1,86 @@
+# app/upload_spool.py
+"""
+Streaming upload intake.
+
+Upload endpoints used to `await file.read()` the whole body and hand that
+bytes object to parsing, GPT extraction and S3, so a few concurrent scanned
+PDFs pushed worker RSS up by several times their size. Uploads are now
+spooled to a temp file in UPLOAD_SPOOL_CHUNK_BYTES chunks (hashing SHA-256
+on the way) and everything downstream works from the file:
+
+- S3 / blob storage upload it with upload_file (multipart above
+  S3_MULTIPART_THRESHOLD_BYTES, see s3_service.TRANSFER_CONFIG)
+- the PDF parsers read a read-only memory map of it
+  (pdf_processor.extract_pdf_file), so pages come from the OS page cache
+  instead of a private bytes copy
+"""
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, NamedTuple, Optional, Union
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+
+
+class SpooledUpload(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+    filename: str
+    content_type: Optional[str]
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, size: int, max_bytes: int):
+        super().__init__(f"Upload exceeds {max_bytes} bytes")
+        self.size = size
+        self.max_bytes = max_bytes
+
+
+def _copy_to_spool(source: BinaryIO, directory: str, suffix: str, max_bytes: Optional[int]):
+    """(path, size, sha256); removes the partial file and raises UploadTooLarge past max_bytes"""
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory, suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while True:
+                chunk = source.read(settings.UPLOAD_SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(size, max_bytes)
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+async def spool_upload(
+    file: UploadFile,
+    directory: Optional[str] = None,
+    max_bytes: Optional[int] = None
+) -> SpooledUpload:
+    """Stream an UploadFile to a temp file (off the event loop); the caller removes it (remove_spool)"""
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    await file.seek(0)
+    path, size, sha256 = await run_in_threadpool(
+        _copy_to_spool, file.file, directory or settings.UPLOAD_SPOOL_DIR, suffix, max_bytes
+    )
+    return SpooledUpload(path=path, size=size, sha256=sha256, filename=file.filename, content_type=file.content_type)
+
+
+def remove_spool(upload: Optional[Union[SpooledUpload, str]]):
+    path = upload.path if isinstance(upload, SpooledUpload) else upload
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
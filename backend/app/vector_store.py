@@ -55,11 +55,12 @@ class ChromaVectorStore:
         # Clean metadata to remove None values
         cleaned_metadata = self._clean_metadata(metadata)
         
-        # Generate unique ID
+        # Generate unique ID (replacing any chunk vectors from chunk mode)
         doc_id = f"contract_{contract_id}"
+        self.delete_by_contract_id(contract_id)
         
-        # Store in Chroma
-        self.collection.add(
+        # Store in Chroma (upsert so re-indexing a contract replaces its vector)
+        self.collection.upsert(
             ids=[doc_id],
             embeddings=[embedding],
             metadatas=[cleaned_metadata],
@@ -68,38 +69,250 @@ class ChromaVectorStore:
         
         return doc_id
     
+    def upsert_embeddings(self, records: List[Dict[str, Any]]) -> List[str]:
+        """
+        Bulk upsert of contract vectors in one collection call. Each record has
+        contract_id, text, embedding and optional metadata.
+        """
+        ids, embeddings, metadatas, documents = [], [], [], []
+        for record in records:
+            metadata = dict(record.get("metadata") or {})
+            metadata["contract_id"] = str(record["contract_id"])
+            metadata["id"] = str(record["contract_id"])
+            
+            ids.append(f"contract_{record['contract_id']}")
+            embeddings.append(record["embedding"])
+            metadatas.append(self._clean_metadata(metadata))
+            documents.append((record.get("text") or "")[:1000])
+        
+        if ids:
+            self.collection.upsert(
+                ids=ids,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                documents=documents
+            )
+        return ids
+    
+    def upsert_chunk_embeddings(
+        self,
+        contract_id: int,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Chunk-level indexing: one vector per section chunk, with ids
+        contract_{id}_chunk_{n}. Replaces every vector previously stored for
+        the contract. Each chunk has text, start, end and headings.
+        """
+        self.delete_by_contract_id(contract_id)
+        
+        ids, vectors, metadatas, documents = [], [], [], []
+        for n, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+            if not embedding:
+                continue
+            chunk_metadata = dict(metadata or {})
+            chunk_metadata.update({
+                "contract_id": str(contract_id),
+                "id": str(contract_id),
+                "kind": "chunk",
+                "chunk_index": n,
+                "chunk_count": len(chunks),
+                "chunk_start": chunk.get("start", 0),
+                "chunk_end": chunk.get("end", 0),
+                "heading": ", ".join(chunk.get("headings") or [])[:200]
+            })
+            ids.append(f"contract_{contract_id}_chunk_{n}")
+            vectors.append(embedding)
+            metadatas.append(self._clean_metadata(chunk_metadata))
+            documents.append(chunk.get("text") or "")
+        
+        if ids:
+            self.collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                metadatas=metadatas,
+                documents=documents
+            )
+        
+        # Logical id recorded on the contract (prefix of the chunk ids)
+        return f"contract_{contract_id}"
+    
+    def copy_contract_vectors(self, source_contract_id: int, contract_id: int, metadata: Dict[str, Any]) -> Optional[str]:
+        """
+        Store the source contract's vectors (document or chunks, embeddings
+        included) again under `contract_id`, with that contract's metadata.
+        Returns the new chroma_id, or None if the source has no vectors.
+        """
+        existing = self.collection.get(
+            where={"contract_id": str(source_contract_id)},
+            include=["embeddings", "metadatas", "documents"]
+        )
+        if not existing['ids']:
+            return None
+        
+        source_prefix = f"contract_{source_contract_id}"
+        target_prefix = f"contract_{contract_id}"
+        ids, metadatas = [], []
+        for doc_id, old_metadata in zip(existing['ids'], existing['metadatas']):
+            ids.append(target_prefix + doc_id[len(source_prefix):])
+            # Chunk fields are kept; identity and access metadata come from the new contract
+            copied = {
+                key: value for key, value in (old_metadata or {}).items()
+                if not key.startswith("viewer_") and key != "created_by"
+            }
+            copied.update(metadata)
+            copied["contract_id"] = str(contract_id)
+            copied["id"] = str(contract_id)
+            metadatas.append(self._clean_metadata(copied))
+        
+        self.delete_by_contract_id(contract_id)
+        self.collection.upsert(
+            ids=ids,
+            embeddings=existing['embeddings'],
+            metadatas=metadatas,
+            documents=existing['documents']
+        )
+        return target_prefix
+    
+    @staticmethod
+    def viewer_filter(user_id: int) -> Dict[str, Any]:
+        """where-clause matching vectors of contracts the user created or is assigned to"""
+        return {f"viewer_{user_id}": True}
+    
+    def set_contract_access(self, contract_id: int, access: Dict[str, Any]) -> int:
+        """
+        Rewrite the access metadata (created_by / viewer_<id> flags) on every
+        vector of a contract. Revoked viewers are set to False rather than
+        removed, so the viewer filter stops matching them.
+        """
+        existing = self.collection.get(
+            where={"contract_id": str(contract_id)},
+            include=["metadatas"]
+        )
+        if not existing['ids']:
+            return 0
+        
+        metadatas = []
+        for metadata in existing['metadatas']:
+            updated = {
+                key: (False if key.startswith("viewer_") else value)
+                for key, value in (metadata or {}).items()
+            }
+            updated.update(access)
+            metadatas.append(self._clean_metadata(updated))
+        
+        self.collection.update(ids=existing['ids'], metadatas=metadatas)
+        return len(existing['ids'])
+    
     def search_similar(
         self, 
         query_embedding: List[float], 
-        n_results: int = 5
+        n_results: int = 5,
+        pooling: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
-        """Search for similar contracts"""
+        """
+        Search for similar contracts. Chunk hits are grouped per contract and
+        scored with max or mean pooling (VECTOR_SEARCH_POOLING); each result
+        carries the best matching passage. Single-vector (document mode)
+        entries behave as a contract with one chunk. `where` filters inside
+        the index (e.g. viewer_filter) so hidden contracts never use up results.
+        """
+        pooling = (pooling or settings.VECTOR_SEARCH_POOLING).lower()
         try:
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=["metadatas", "distances", "documents"]
-            )
+            total = self.collection.count()
+            if total == 0:
+                return []
+            
+            query_args = {
+                "query_embeddings": [query_embedding],
+                "n_results": min(total, n_results * max(1, settings.VECTOR_CHUNK_OVERFETCH)),
+                "include": ["metadatas", "distances", "documents"]
+            }
+            if where:
+                query_args["where"] = where
+            results = self.collection.query(**query_args)
+            
+            # Group chunk hits per contract (hits arrive best first)
+            grouped: Dict[int, Dict[str, Any]] = {}
+            for i, doc_id in enumerate(results['ids'][0]):
+                metadata = results['metadatas'][0][i]
+                contract_id = int(metadata.get("contract_id", 0))
+                similarity = 1 - results['distances'][0][i]  # Convert distance to similarity
+                
+                entry = grouped.get(contract_id)
+                if entry is None:
+                    entry = grouped[contract_id] = {
+                        "contract_id": contract_id,
+                        "best_index": i,
+                        "similarities": []
+                    }
+                entry["similarities"].append(similarity)
             
-            # Format results
             formatted_results = []
-            if results['ids'][0]:  # Check if there are results
-                for i, doc_id in enumerate(results['ids'][0]):
-                    formatted_results.append({
-                        "contract_id": int(results['metadatas'][0][i].get("contract_id", 0)),
-                        "document": results['documents'][0][i],
-                        "metadata": results['metadatas'][0][i],
-                        "distance": results['distances'][0][i],
-                        "similarity_score": 1 - results['distances'][0][i]  # Convert distance to similarity
-                    })
+            for entry in grouped.values():
+                i = entry["best_index"]
+                metadata = results['metadatas'][0][i]
+                similarities = entry["similarities"]
+                score = max(similarities) if pooling == "max" else sum(similarities) / len(similarities)
+                
+                formatted_results.append({
+                    "contract_id": entry["contract_id"],
+                    "document": results['documents'][0][i],
+                    "metadata": metadata,
+                    "distance": 1 - score,
+                    "similarity_score": score,
+                    "matched_chunks": len(similarities),
+                    "passage": {
+                        "text": results['documents'][0][i],
+                        "chunk_index": metadata.get("chunk_index", 0),
+                        "start": metadata.get("chunk_start", 0),
+                        "end": metadata.get("chunk_end", len(results['documents'][0][i] or "")),
+                        "heading": metadata.get("heading", "")
+                    }
+                })
             
-            return formatted_results
+            formatted_results.sort(key=lambda r: r["similarity_score"], reverse=True)
+            return formatted_results[:n_results]
         except Exception as e:
             print(f"Search error: {e}")
             return []
     
+    def search_contract_chunks(
+        self,
+        contract_id: int,
+        query_embedding: List[float],
+        n_results: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Best matching chunks within one contract (chunk mode only), best first"""
+        try:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where={"$and": [{"contract_id": str(contract_id)}, {"kind": "chunk"}]},
+                include=["metadatas", "distances"]
+            )
+        except Exception as e:
+            print(f"Chunk search error: {e}")
+            return []
+
+        return [
+            {
+                "chunk_index": metadata.get("chunk_index", 0),
+                "start": metadata.get("chunk_start", 0),
+                "end": metadata.get("chunk_end", 0),
+                "similarity_score": 1 - distance
+            }
+            for metadata, distance in zip(results['metadatas'][0], results['distances'][0])
+        ]
+
     def get_by_contract_id(self, contract_id: int) -> Optional[Dict[str, Any]]:
-        """Get embedding by contract ID"""
+        """
+        Get the contract's vector. For chunk-indexed contracts this is the
+        mean of the chunk vectors.
+        """
         try:
             results = self.collection.get(
                 ids=[f"contract_{contract_id}"],
@@ -113,15 +326,33 @@ class ChromaVectorStore:
                     "metadata": results['metadatas'][0] if results['metadatas'] else {},
                     "document": results['documents'][0] if results['documents'] else ""
                 }
+            
+            chunks = self.collection.get(
+                where={"contract_id": str(contract_id)},
+                include=["embeddings", "metadatas", "documents"]
+            )
+            if chunks['ids'] and chunks['embeddings']:
+                centroid = np.mean(np.array(chunks['embeddings'], dtype=float), axis=0)
+                norm = np.linalg.norm(centroid)
+                if norm:
+                    centroid = centroid / norm
+                first = min(range(len(chunks['ids'])), key=lambda i: chunks['metadatas'][i].get("chunk_index", 0))
+                return {
+                    "contract_id": contract_id,
+                    "embedding": centroid.tolist(),
+                    "metadata": chunks['metadatas'][first],
+                    "document": chunks['documents'][first],
+                    "chunk_count": len(chunks['ids'])
+                }
             return None
         except Exception as e:
             print(f"Get by contract_id error: {e}")
             return None
     
     def delete_by_contract_id(self, contract_id: int) -> bool:
-        """Delete embedding by contract ID"""
+        """Delete every vector (document and chunks) of a contract"""
         try:
-            self.collection.delete(ids=[f"contract_{contract_id}"])
+            self.collection.delete(where={"contract_id": str(contract_id)})
             return True
         except Exception as e:
             print(f"Delete error: {e}")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Fill the contract_pages store for contracts uploaded before it existed.
+
+Each contract's original PDF is read back from S3 (comprehensive_data.s3_pdf.key),
+parsed page by page and stored compressed. Contracts that already have
+pages are skipped unless --force is given.
+
+    python backfill_contract_pages.py
+    python backfill_contract_pages.py --contract-id 42 --force
+"""
+import sys
+import os
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.database import SessionLocal
+from app import models, page_store
+from app.pdf_processor import PDFProcessor
+from app.s3_service import s3_service
+
+
+def backfill_contract_pages(contract_id=None, force=False, limit=None):
+    if not s3_service.s3_client:
+        print("❌ S3 client not initialized - original PDFs are needed to rebuild pages")
+        return
+
+    processor = PDFProcessor()
+    db = SessionLocal()
+    try:
+        query = db.query(models.Contract.id, models.Contract.comprehensive_data).order_by(models.Contract.id)
+        if contract_id:
+            query = query.filter(models.Contract.id == contract_id)
+        if not force:
+            query = query.filter(~models.Contract.id.in_(db.query(models.ContractPage.contract_id)))
+        if limit:
+            query = query.limit(limit)
+        rows = query.all()
+        print(f"Contracts to process: {len(rows)}")
+
+        stored = 0
+        skipped = 0
+        raw_bytes = 0
+        stored_bytes = 0
+        for row in rows:
+            pdf_key = ((row.comprehensive_data or {}).get("s3_pdf") or {}).get("key")
+            if not pdf_key:
+                print(f"  ⚠️ Contract {row.id}: no S3 PDF recorded, skipped")
+                skipped += 1
+                continue
+
+            started = time.time()
+            try:
+                response = s3_service.s3_client.get_object(Bucket=settings.S3_BUCKET_NAME, Key=pdf_key)
+                extraction_result = processor.extract_text(response["Body"].read())
+                result = page_store.store_contract_pages(db, row.id, extraction_result.get("pages") or [])
+            except Exception as e:
+                db.rollback()
+                print(f"  ❌ Contract {row.id}: {e}")
+                skipped += 1
+                continue
+
+            stored += 1
+            raw_bytes += result["raw_bytes"]
+            stored_bytes += result["stored_bytes"]
+            print(f"  ✓ Contract {row.id}: {result['pages']} pages in {time.time() - started:.1f}s")
+
+        ratio = raw_bytes / stored_bytes if stored_bytes else 0
+        print(f"\n✅ Pages stored for {stored} contracts ({skipped} skipped), "
+              f"{raw_bytes / 1024:.0f}KB text in {stored_bytes / 1024:.0f}KB ({ratio:.1f}x)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild contract_pages from the PDFs in S3")
+    parser.add_argument("--contract-id", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Re-parse contracts that already have pages")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    backfill_contract_pages(args.contract_id, force=args.force, limit=args.limit)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Re-embed every contract into ChromaDB in batches (e.g. after changing EMBEDDING_MODEL).
+
+Contracts are processed in id order, EMBEDDING_BATCH_SIZE per embeddings request,
+and upserted into Chroma in bulk (one vector per section chunk when
+VECTOR_INDEX_MODE=chunks). Progress is checkpointed after every batch, so
+an interrupted run picks up where it stopped:
+
+    python backfill_embeddings.py                 # start or resume
+    python backfill_embeddings.py --reset         # start over
+    python backfill_embeddings.py --batch-size 128 --limit 500
+    python backfill_embeddings.py --access-only   # refresh viewer metadata, no re-embedding
+"""
+import sys
+import os
+import json
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from sqlalchemy import update, func
+
+from app.config import settings
+from app.database import SessionLocal
+from app import models
+from app.contract_ingestion import ai_extractor, contract_embedding_metadata, contract_access_metadata
+from app.vector_store import vector_store
+from app.text_sections import chunk_sections
+from app import page_store
+
+DEFAULT_CHECKPOINT = "./.backfill_embeddings.json"
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    # Write-then-rename so a crash never leaves a truncated checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def contract_texts(db, rows):
+    """Full text from the page store; full_text (a 5,000 char preview) for contracts without pages"""
+    texts = {}
+    for row in rows:
+        text = page_store.get_contract_text(db, row.id)
+        texts[row.id] = text if text else row.full_text
+    return texts
+
+
+def embed_chunks(rows, texts, batch_size):
+    """Chunk mode: embed every section chunk of the batch together, then store per contract"""
+    chunked = [
+        (row, chunk_sections(texts[row.id], settings.VECTOR_CHUNK_CHARS))
+        for row in rows
+    ]
+    texts = [chunk.text for _, chunks in chunked for chunk in chunks]
+    embeddings = iter(ai_extractor.get_embeddings(texts, batch_size=batch_size))
+
+    stored_ids = []
+    for row, chunks in chunked:
+        chunk_embeddings = [next(embeddings) for _ in chunks]
+        if not any(chunk_embeddings):
+            continue
+        stored_ids.append(vector_store.upsert_chunk_embeddings(
+            contract_id=row.id,
+            chunks=[{"text": c.text, "start": c.start, "end": c.end, "headings": c.headings} for c in chunks],
+            embeddings=chunk_embeddings,
+            metadata=contract_embedding_metadata(row)
+        ))
+    return stored_ids
+
+
+def backfill_embeddings(batch_size, checkpoint_path, reset=False, limit=None):
+    checkpoint = None if reset else load_checkpoint(checkpoint_path)
+
+    if checkpoint and checkpoint.get("model") != settings.EMBEDDING_MODEL:
+        print(
+            f"❌ Checkpoint was written for model '{checkpoint.get('model')}' but EMBEDDING_MODEL is "
+            f"'{settings.EMBEDDING_MODEL}'. Run with --reset to re-embed everything."
+        )
+        return
+
+    if not checkpoint:
+        checkpoint = {
+            "model": settings.EMBEDDING_MODEL,
+            "last_contract_id": 0,
+            "processed": 0,
+            "skipped": 0,
+            "started_at": datetime.utcnow().isoformat()
+        }
+        print(f"Starting embedding backfill with {settings.EMBEDDING_MODEL}")
+    else:
+        print(f"Resuming embedding backfill after contract {checkpoint['last_contract_id']} "
+              f"({checkpoint['processed']} already embedded)")
+
+    db = SessionLocal()
+    try:
+        remaining = db.query(func.count(models.Contract.id)).filter(
+            models.Contract.id > checkpoint["last_contract_id"]
+        ).scalar()
+        if limit:
+            remaining = min(remaining, limit)
+        print(f"Contracts to embed: {remaining} (batch size {batch_size})")
+
+        run_started = time.time()
+        run_processed = 0
+
+        while run_processed < remaining:
+            take = min(batch_size, remaining - run_processed)
+            rows = db.query(
+                models.Contract.id,
+                models.Contract.filename,
+                models.Contract.contract_number,
+                models.Contract.grant_name,
+                models.Contract.total_amount,
+                models.Contract.created_by,
+                models.Contract.assigned_pm_users,
+                models.Contract.assigned_pgm_users,
+                models.Contract.assigned_director_users,
+                models.Contract.full_text
+            ).filter(
+                models.Contract.id > checkpoint["last_contract_id"]
+            ).order_by(models.Contract.id).limit(take).all()
+
+            if not rows:
+                break
+
+            batch_started = time.time()
+            texts = contract_texts(db, rows)
+            with_text = [row for row in rows if texts[row.id]]
+
+            if settings.VECTOR_INDEX_MODE == "chunks":
+                stored_ids = embed_chunks(with_text, texts, batch_size)
+            else:
+                embeddings = ai_extractor.get_embeddings([texts[row.id] for row in with_text], batch_size=batch_size)
+                stored_ids = vector_store.upsert_embeddings([
+                    {
+                        "contract_id": row.id,
+                        "text": texts[row.id],
+                        "embedding": embedding,
+                        "metadata": contract_embedding_metadata(row)
+                    }
+                    for row, embedding in zip(with_text, embeddings) if embedding
+                ])
+
+            if stored_ids:
+                db.execute(
+                    update(models.Contract)
+                    .where(models.Contract.id.in_([int(i.split("_")[1]) for i in stored_ids]))
+                    .values(chroma_id=func.concat("contract_", models.Contract.id))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+
+            run_processed += len(rows)
+            checkpoint["last_contract_id"] = rows[-1].id
+            checkpoint["processed"] += len(stored_ids)
+            checkpoint["skipped"] += len(rows) - len(stored_ids)
+            checkpoint["updated_at"] = datetime.utcnow().isoformat()
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.time() - run_started
+            rate = run_processed / elapsed if elapsed else 0.0
+            eta = (remaining - run_processed) / rate if rate else 0.0
+            print(
+                f"  ✓ {run_processed}/{remaining} contracts "
+                f"(batch {len(stored_ids)} embedded in {time.time() - batch_started:.1f}s, "
+                f"{rate:.1f} contracts/s, ETA {eta:.0f}s)"
+            )
+
+        elapsed = time.time() - run_started
+        print(f"\nBackfill run complete: {run_processed} contracts in {elapsed:.1f}s "
+              f"({run_processed / elapsed if elapsed else 0:.1f} contracts/s)")
+        print(f"Total embedded: {checkpoint['processed']}, skipped (no text / no vector): {checkpoint['skipped']}")
+        print(f"Checkpoint: {checkpoint_path}")
+
+    except KeyboardInterrupt:
+        print(f"\n⚠️ Interrupted — rerun to resume after contract {checkpoint['last_contract_id']}")
+    finally:
+        db.close()
+
+
+def backfill_access_metadata(batch_size):
+    """Rewrite creator/viewer metadata on already-indexed contracts (used by filtered search)"""
+    db = SessionLocal()
+    try:
+        last_id = 0
+        updated = 0
+        while True:
+            rows = db.query(
+                models.Contract.id,
+                models.Contract.created_by,
+                models.Contract.assigned_pm_users,
+                models.Contract.assigned_pgm_users,
+                models.Contract.assigned_director_users
+            ).filter(
+                models.Contract.id > last_id,
+                models.Contract.chroma_id.isnot(None)
+            ).order_by(models.Contract.id).limit(batch_size).all()
+
+            if not rows:
+                break
+
+            for row in rows:
+                if vector_store.set_contract_access(row.id, contract_access_metadata(row)):
+                    updated += 1
+            last_id = rows[-1].id
+            print(f"  ✓ Access metadata refreshed through contract {last_id} ({updated} contracts)")
+
+        print(f"\nAccess metadata backfill complete: {updated} contracts updated")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch re-embed contracts into ChromaDB")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--reset", action="store_true", help="Ignore the checkpoint and start over")
+    parser.add_argument("--limit", type=int, default=None, help="Embed at most this many contracts this run")
+    parser.add_argument("--access-only", action="store_true", help="Only refresh creator/viewer metadata")
+    args = parser.parse_args()
+
+    if args.access_only:
+        backfill_access_metadata(args.batch_size)
+    else:
+        backfill_embeddings(args.batch_size, args.checkpoint, reset=args.reset, limit=args.limit)
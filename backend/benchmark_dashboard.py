@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Compare the role dashboards before and after the single-statement rewrite.
+
+For one user of each role (or --user-id), runs each variant --iterations
+times and reports SQL round trips per call and latency:
+
+- before: the previous get_dashboard_metrics (one query per metric, joins
+  reporting_events to contracts repeatedly; copied below)
+- single-query: compute_dashboard_metrics, one FILTER-aggregate statement
+  over mv_contract_reporting (uncached)
+- cached: get_dashboard_metrics, through the per-(user, role) result cache
+
+The materialized view is refreshed first so both variants see the same data,
+and the metrics are checked to match.
+
+    python benchmark_dashboard.py
+    python benchmark_dashboard.py --iterations 200 --user-id 7
+"""
+import sys
+import os
+import time
+import argparse
+import statistics
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date, timedelta
+from sqlalchemy import distinct, event, func
+
+from app.database import SessionLocal, engine
+from app import models
+from app.auth_models import User
+from app.portfolio_views import portfolio_views
+from app.dashboard_services import compute_dashboard_metrics, get_dashboard_metrics, dashboard_cache
+
+ROLES = ("project_manager", "program_manager", "director")
+
+
+# ─────────────────────────────────────────────────────────────
+# Previous implementation (one query per metric)
+# ─────────────────────────────────────────────────────────────
+
+def legacy_dashboard_metrics(db, current_user):
+    today = date.today()
+    role = current_user.role
+
+    contract_query = db.query(models.Contract)
+    if role in ("project_manager", "program_manager"):
+        contract_query = contract_query.filter(models.Contract.created_by == current_user.id)
+
+    if role == "project_manager":
+        contract_query.filter(models.Contract.status == "draft").count()
+
+        db.query(func.count(models.ReportingEvent.id)) \
+            .join(models.Contract, models.ReportingEvent.contract_id == models.Contract.id) \
+            .filter(
+                models.ReportingEvent.due_date < today,
+                models.ReportingEvent.status == "pending",
+                models.Contract.created_by == current_user.id
+            ).scalar()
+
+        grants_requiring_action = db.query(func.count(distinct(models.ReportingEvent.contract_id))) \
+            .join(models.Contract, models.ReportingEvent.contract_id == models.Contract.id) \
+            .filter(
+                models.ReportingEvent.due_date < today,
+                models.ReportingEvent.status == "pending",
+                models.Contract.created_by == current_user.id
+            ).scalar()
+
+        overdue_contracts = db.query(distinct(models.ReportingEvent.contract_id)) \
+            .join(models.Contract, models.ReportingEvent.contract_id == models.Contract.id) \
+            .filter(
+                models.ReportingEvent.due_date < today,
+                models.ReportingEvent.status == "pending",
+                models.Contract.created_by == current_user.id
+            ).subquery()
+        funds_at_risk = db.query(func.coalesce(func.sum(models.Contract.total_amount), 0)) \
+            .filter(models.Contract.id.in_(overdue_contracts)) \
+            .scalar()
+
+        upcoming_submissions = db.query(func.count(distinct(models.ReportingEvent.contract_id))) \
+            .join(models.Contract, models.ReportingEvent.contract_id == models.Contract.id) \
+            .filter(
+                models.ReportingEvent.due_date >= today,
+                models.ReportingEvent.due_date <= today + timedelta(days=30),
+                models.ReportingEvent.status == "pending",
+                models.Contract.created_by == current_user.id
+            ).scalar()
+
+        pending_approvals = db.query(func.count(models.ReportingEvent.id)) \
+            .join(models.Contract, models.ReportingEvent.contract_id == models.Contract.id) \
+            .filter(
+                models.ReportingEvent.status == "submitted",
+                models.Contract.created_by == current_user.id
+            ).scalar()
+
+        portfolio_on_track = contract_query.filter(models.Contract.status == "active").count()
+
+        return {
+            "grants_requiring_action": grants_requiring_action,
+            "funds_at_risk": float(funds_at_risk or 0),
+            "upcoming_submissions": upcoming_submissions,
+            "pending_approvals": pending_approvals,
+            "portfolio_on_track": portfolio_on_track
+        }
+
+    if role == "program_manager":
+        at_risk_grants = db.query(func.count(models.Contract.id)) \
+            .join(models.ReportingEvent, models.ReportingEvent.contract_id == models.Contract.id) \
+            .filter(
+                models.ReportingEvent.due_date < today,
+                models.ReportingEvent.status == "pending",
+                models.Contract.created_by == current_user.id
+            ).scalar()
+        return {
+            "total_active_grants": contract_query.filter(models.Contract.status == "active").count(),
+            "pending_pm_submissions": contract_query.filter(models.Contract.status == "under_review").count(),
+            "submitted_to_director": contract_query.filter(models.Contract.status == "reviewed").count(),
+            "total_portfolio_value": float(contract_query.with_entities(
+                func.coalesce(func.sum(models.Contract.total_amount), 0)
+            ).scalar() or 0),
+            "at_risk_grants": at_risk_grants
+        }
+
+    if role == "director":
+        total_portfolio = contract_query.count()
+        total_portfolio_value = contract_query.with_entities(
+            func.coalesce(func.sum(models.Contract.total_amount), 0)
+        ).scalar()
+        awaiting_director_approval = contract_query.filter(models.Contract.status == "reviewed").count()
+        active_contracts = contract_query.filter(models.Contract.status == "active").count()
+        high_risk_grants = db.query(func.count(models.Contract.id)) \
+            .join(models.ReportingEvent, models.ReportingEvent.contract_id == models.Contract.id) \
+            .filter(
+                models.ReportingEvent.due_date < today,
+                models.ReportingEvent.status == "pending"
+            ).scalar()
+        return {
+            "total_portfolio": total_portfolio,
+            "total_portfolio_value": float(total_portfolio_value or 0),
+            "awaiting_director_approval": awaiting_director_approval,
+            "portfolio_on_track_percent": round(active_contracts / total_portfolio * 100) if total_portfolio else 0,
+            "high_risk_grants": high_risk_grants
+        }
+
+    return {}
+
+
+# ─────────────────────────────────────────────────────────────
+# Benchmark
+# ─────────────────────────────────────────────────────────────
+
+query_count = [0]
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    query_count[0] += 1
+
+
+def measure(fn, iterations):
+    """(result, queries per call, latencies in ms)"""
+    latencies = []
+    queries_before = query_count[0]
+    result = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return result, (query_count[0] - queries_before) / iterations, latencies
+
+
+def summarize(label, queries, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"    {label:<13} {queries:5.1f} queries/call   "
+          f"mean {statistics.mean(latencies):7.2f}ms   p95 {p95:7.2f}ms")
+    return statistics.mean(latencies)
+
+
+def benchmark_dashboard(iterations=50, user_id=None):
+    portfolio_views.setup([])
+    if not portfolio_views.contract_reporting_available:
+        print("⚠️ mv_contract_reporting unavailable - measuring the live aggregate instead")
+    elif not portfolio_views.refresh():
+        print("⚠️ Could not refresh mv_contract_reporting - results may differ")
+
+    db = SessionLocal()
+    try:
+        if user_id:
+            users = [db.query(User).filter(User.id == user_id).first()]
+            if users[0] is None:
+                print(f"❌ User {user_id} not found")
+                return
+        else:
+            users = [db.query(User).filter(User.role == role).order_by(User.id).first() for role in ROLES]
+            users = [user for user in users if user is not None]
+        if not users:
+            print("❌ No project manager, program manager or director users found")
+            return
+
+        for user in users:
+            print(f"\n{user.role} (user {user.id}), {iterations} iterations")
+
+            before, before_queries, before_latencies = measure(lambda: legacy_dashboard_metrics(db, user), iterations)
+            after, after_queries, after_latencies = measure(
+                lambda: compute_dashboard_metrics(db, user.role, user.id), iterations
+            )
+            dashboard_cache.clear()
+            _, cached_queries, cached_latencies = measure(lambda: get_dashboard_metrics(db, user), iterations)
+
+            before_mean = summarize("before", before_queries, before_latencies)
+            after_mean = summarize("single-query", after_queries, after_latencies)
+            summarize("cached", cached_queries, cached_latencies)
+            if after_mean:
+                print(f"    ✓ {before_mean / after_mean:.1f}x faster uncached")
+
+            after.pop("data_refreshed_at", None)
+            if before == after:
+                print("    ✓ Metrics match")
+            else:
+                print(f"    ⚠️ Metrics differ\n      before: {before}\n      after:  {after}")
+
+        print(f"\n✅ Dashboard cache: {dashboard_cache.stats()}")
+    finally:
+        db.close()
+        portfolio_views.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the role dashboard queries before/after")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--user-id", type=int, default=None, help="Benchmark this user only")
+    args = parser.parse_args()
+
+    benchmark_dashboard(args.iterations, user_id=args.user_id)
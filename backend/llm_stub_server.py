@@ -0,0 +1,176 @@
+# llm_stub_server.py
+"""
+Local stand-in for the OpenAI API, for exercising the LLM gateway without
+spending tokens.
+
+Implements /v1/chat/completions and /v1/embeddings with deterministic
+responses, plus optional latency and 429/503 fault injection to exercise the
+gateway's rate limiting and retry behaviour.
+
+    python llm_stub_server.py --port 8089 --latency-ms 300 --fail-rate 0.1
+    OPENAI_BASE_URL=http://localhost:8089/v1 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="LLM stub server")
+
+config = {"latency_ms": 0, "fail_rate": 0.0, "embedding_dimensions": 1536}
+counters = {"chat": 0, "embeddings": 0, "injected_failures": 0}
+
+STUB_EXTRACTION = {
+    "metadata": {
+        "document_type": "grant_contract",
+        "extraction_confidence": 0.5,
+        "pages_extracted_from": 1,
+        "extraction_timestamp": ""
+    },
+    "parties": {
+        "grantor": {"organization_name": "Stub Foundation"},
+        "grantee": {"organization_name": "Stub Grantee"}
+    },
+    "contract_details": {
+        "contract_number": "STUB-001",
+        "grant_name": "Stub Grant",
+        "start_date": "2025-01-01",
+        "end_date": "2025-12-31",
+        "purpose": "Stub response from llm_stub_server.py"
+    },
+    "financial_details": {
+        "total_grant_amount": 100000,
+        "currency": "USD",
+        "payment_schedule": {"installments": [], "milestones": []}
+    },
+    "deliverables": {
+        "items": [
+            {"deliverable_name": "Stub Report", "description": "Stub deliverable", "due_date": "2025-06-30", "status": "pending"}
+        ],
+        "reporting_requirements": {"frequency": "quarterly", "report_types": ["Progress Report"], "due_dates": []}
+    }
+}
+
+
+def _usage(prompt: str, completion: str):
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(completion) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+async def _simulate_conditions():
+    """Apply configured latency; maybe return an injected 429/503"""
+    if config["latency_ms"]:
+        await asyncio.sleep(config["latency_ms"] / 1000.0)
+    if config["fail_rate"] and random.random() < config["fail_rate"]:
+        counters["injected_failures"] += 1
+        if random.random() < 0.5:
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "0.2"},
+                content={"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error"}}
+            )
+        return JSONResponse(
+            status_code=503,
+            content={"error": {"message": "Service unavailable (stub)", "type": "server_error"}}
+        )
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["chat"] += 1
+
+    failure = await _simulate_conditions()
+    if failure:
+        return failure
+
+    messages = body.get("messages", [])
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    system = next((str(m.get("content", "")) for m in messages if m.get("role") == "system"), "")
+    last_user = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps(STUB_EXTRACTION)
+    elif "PostgreSQL expert" in system:
+        content = "SELECT * FROM portfolio_financial_overview"
+    else:
+        content = f"Stub answer to: {last_user[:200]}"
+
+    return {
+        "id": f"chatcmpl-stub-{counters['chat']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(prompt, content)
+    }
+
+
+def _embedding_for(text: str):
+    """Deterministic unit vector derived from the text"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).hexdigest())
+    vector = [rng.uniform(-1, 1) for _ in range(config["embedding_dimensions"])]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    counters["embeddings"] += 1
+
+    failure = await _simulate_conditions()
+    if failure:
+        return failure
+
+    inputs = body.get("input", "")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+
+    return {
+        "object": "list",
+        "model": body.get("model", "stub"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": _embedding_for(str(text))}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": _usage("".join(str(t) for t in inputs), "")
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return {**counters, **config}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=int, default=0, help="Delay added to every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 429/503")
+    parser.add_argument("--embedding-dimensions", type=int, default=1536)
+    args = parser.parse_args()
+
+    config["latency_ms"] = args.latency_ms
+    config["fail_rate"] = args.fail_rate
+    config["embedding_dimensions"] = args.embedding_dimensions
+
+    print(f"✓ LLM stub server on http://{args.host}:{args.port}/v1")
+    uvicorn.run(app, host=args.host, port=args.port)
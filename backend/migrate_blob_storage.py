@@ -0,0 +1,161 @@
+# migrate_blob_storage.py
+"""
+Move uploaded files out of the database and local disk into blob storage.
+
+- contract_deliverables.file_data['base64_content'] is decoded and written to
+  blob storage; file_data keeps only the metadata (filename, content type,
+  size, sha256) and blob_key points at the blob.
+- Deliverables and reporting events whose uploaded_file_path is a local file
+  are uploaded the same way.
+
+Adds the blob_key columns if they are missing. Safe to re-run: rows that
+already have a blob_key are skipped.
+
+    python migrate_blob_storage.py --dry-run
+    python migrate_blob_storage.py --batch-size 50
+"""
+import sys
+import os
+import json
+import base64
+import argparse
+import mimetypes
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.config import settings
+from app.blob_storage import blob_storage
+
+
+def add_blob_key_columns(conn):
+    conn.execute(text("ALTER TABLE contract_deliverables ADD COLUMN IF NOT EXISTS blob_key VARCHAR(500)"))
+    conn.execute(text("ALTER TABLE reporting_events ADD COLUMN IF NOT EXISTS blob_key VARCHAR"))
+    conn.commit()
+    print("✓ blob_key columns present")
+
+
+def migrate_deliverables(conn, batch_size, dry_run):
+    moved = 0
+    skipped = 0
+    last_id = 0
+    total_bytes = 0
+
+    while True:
+        # Only ids first: file_data rows can be large, so payloads are loaded one at a time
+        ids = [row[0] for row in conn.execute(text("""
+            SELECT id FROM contract_deliverables
+            WHERE id > :last_id
+              AND blob_key IS NULL
+              AND (file_data ? 'base64_content' OR uploaded_file_path IS NOT NULL)
+            ORDER BY id
+            LIMIT :limit
+        """), {"last_id": last_id, "limit": batch_size}).fetchall()]
+        if not ids:
+            break
+
+        for deliverable_id in ids:
+            last_id = deliverable_id
+            row = conn.execute(text("""
+                SELECT contract_id, uploaded_file_path, uploaded_file_name, file_data
+                FROM contract_deliverables WHERE id = :id
+            """), {"id": deliverable_id}).fetchone()
+            contract_id, file_path, file_name, file_data = row
+            file_data = file_data or {}
+
+            if file_data.get("base64_content"):
+                content = base64.b64decode(file_data["base64_content"])
+                source = "database"
+            elif file_path and not file_path.startswith("http") and os.path.isfile(file_path):
+                with open(file_path, "rb") as f:
+                    content = f.read()
+                source = file_path
+            else:
+                skipped += 1
+                continue
+
+            name = file_data.get("filename") or file_name or os.path.basename(file_path or "") or "file"
+            ext = os.path.splitext(name)[1].lower()
+            blob_key = f"deliverables/contract_{contract_id}/deliverable_{deliverable_id}{ext}"
+            content_type = file_data.get("content_type") or mimetypes.guess_type(name)[0]
+
+            if dry_run:
+                print(f"  would move deliverable {deliverable_id} ({len(content)} bytes from {source}) -> {blob_key}")
+            else:
+                info = blob_storage.put(blob_key, content, content_type)
+                metadata = {k: v for k, v in file_data.items() if k != "base64_content"}
+                metadata.update({
+                    "filename": name,
+                    "content_type": info.content_type,
+                    "size": info.size,
+                    "sha256": info.etag
+                })
+                conn.execute(text("""
+                    UPDATE contract_deliverables
+                    SET blob_key = :blob_key,
+                        uploaded_file_path = :blob_key,
+                        file_data = CAST(:file_data AS JSONB)
+                    WHERE id = :id
+                """), {"blob_key": info.key, "file_data": json.dumps(metadata), "id": deliverable_id})
+                conn.commit()
+
+            moved += 1
+            total_bytes += len(content)
+
+        print(f"  ✓ Deliverables through id {last_id}: {moved} moved, {skipped} skipped")
+
+    print(f"✅ Deliverables: {moved} files ({total_bytes / 1024 / 1024:.1f}MB) moved to {blob_storage.backend_name} storage")
+
+
+def migrate_reporting_events(conn, dry_run):
+    rows = conn.execute(text("""
+        SELECT id, uploaded_file_path, uploaded_file_name
+        FROM reporting_events
+        WHERE blob_key IS NULL AND uploaded_file_path IS NOT NULL
+        ORDER BY id
+    """)).fetchall()
+
+    moved = 0
+    for event_id, file_path, file_name in rows:
+        if not os.path.isfile(file_path):
+            print(f"  ⚠️ Reporting event {event_id}: {file_path} not found, skipped")
+            continue
+        name = file_name or os.path.basename(file_path)
+        blob_key = f"reporting_events/event_{event_id}/{os.path.basename(file_path)}"
+
+        if dry_run:
+            print(f"  would move reporting event {event_id} ({os.path.getsize(file_path)} bytes) -> {blob_key}")
+        else:
+            with open(file_path, "rb") as f:
+                info = blob_storage.put(blob_key, f.read(), mimetypes.guess_type(name)[0])
+            conn.execute(text("""
+                UPDATE reporting_events SET blob_key = :blob_key, uploaded_file_path = :blob_key WHERE id = :id
+            """), {"blob_key": info.key, "id": event_id})
+            conn.commit()
+        moved += 1
+
+    print(f"✅ Reporting events: {moved} files moved to {blob_storage.backend_name} storage")
+
+
+def migrate_blob_storage(batch_size, dry_run=False):
+    engine = create_engine(settings.DATABASE_URL)
+
+    with engine.connect() as conn:
+        add_blob_key_columns(conn)
+
+        print(f"Moving deliverable files to {blob_storage.backend_name} blob storage...")
+        migrate_deliverables(conn, batch_size, dry_run)
+
+        print("Moving reporting event files...")
+        migrate_reporting_events(conn, dry_run)
+
+    if dry_run:
+        print("\nDry run only - no files were moved")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move base64/local uploads into blob storage")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    migrate_blob_storage(args.batch_size, dry_run=args.dry_run)
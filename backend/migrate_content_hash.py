@@ -0,0 +1,131 @@
+# migrate_content_hash.py
+"""
+Add the upload dedupe columns to contracts and backfill content_sha256.
+
+- contracts.content_sha256 (indexed) and contracts.source_contract_id are
+  added if they are missing (the API also adds them on startup, see
+  app/database.py ADDED_COLUMNS)
+- existing contracts get content_sha256 from comprehensive_data.s3_pdf.sha256
+  when the upload recorded it, otherwise by streaming their PDF from S3
+  through SHA-256
+
+Only after the backfill do re-uploads of older contracts get deduplicated
+(app/contract_dedup.py). Safe to re-run: contracts that already have a hash
+are skipped.
+
+    python migrate_content_hash.py --dry-run
+    python migrate_content_hash.py --limit 500
+"""
+import sys
+import os
+import hashlib
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.config import settings
+from app.s3_service import s3_service
+
+
+def add_content_hash_columns(conn):
+    conn.execute(text("ALTER TABLE contracts ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64)"))
+    conn.execute(text(
+        "ALTER TABLE contracts ADD COLUMN IF NOT EXISTS source_contract_id INTEGER "
+        "REFERENCES contracts(id) ON DELETE SET NULL"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_contracts_content_sha256 ON contracts (content_sha256)"))
+    conn.commit()
+    print("✓ content_sha256 / source_contract_id columns present")
+
+
+def has_content_hash_column(conn):
+    return conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'contracts' AND column_name = 'content_sha256'
+    """)).first() is not None
+
+
+def s3_object_sha256(s3_key):
+    """SHA-256 of an S3 object, streamed in UPLOAD_SPOOL_CHUNK_BYTES chunks"""
+    body = s3_service.s3_client.get_object(Bucket=s3_service.bucket_name, Key=s3_key)["Body"]
+    digest = hashlib.sha256()
+    for chunk in body.iter_chunks(settings.UPLOAD_SPOOL_CHUNK_BYTES):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backfill_content_hashes(conn, dry_run=False, limit=None, column_exists=True):
+    # Dry run before the columns exist: every contract would need a hash
+    rows = conn.execute(text(f"""
+        SELECT id,
+               comprehensive_data->'s3_pdf'->>'sha256' AS recorded_sha256,
+               comprehensive_data->'s3_pdf'->>'key' AS s3_key
+        FROM contracts
+        {"WHERE content_sha256 IS NULL" if column_exists else ""}
+        ORDER BY id
+        LIMIT :limit
+    """), {"limit": limit}).fetchall()
+
+    recorded = 0
+    hashed = 0
+    missing = 0
+    for contract_id, recorded_sha256, s3_key in rows:
+        sha256 = recorded_sha256
+        if sha256:
+            recorded += 1
+        elif s3_key and s3_service.s3_client:
+            try:
+                sha256 = s3_object_sha256(s3_key)
+                hashed += 1
+            except Exception as e:
+                print(f"  ⚠️ Contract {contract_id}: could not read {s3_key}: {e}")
+        if not sha256:
+            missing += 1
+            continue
+
+        if dry_run:
+            print(f"  would set contract {contract_id} content_sha256 = {sha256}")
+            continue
+        conn.execute(
+            text("UPDATE contracts SET content_sha256 = :sha256 WHERE id = :id"),
+            {"sha256": sha256, "id": contract_id}
+        )
+        conn.commit()
+
+    print(f"✅ {recorded + hashed} contracts hashed ({recorded} from upload metadata, {hashed} read from S3, "
+          f"{missing} without a stored PDF)")
+
+    if not column_exists:
+        return
+    duplicates = conn.execute(text("""
+        SELECT COUNT(*) - COUNT(DISTINCT content_sha256) FROM contracts WHERE content_sha256 IS NOT NULL
+    """)).scalar()
+    print(f"✓ {duplicates} contracts share their PDF with an older contract")
+
+
+def migrate_content_hash(dry_run=False, limit=None):
+    if not s3_service.s3_client:
+        print("⚠️ S3 client not initialized - only hashes recorded at upload will be backfilled")
+
+    engine = create_engine(settings.DATABASE_URL)
+    with engine.connect() as conn:
+        if dry_run:
+            column_exists = has_content_hash_column(conn)
+            if not column_exists:
+                print("  would add content_sha256 / source_contract_id columns to contracts")
+        else:
+            add_content_hash_columns(conn)
+            column_exists = True
+        backfill_content_hashes(conn, dry_run=dry_run, limit=limit, column_exists=column_exists)
+
+    if dry_run:
+        print("\nDry run only - no columns or hashes were written")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add and backfill contracts.content_sha256 for upload dedupe")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--limit", type=int, default=None, help="Backfill at most this many contracts")
+    args = parser.parse_args()
+
+    migrate_content_hash(dry_run=args.dry_run, limit=args.limit)
@@ -0,0 +1,92 @@
+# migrate_contract_assignments.py
+"""
+Normalize contract assignment columns and index them for SQL-side filtering.
+
+Older rows stored assigned_pm_users / assigned_pgm_users / assigned_director_users
+as JSON strings ('[1, 2]'), comma-separated strings ('1,2'), bare numbers or arrays
+of numeric strings. The list endpoints now filter with JSONB containment (@>),
+which only matches integer arrays, so this rewrites every legacy value into a
+JSONB integer array and creates the GIN indexes the containment queries use.
+"""
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.config import settings
+
+ASSIGNMENT_COLUMNS = ["assigned_pm_users", "assigned_pgm_users", "assigned_director_users"]
+
+
+def normalize_user_ids(value):
+    """Parse a legacy assignment value into a sorted, de-duplicated list of ints"""
+    if value is None:
+        return []
+
+    if isinstance(value, str):
+        stripped = value.strip()
+        if not stripped:
+            return []
+        try:
+            value = json.loads(stripped)
+        except ValueError:
+            value = [part for part in stripped.split(',')]
+
+    if not isinstance(value, list):
+        value = [value]
+
+    ids = set()
+    for item in value:
+        try:
+            ids.add(int(str(item).strip()))
+        except (TypeError, ValueError):
+            continue
+    return sorted(ids)
+
+
+def migrate_contract_assignments():
+    engine = create_engine(settings.DATABASE_URL)
+
+    with engine.connect() as conn:
+        print("Normalizing contract assignment columns...")
+
+        for column in ASSIGNMENT_COLUMNS:
+            # Anything that is not already an array of JSON numbers needs rewriting
+            rows = conn.execute(text(f"""
+                SELECT id, {column}
+                FROM contracts
+                WHERE CASE
+                    WHEN {column} IS NULL THEN TRUE
+                    WHEN jsonb_typeof({column}) <> 'array' THEN TRUE
+                    ELSE EXISTS (
+                        SELECT 1 FROM jsonb_array_elements({column}) elem
+                        WHERE jsonb_typeof(elem) <> 'number'
+                    )
+                END
+            """)).fetchall()
+
+            for contract_id, value in rows:
+                normalized = normalize_user_ids(value)
+                conn.execute(
+                    text(f"UPDATE contracts SET {column} = CAST(:value AS JSONB) WHERE id = :id"),
+                    {"value": json.dumps(normalized), "id": contract_id}
+                )
+
+            conn.commit()
+            print(f"✓ {column}: normalized {len(rows)} rows")
+
+        print("Creating assignment indexes...")
+        for column in ASSIGNMENT_COLUMNS:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_contracts_{column} "
+                f"ON contracts USING gin ({column} jsonb_path_ops)"
+            ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_contracts_created_by ON contracts (created_by)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_contracts_status ON contracts (status)"))
+        conn.commit()
+        print("✓ Assignment indexes created")
+
+
+if __name__ == "__main__":
+    migrate_contract_assignments()
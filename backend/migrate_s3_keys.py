@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Move contract PDFs from the old flat key layout (contract_{id}_{filename} at
+the bucket root) to contracts/{id}/{filename}.
+
+Each object is copied server-side, the contract's comprehensive_data.s3_pdf.key
+is pointed at the new key (the old one is kept as legacy_key), and the old
+objects are then removed in batched deletes. Keys whose contract no longer
+exists are reported and left alone unless --delete-orphans is given. Safe to
+re-run: only keys still at the bucket root are touched.
+
+    python migrate_s3_keys.py --dry-run
+    python migrate_s3_keys.py --delete-orphans
+"""
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app import models
+from app.s3_service import s3_service, contract_prefix, LEGACY_CONTRACT_KEY, DELETE_BATCH_SIZE
+
+
+def migrate_s3_keys(dry_run=False, delete_orphans=False):
+    if not s3_service.s3_client:
+        print("❌ S3 client not initialized. Check AWS credentials.")
+        return
+
+    db = SessionLocal()
+    try:
+        contract_ids = {row[0] for row in db.query(models.Contract.id).all()}
+        moved = 0
+        orphans = []
+        failed = 0
+        pending_deletes = []
+
+        def flush_deletes():
+            if pending_deletes and not dry_run:
+                s3_service.delete_keys(pending_deletes)
+            pending_deletes.clear()
+
+        # "contract_" does not match the new "contracts/" prefix
+        for obj in s3_service.iter_objects("contract_"):
+            old_key = obj["Key"]
+            match = LEGACY_CONTRACT_KEY.match(old_key)
+            if not match:
+                continue
+            contract_id = int(match.group(1))
+            new_key = f"{contract_prefix(contract_id)}{match.group(2)}"
+
+            if contract_id not in contract_ids:
+                orphans.append(old_key)
+                continue
+
+            if dry_run:
+                print(f"  would move {old_key} -> {new_key}")
+                moved += 1
+                continue
+
+            try:
+                s3_service.copy_object(old_key, new_key)
+
+                contract = db.query(models.Contract).filter(models.Contract.id == contract_id).first()
+                s3_pdf = (contract.comprehensive_data or {}).get("s3_pdf") or {}
+                if s3_pdf.get("key") == old_key:
+                    comprehensive_data = dict(contract.comprehensive_data)
+                    comprehensive_data["s3_pdf"] = {**s3_pdf, "key": new_key, "legacy_key": old_key}
+                    contract.comprehensive_data = comprehensive_data
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"  ❌ {old_key}: {e}")
+                failed += 1
+                continue
+
+            # The old object is only removed once the contract points at the new one
+            pending_deletes.append(old_key)
+            moved += 1
+            print(f"  ✓ {old_key} -> {new_key}")
+            if len(pending_deletes) >= DELETE_BATCH_SIZE:
+                flush_deletes()
+
+        flush_deletes()
+
+        if orphans:
+            print(f"\n⚠️ {len(orphans)} keys belong to contracts that no longer exist:")
+            for key in orphans[:20]:
+                print(f"  {key}")
+            if delete_orphans and not dry_run:
+                deleted = s3_service.delete_keys(orphans)
+                print(f"🗑️ Deleted {deleted} orphaned keys")
+
+        action = "would move" if dry_run else "moved"
+        print(f"\n✅ {moved} objects {action} to contracts/{{id}}/ ({failed} failed, {len(orphans)} orphaned)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move contract PDFs to the contracts/{id}/ S3 key layout")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be moved")
+    parser.add_argument("--delete-orphans", action="store_true",
+                        help="Delete root keys whose contract no longer exists")
+    args = parser.parse_args()
+
+    migrate_s3_keys(dry_run=args.dry_run, delete_orphans=args.delete_orphans)